@@ -1,9 +1,19 @@
 import networkx as nx
-import itertools as it
 import matplotlib.pyplot as plt
 import os
 import math
-import multiprocessing
+from orderly import subgraph_store
+from hasse import class_index, make_down_sets, members
+from prefilter import MonomorphismFilter
+from complements import complement_map, save_complement_map, load_complement_map, monochromatic_star, load_floor
+from bitmatrix import DownSetMatrix, intersect_colorings, row_members, block_rows, full_row, is_fixed
+from workerpool import WorkerPool
+from graphcache import GraphCache
+import instrument
+import codec
+import numpy as np
+
+_contexts = dict()
 
 def _save_graph_list(GraphList, FileName = "Default", Names = None):
 #     This funciton takes the input of a list of graphs (GraphList), a name for the output file (FileName), and a list of names for the graphs
@@ -69,214 +79,146 @@ def _make_graph_directory(Graph_name):
     [os.mkdir(folder_name) for folder_name in folders_to_make if not os.path.exists(folder_name)]
     return
 
-def _find_in_poset(Target_graph6_string, Graph_name):
-    if Target_graph6_string in list(nx.read_gml(f"Graphs/{Graph_name}/{Graph_name}.Poset.gml").nodes()):
-        return Target_graph6_string
-    else:
-        looking_for = nx.from_graph6_bytes(Target_graph6_string)
-        for graph6_string in list(nx.read_gml(f"Graphs/{Graph_name}/{Graph_name}.Poset.gml").nodes()):
-            graph_in_poset = nx.from_graph6_bytes(bytes(graph6_string[2:len(graph6_string)-1], "utf-8").replace(b"\\\\",b"\\"))
-            if nx.is_isomorphic(looking_for, graph_in_poset):
-                return(graph6_string)
-    raise KeyError(f"No graph isomorphic to {Target_graph6_string} resides in the poset for {Graph_name}")
-
-def _subgraphs_of(Subgraph_name, Graph_name):
-    poset_graph = nx.read_gml(f"Graphs/{Graph_name}/{Graph_name}.Poset.gml")
-    return [source for source,target in poset_graph.edges() if target == Subgraph_name]
-
-
-def _Complement(Graph, Host):
-#     This function takes the input of a host graph (Host) and a set of edges contained in the host (Graph)
-    
-#     This returns the edge induced subgraph (as a networkx graph) built on the host graph, from the supplied edges
-    return Host.edge_subgraph(set(Host.edges())-set(Graph.edges())).copy()
-
-def _union(List1, List2):
-    return list(set(List1).union(set(List2)))
-
 def _intersection(List1, List2):
     return list(set(List1).intersection(set(List2)))
 
-def _subgraph_generator(Graph):
-    for num_edges in range(Graph.number_of_edges()+1):
-        for edges in it.combinations(Graph.edges(), num_edges):
-            yield Graph.edge_subgraph(edges)
-
-def _unique_subgraph_generator(Graph):
-    unique_subgraphs = []
-    for subgraph in _subgraph_generator(Graph):
-        for unique_subgraph in unique_subgraphs:
-            if nx.is_isomorphic(subgraph, unique_subgraph):
-                break
-        else:
-            unique_subgraphs.append(subgraph)
-            yield subgraph
-
-def _g6_filter(path):
-    unique_subgraphs = []
-    for subgraph in nx.read_graph6(path):
-        for unique_subgraph in unique_subgraphs:
-            if nx.is_isomorphic(subgraph, unique_subgraph):
-                break
-        else:
-            unique_subgraphs.append(subgraph)
-            yield subgraph
-
-def _poset_iterator(Graph_name):
-    poset_graph = nx.read_gml(f"Graphs/{Graph_name}/{Graph_name}.Poset.gml")
-    for graph6_string in poset_graph.nodes():
-        yield graph6_string
-
-def _split_work(Generator, ID, Num_workers):
-    for job_number,job in enumerate(Generator):
-        if (job_number % Num_workers) == ID:
-            yield job
-        else:
-            continue
-
-def _make_subgraphs(Graph_name):
-    _make_graph_directory(Graph_name)
-    num_workers = max(1, multiprocessing.cpu_count()-1)
-    workers = []
-    for id in range(num_workers):
-        job = multiprocessing.Process(target=_make_part_subgraphs, args=(Graph_name,id, num_workers))
-        job.start()
-        workers.append(job)
-    for worker in workers:
-        worker.join()
-    workers = []
-    for id in range(num_workers):
-        job = multiprocessing.Process(target=_filter_subgraphs, args=(Graph_name,id, num_workers))
-        job.start()
-        workers.append(job)
-    for worker in workers:
-        worker.join()
-    _finish_subgraphs(Graph_name)
+def _context(Graph_name, Key):
+#     Each process builds or loads these at most once per host: "graph" is the host, "store" its SubgraphStore (kept by _make_subgraphs), "complements" and "names" come from the complement map, "poset_matrix" is the down-set matrix and "floor" is its row that every coloring contains
+    context = _contexts.setdefault(Graph_name, dict())
+    if Key not in context:
+        if Key == "graph":
+            context[Key] = _get_graph_from_name(Graph_name)
+        elif Key == "store":
+            context[Key] = subgraph_store(_context(Graph_name, "graph"))
+        elif Key in ("complements", "names"):
+            context["complements"], context["names"] = load_complement_map(f"Graphs/{Graph_name}/{Graph_name}.Complements.json")
+        elif Key == "poset_matrix":
+            context[Key] = DownSetMatrix.load(f"Graphs/{Graph_name}/{Graph_name}.Poset.npy")
+        elif Key == "floor":
+            floor = load_floor(f"Graphs/{Graph_name}/{Graph_name}.Complements.json")
+            context[Key] = None if floor == None else np.array(_context(Graph_name, "poset_matrix").rows[floor])
+    return context[Key]
+
+def _init_worker(Graph_name):
+    _context(Graph_name, "graph")
     return
 
-def _make_part_subgraphs(Graph_name, ID, Num_workers):
-    graph = _get_graph_from_name(Graph_name)
-    with open(f"Graphs/{Graph_name}/Parts/Subgraphs/{Graph_name}.Subgraphs.Part.{ID}.g6", "wb") as output_file:
-        [output_file.write(nx.to_graph6_bytes(subgraph, header=False)) for subgraph in _split_work(_subgraph_generator(graph), ID, Num_workers)]
-    return
+def _worker_pool(Graph_name, Num_workers=None, Chunksize=64, Memory_budget=2**26):
+    return WorkerPool(Num_workers, Chunksize, _init_worker, (Graph_name,), Memory_budget)
 
-def _filter_subgraphs(Graph_name, ID, Num_workers):
-    with open(f"Graphs/{Graph_name}/Parts/UniqueSubgraphs/{Graph_name}.UniqueSubgraphs.Part.{ID}.g6", "wb") as output_file:
-        [output_file.write(nx.to_graph6_bytes(subgraph, header=False)) for subgraph in _g6_filter(f"Graphs/{Graph_name}/Parts/Subgraphs/{Graph_name}.Subgraphs.Part.{ID}.g6")]
-    return
-
-def _finish_subgraphs(Graph_name):
-    unique_subgraphs = []
-    for file in os.listdir(f"Graphs/{Graph_name}/Parts/UniqueSubgraphs"):
-        if file.endswith(".g6"):
-            for subgraph in nx.read_graph6(f"Graphs/{Graph_name}/Parts/UniqueSubgraphs/{file}"):
-                for unique_subgraph in unique_subgraphs:
-                    if nx.is_isomorphic(subgraph, unique_subgraph):
-                        break
-                else:
-                    unique_subgraphs.append(subgraph)
-    with open(f"Graphs/{Graph_name}/{Graph_name}.Unique.Subgraphs.g6", "wb") as output_file:
-        pass
-    with open(f"Graphs/{Graph_name}/{Graph_name}.Unique.Subgraphs.g6", "wb") as output_file:
-        [output_file.write(nx.to_graph6_bytes(subgraph, header=False)) for subgraph in unique_subgraphs]
+def _make_subgraphs(Graph_name, Pool=None):
+    _make_graph_directory(Graph_name)
+    if Pool == None:
+        with _worker_pool(Graph_name) as pool:
+            return _make_subgraphs(Graph_name, pool)
+#     The workers split each layer of the generation between them (see orderly.py), so each subgraph is made and checked once and there is nothing to filter afterwards
+#     The store is kept in this process's context, so _make_poset does not generate it again
+    with instrument.stage("subgraphs", host=Graph_name):
+        store = subgraph_store(_context(Graph_name, "graph"), pool=Pool)
+        _contexts[Graph_name]["store"] = store
+        codec.write_lines(f"Graphs/{Graph_name}/{Graph_name}.Unique.Subgraphs.g6", (codec.encode_rows(store.host_edges.rows(record.mask)) for record in store))
     return
 
-def _make_poset(Graph_name):
+def _make_poset(Graph_name, Pool=None):
     if not os.path.exists(f"Graphs/{Graph_name}/{Graph_name}.Unique.Subgraphs.g6"):
-        _make_subgraphs(Graph_name)
-    num_workers = max(1, multiprocessing.cpu_count()-1)
-    workers = []
-    for id in range(num_workers):
-        job = multiprocessing.Process(target=_make_part_poset, args=(Graph_name,id, num_workers))
-        job.start()
-        workers.append(job)
-    for worker in workers:
-        worker.join()
-    _finish_poset(Graph_name)
-    return
-
-def _make_part_poset(Graph_name, ID, Num_workers):
-    poset_graph = nx.empty_graph(create_using=nx.DiGraph)
-    for target in _split_work(nx.read_graph6(f"Graphs/{Graph_name}/{Graph_name}.Unique.Subgraphs.g6"), ID, Num_workers):
-        for source in nx.read_graph6(f"Graphs/{Graph_name}/{Graph_name}.Unique.Subgraphs.g6"):
-            if nx.algorithms.isomorphism.GraphMatcher(target, source).subgraph_is_monomorphic():
-                poset_graph.add_edge(f"{nx.to_graph6_bytes(source, header=False).strip()}", f"{nx.to_graph6_bytes(target, header=False).strip()}")
-    nx.write_gml(poset_graph, f"Graphs/{Graph_name}/Parts/Poset/Poset.Part.{ID}.gml")
-    return
-
-def _finish_poset(Graph_name):
-    poset_graph = nx.empty_graph(create_using=nx.DiGraph)
-    for file in os.listdir(f"Graphs/{Graph_name}/Parts/Poset/"):
-        if file.startswith("Poset.Part."):
-            poset_graph.add_edges_from(nx.read_gml(f"Graphs/{Graph_name}/Parts/Poset/{file}").edges())
-    nx.write_gml(poset_graph, f"Graphs/{Graph_name}/{Graph_name}.Poset.gml")
+        _make_subgraphs(Graph_name, Pool)
+    with instrument.stage("poset", host=Graph_name):
+        store = _context(Graph_name, "store")
+        index = class_index(store)
+        down_set = make_down_sets(store)
+        names = [None]*len(store)
+        for subgraph in codec.read_lines(f"Graphs/{Graph_name}/{Graph_name}.Unique.Subgraphs.g6"):
+            names[index.lookup_rows(codec.decode_rows(subgraph))] = f"{subgraph}"
+        DownSetMatrix.from_down_sets(down_set).save(f"Graphs/{Graph_name}/{Graph_name}.Poset.npy")
+        poset_graph = nx.empty_graph(create_using=nx.DiGraph)
+        for target_id,target_name in enumerate(names):
+            for source_id in members(down_set[target_id]):
+                poset_graph.add_edge(names[source_id], target_name)
+        nx.write_gml(poset_graph, f"Graphs/{Graph_name}/{Graph_name}.Poset.gml")
+        save_complement_map(f"Graphs/{Graph_name}/{Graph_name}.Complements.json", complement_map(store, index), names, monochromatic_star(store, index))
     return
 
-def make_down_arrow_set(Graph_name):
+def make_down_arrow_set(Graph_name, Num_workers=None, Chunksize=64, Memory_budget=2**26, Ideals=True, Cache_path=None):
+#     One pool of workers is used for the whole run, Num_workers defaults to one less than the number of CPUs and Chunksize is the number of red nodes per task
+#     Memory_budget is how many bytes of coloring rows a worker holds at once, and Ideals=False stops after the down-arrow set (benchmark.py times the ideals on their own)
+#     Cache_path is the cache of monomorphism answers the ideals are checked against (see graphcache.py), and None leaves it out
     graph = _get_graph_from_name(Graph_name)
     if graph.size() < 1:
         return
-    if not os.path.exists(f"Graphs/{Graph_name}/{Graph_name}.Poset.gml"):
-        _make_poset(Graph_name)
-    if os.path.exists(f"Graphs/{Graph_name}/{Graph_name}.DownArrowIdeals.png"):
-        retun
-    num_workers = max(1, multiprocessing.cpu_count()-1)
-    workers = []
-    for id in range(num_workers):
-        job = multiprocessing.Process(target=_make_part_down_arrow_set, args=(Graph_name,id, num_workers))
-        job.start()
-        workers.append(job)
-    for worker in workers:
-        worker.join()
-    _finish_down_arrow_set(Graph_name)
+    with _worker_pool(Graph_name, Num_workers, Chunksize, Memory_budget) as pool:
+        if not os.path.exists(f"Graphs/{Graph_name}/{Graph_name}.Poset.gml") or not os.path.exists(f"Graphs/{Graph_name}/{Graph_name}.Poset.npy"):
+            _make_poset(Graph_name, pool)
+        if os.path.exists(f"Graphs/{Graph_name}/{Graph_name}.DownArrowIdeals.png"):
+            return
+        with instrument.stage("intersection", host=Graph_name):
+            number_of_classes = len(_context(Graph_name, "names"))
+            tasks = [(Graph_name, id, red_class_ids, block_rows(pool.memory_budget, number_of_classes)) for id,red_class_ids in enumerate(pool.chunks(range(number_of_classes)))]
+#     The tasks go out a wave at a time, and once the parts so far are down to the floor the rest cannot change the answer
+            running_intersection = full_row(number_of_classes).copy()
+            waves = pool.chunks(tasks, pool.num_workers)
+            for wave in instrument.progress(waves, len(waves)):
+                for part in pool.map(_make_part_down_arrow_set_task, wave):
+                    if part is not None:
+                        running_intersection &= part
+                if is_fixed(running_intersection, _context(Graph_name, "floor")):
+                    break
+            _finish_down_arrow_set(Graph_name)
+    if Ideals:
+        _make_ideals(Graph_name, Cache_path=Cache_path)
     return
 
-def _make_part_down_arrow_set(Graph_name, ID, Num_workers):
-    down_arrow_set = None
-    for red_subgraph_graph6_string in _split_work(_poset_iterator(Graph_name), ID, Num_workers):
-        red_subgraph = nx.from_graph6_bytes(bytes(red_subgraph_graph6_string[2:len(red_subgraph_graph6_string)-1], "utf-8").replace(b"\\\\",b"\\"))
-        blue_subgraph = _Complement(red_subgraph, _get_graph_from_name(Graph_name))
-        blue_subgraph_graph6_string = _find_in_poset(nx.to_graph6_bytes(blue_subgraph, header=False).strip(), Graph_name)
-        red_subgraphs = _subgraphs_of(red_subgraph_graph6_string, Graph_name)
-        blue_subgraphs = _subgraphs_of(blue_subgraph_graph6_string, Graph_name)
-        coloring_union = _union(red_subgraphs, blue_subgraphs)
-        if down_arrow_set == None:
-            down_arrow_set = coloring_union
-        else:
-            down_arrow_set = _intersection(down_arrow_set, coloring_union)
-    if not down_arrow_set == None:
-        down_arrow_set = [nx.from_graph6_bytes(bytes(subgraph_graph6_string[2:len(subgraph_graph6_string)-1], "utf-8").replace(b"\\\\",b"\\")) for subgraph_graph6_string in down_arrow_set]
-        with open(f"Graphs/{Graph_name}/Parts/DownArrowSet/{Graph_name}.Down.Arrow.Set.Part.{ID}.g6", "wb") as output_file:
-            [output_file.write(nx.to_graph6_bytes(subgraph, header=False)) for subgraph in down_arrow_set]
-    return
+def _make_part_down_arrow_set_task(Arguments):
+    return _make_part_down_arrow_set(*Arguments)
+
+def _make_part_down_arrow_set(Graph_name, ID, Red_class_ids, Block_size=4096):
+#     The complements were worked out once when the poset was made, so each red node just looks its blue nodes up
+    complements = _context(Graph_name, "complements")
+    names = _context(Graph_name, "names")
+#     Each coloring is the OR of two rows of the down-set matrix and the part is the AND of those, smallest union first and stopping once it is down to the floor, see bitmatrix.py
+    poset_matrix = _context(Graph_name, "poset_matrix")
+#     (blue, red) is the same coloring as (red, blue), so only the one with the smaller red class ID is used
+    colorings = [(red_class_id, blue_class_id) for red_class_id in Red_class_ids for blue_class_id in complements[red_class_id] if red_class_id <= blue_class_id]
+    instrument.count("colorings", len(colorings))
+    if colorings:
+        part = intersect_colorings(poset_matrix, colorings, Block_size, _context(Graph_name, "floor"))
+        codec.write_lines(f"Graphs/{Graph_name}/Parts/DownArrowSet/{Graph_name}.Down.Arrow.Set.Part.{ID}.g6", [codec.unescape_name(names[class_id]) for class_id in row_members(part)])
+        return part
 
 def _finish_down_arrow_set(Graph_name):
     down_arrow_set = None
     for file_name in os.listdir(f"Graphs/{Graph_name}/Parts/DownArrowSet"):
         if file_name.startswith(f"{Graph_name}.Down.Arrow.Set.Part."):
             if down_arrow_set == None:
-                down_arrow_set = [nx.to_graph6_bytes(graph, header=False).strip() for graph in nx.read_graph6(f"Graphs/{Graph_name}/Parts/DownArrowSet/{file_name}")]
+                down_arrow_set = codec.read_lines(f"Graphs/{Graph_name}/Parts/DownArrowSet/{file_name}")
             else:
-                down_arrow_set = _intersection(down_arrow_set, [nx.to_graph6_bytes(graph, header=False).strip() for graph in nx.read_graph6(f"Graphs/{Graph_name}/Parts/DownArrowSet/{file_name}")])
+                down_arrow_set = _intersection(down_arrow_set, codec.read_lines(f"Graphs/{Graph_name}/Parts/DownArrowSet/{file_name}"))
     if not down_arrow_set == None:
-        down_arrow_set = [nx.from_graph6_bytes(subgraph_graph6_string) for subgraph_graph6_string in down_arrow_set]
-        with open(f"Graphs/{Graph_name}/{Graph_name}.Down.Arrow.Set.g6", "wb") as output_file:
-            [output_file.write(nx.to_graph6_bytes(subgraph, header=False)) for subgraph in down_arrow_set]
-    _make_ideals(Graph_name)
+        codec.write_lines(f"Graphs/{Graph_name}/{Graph_name}.Down.Arrow.Set.g6", down_arrow_set)
+    return
+
+def _make_ideals(Graph_name, Draw=True, Cache_path=None):
+    with instrument.stage("ideals", host=Graph_name):
+        _make_ideals_helper(Graph_name, Draw, Cache_path)
     return
 
-def _make_ideals(Graph_name):
+def _make_ideals_helper(Graph_name, Draw=True, Cache_path=None):
+#     Draw=False leaves out the picture of the ideals (benchmark.py times the ideals without matplotlib), and Cache_path=None checks them without a cache
     poset_graph = nx.empty_graph(create_using=nx.DiGraph)
+    monomorphism_filter = MonomorphismFilter(None if Cache_path == None else GraphCache(Cache_path))
     down_arrow_set = list(nx.read_graph6(f"Graphs/{Graph_name}/{Graph_name}.Down.Arrow.Set.g6"))
     for source_id,source in enumerate(down_arrow_set):
         for target_id,target in enumerate(down_arrow_set):
             if source_id == target_id:
                 continue
             else:
-                if nx.algorithms.isomorphism.GraphMatcher(target, source).subgraph_is_monomorphic():
+                if monomorphism_filter.is_monomorphic(target, source, target_id, source_id):
                     poset_graph.add_edge(source_id,target_id)
+    if monomorphism_filter.cache != None:
+        monomorphism_filter.cache.close()
+    instrument.message(f"Making the ideals of {Graph_name}: {monomorphism_filter.summary()}", **monomorphism_filter.counters())
     maximal_ideals = [down_arrow_set[maximal_node] for maximal_node in poset_graph.nodes if poset_graph.out_degree(maximal_node) == 0]
     with open(f"Graphs/{Graph_name}/{Graph_name}.Down.Arrow.Ideals.g6", "wb") as output_file:
         [output_file.write(nx.to_graph6_bytes(ideal, header=False)) for ideal in maximal_ideals]
-    _save_graph_list(maximal_ideals, f"Graphs/{Graph_name}/{Graph_name}.Down.Arrow.Ideals")
+    if Draw:
+        _save_graph_list(maximal_ideals, f"Graphs/{Graph_name}/{Graph_name}.Down.Arrow.Ideals")
     return
\ No newline at end of file
@@ -1,12 +1,21 @@
 import networkx as nx
 import matplotlib.pyplot as plt
 import itertools as it
-import psutil
-import sys
-import multiprocessing
 import os
-import tempfile
 import math
+from orderly import subgraph_store
+from hasse import class_index, hasse_diagram, down_sets, members, verify_down_sets
+from complements import complement_map, save_complement_map, load_complement_map, monochromatic_star, load_floor
+import packedstore
+from packedstore import PackedStore, PackedStoreWriter
+from bitmatrix import DownSetMatrix, full_row, intersect_rows, row_members, block_rows, coloring_blocks, smallest_first, sized_colorings, save_colorings, load_colorings, merge_colorings, coloring_rows
+from workerpool import WorkerPool
+from graphcache import GraphCache
+import instrument
+import codec
+import json
+from anytime import Anytime
+import numpy as np
 
 def bfTree():
     return nx.parse_adjlist(['1 2 3 4', '2 5 6', '3 7 8', '4 9 10'])
@@ -17,25 +26,49 @@ def ZimGraph():
 def Barbell():
     return nx.parse_adjlist(['0 1 2', '1 2', '2 3', '3 4 5', '4 5'])
 
-def _allocate_work(iterator, worker_id, num_workers):
-    for job_number,job in enumerate(iterator):
-        if (job_number % num_workers) == worker_id:
-            yield job
-        else:
-            continue
-
-def _send_workers(target_function, argument):
-    # num_workers = 1
-    num_workers = max(1, multiprocessing.cpu_count()-1)
-    workers = []
-    for worker_id in range(num_workers):
-        job = multiprocessing.Process(target=target_function, args=(argument, worker_id, num_workers))
-        job.start()
-        workers.append(job)
-    for worker in workers:
-        worker.join()
+_contexts = dict()
+
+def _context(graph_name, key):
+    """
+        Per-process cache of what the stages need to know about a host, so each piece is built or loaded at most once in each process (workers included, see _init_worker).
+        "graph" is the host, "store" its SubgraphStore, "index" the canonical index over the store, "complements" the complement map, "poset" the down-set matrix and "floor" the row that every coloring contains (see complements.monochromatic_star).
+        Only one host is kept: a pool shared by a sweep (see sweep.py) goes through the hosts one after another, so the first request for a new host drops the last one.
+    """
+    if graph_name not in _contexts:
+        _contexts.clear()
+    context = _contexts.setdefault(graph_name, dict())
+    if key not in context:
+        if key == "graph":
+            context[key] = _get_graph_from_name(graph_name)
+        elif key == "store":
+            context[key] = subgraph_store(_context(graph_name, "graph"))
+        elif key == "index":
+            context[key] = class_index(_context(graph_name, "store"))
+        elif key == "complements":
+            context[key] = load_complement_map(f"Graphs/{graph_name}/Complements.json")[0]
+        elif key == "poset":
+            context[key] = DownSetMatrix.load(f"Graphs/{graph_name}/Poset.npy")
+        elif key == "floor":
+            floor = load_floor(f"Graphs/{graph_name}/Complements.json")
+            context[key] = None if floor == None else np.array(_context(graph_name, "poset").rows[floor])
+    return context[key]
+
+def _init_worker(graph_name):
+    _context(graph_name, "graph")
     return
 
+def _worker_pool(graph_name, num_workers=None, chunksize=64, memory_budget=2**26):
+    return WorkerPool(num_workers, chunksize, _init_worker, (graph_name,), memory_budget)
+
+def _in_pool(function, graph_name, pool):
+    """
+        Runs function(graph_name, pool), in a pool of its own if it was not handed one.
+    """
+    if pool != None:
+        return function(graph_name, pool)
+    with _worker_pool(graph_name) as pool:
+        return function(graph_name, pool)
+
 def _read_graph6(path):
     for graph in nx.read_graph6(path):
         if type(graph) == type(nx.empty_graph()):
@@ -76,10 +109,38 @@ def _get_graph_from_name(graph_name):
             return nx.path_graph(n)
 
 def _make_graph_directory(graph_name):
-    folders_to_make = ["Graphs", f"Graphs/{graph_name}", f"Graphs/{graph_name}/Subgraphs", f"Graphs/{graph_name}/Poset", f"Graphs/{graph_name}/Down-Arrow Ramsey Set", f"Graphs/{graph_name}/Red-Blue Colorings"]
+    folders_to_make = ["Graphs", f"Graphs/{graph_name}", f"Graphs/{graph_name}/Parts"]
     [os.mkdir(folder_name) for folder_name in folders_to_make if not os.path.exists(folder_name)]
     return
 
+def _store_path(graph_name, stage):
+    """
+        Each stage ("Subgraphs", "Poset") keeps all of its graphs in one packed store (see packedstore.py) instead of one file per graph.
+        Subgraphs and Poset records are indexed by class ID and each Poset record is the graph6 lines of that class's down-set.
+        The poset is also kept as a bit matrix in "Poset.npy" (see bitmatrix.py), and the colorings are "Red-Blue Colorings.npy", one (size of the union, red, blue) row of class IDs each, since the union itself is two rows of Poset.npy.
+    """
+    return f"Graphs/{graph_name}/{stage}"
+
+def _part_path(graph_name, stage, worker_id):
+    return f"Graphs/{graph_name}/Parts/{stage}.Part.{worker_id}"
+
+def _merge_parts(graph_name, stage, interleave=False, key=None):
+    worker_ids = sorted(int(file_name.split(".Part.")[1].split(".")[0]) for file_name in os.listdir(f"Graphs/{graph_name}/Parts") if file_name.startswith(f"{stage}.Part.") and file_name.endswith(".index"))
+    packedstore.merge([_part_path(graph_name, stage, worker_id) for worker_id in worker_ids], _store_path(graph_name, stage), interleave, key)
+    return
+
+def _stage_done(graph_name, stage):
+    return packedstore.exists(_store_path(graph_name, stage))
+
+def _colorings_path(graph_name):
+    return f"{_store_path(graph_name, 'Red-Blue Colorings')}.npy"
+
+def _colorings_part_path(graph_name, job_id):
+    return f"{_part_path(graph_name, 'Red-Blue Colorings', job_id)}.npy"
+
+def _colorings_done(graph_name):
+    return os.path.exists(_colorings_path(graph_name))
+
 def _draw_graph(graph_iter, path=None):
     figure,axes = plt.subplots(figsize=(25,25), dpi=250)
     graph=next(graph_iter)
@@ -128,7 +189,7 @@ def _file_name_to_graph6_bytes(file_name):
         Next, windows cannot have files with the same letters, but different cases, in the same directory (i.e. "Bw.g6" and "BW.g6") but this CAN happen for non-isomorphic graphs. So we choose to make everything lowercase.
         If an upper-case letter is replaced with a lower-case by this function, it will append a "+" symbol in front so it can be decoded later.
     """
-    return bytes(file_name.split(".g6")[0].replace("1","?").replace("2",chr(92)).replace("3","|").replace('+a','A').replace('+b','B').replace('+c','C').replace('+d','D').replace('+e','E').replace('+f','F').replace('+g','G').replace('+h','H').replace('+i','I').replace('+j','J').replace('+k','K').replace('+l','L').replace('+m','M').replace('+n','N').replace('+o','O').replace('+p','P').replace('+q','Q').replace('+r','R').replace('+s','S').replace('+t','T').replace('+u','U').replace('+v','V').replace('+w','W').replace('+x','X').replace('+y','Y').replace('+z','Z'), "utf-8")
+    return codec.from_file_name(file_name)
 
 def _graph6_bytes_to_file_name(graph6_bytes):
     """
@@ -137,166 +198,285 @@ def _graph6_bytes_to_file_name(graph6_bytes):
         Next, windows cannot have files with the same letters, but different cases, in the same directory (i.e. "Bw.g6" and "BW.g6") but this CAN happen for non-isomorphic graphs. So we choose to make everything lowercase.
         If an upper-case letter is replaced with a lower-case by this function, it will append a "+" symbol in front so it can be decoded later.
     """
-    return graph6_bytes.decode().strip().replace("?","1").replace(chr(92),"2").replace("|","3").replace('A','+a').replace('B','+b').replace('C','+c').replace('D','+d').replace('E','+e').replace('F','+f').replace('G','+g').replace('H','+h').replace('I','+i').replace('J','+j').replace('K','+k').replace('L','+l').replace('M','+m').replace('N','+n').replace('O','+o').replace('P','+p').replace('Q','+q').replace('R','+r').replace('S','+s').replace('T','+t').replace('U','+u').replace('V','+v').replace('W','+w').replace('X','+x').replace('Y','+y').replace('Z','+z')+".g6"
+    return codec.to_file_name(graph6_bytes)
 
-def _non_isomorphic_edge_induced_subgraph_generator(graph):
-    for subset_size in range(graph.number_of_edges()+1):
-        for subset in it.combinations(graph.edges(),subset_size):
-            yield graph.edge_subgraph(subset)
-            
-def _distinct_edge_induced_subgraph_generator(graph):
-    with tempfile.TemporaryFile() as tmp:
-        for edge_induced_subgraph in _non_isomorphic_edge_induced_subgraph_generator(graph):
-            tmp.seek(0)
-            for distinct_edge_induced_subgraph in _read_graph6(tmp):
-                if nx.is_isomorphic(edge_induced_subgraph,distinct_edge_induced_subgraph):
-                    break
-            else:
-                tmp.write(nx.to_graph6_bytes(edge_induced_subgraph, header=False))
-                yield edge_induced_subgraph
-
-def _graph_iter_union_generator(graph_iter_1, graph_iter_2):
-    for item in graph_iter_1:
-        yield item
-    for item in graph_iter_2:
-        yield item
-
-def _graph_complement(subgraph, host_graph_name):
-    host_graph = _get_graph_from_name(host_graph_name)
-    """
-        This function should be much simpler, but there are some issues with the way that complete bipartite graphs were working that prevented simplicity.
-        If a human were doing complementation inside of a host graph (by which I mean automatically ignoring isolated vertices), we would find a copy of the original graph in the host graph, and just remove those edges.
-        Well, this is what the algorithm has to do as well, so we have to invoke SOMETHING NOT IN THE DOCUMENTATION BUT ONLY IN THE SOURCE OF NETWORKX.... subgraph_monomorphisms_iter() to find an edge-induced subgraph.
-        Once we find this edge-induced subgraph, we need to relabel our nodes on the input subgraph to match that matching, so that we can properly remove the edges.
-        I caught this annoying bug when trying to remove an edge from K_2,2.....
-    """
-    mapping = dict()
-    for key,value in next(nx.algorithms.isomorphism.GraphMatcher(host_graph,subgraph).subgraph_monomorphisms_iter()).items():
-        mapping[value]=key
-    subgraph = nx.relabel_nodes(subgraph,mapping,copy=True)
-    blue_subgraph = host_graph.edge_subgraph(set(host_graph.edges())-set(subgraph.edges()))
-    for subgraph_file_name in os.scandir(f"Graphs/{host_graph_name}/Subgraphs"):
-        if nx.is_isomorphic(blue_subgraph, nx.from_graph6_bytes(_file_name_to_graph6_bytes(subgraph_file_name.name))):
-            return nx.from_graph6_bytes(_file_name_to_graph6_bytes(subgraph_file_name.name))
-    raise KeyError(f"Re-check when the red subgraph is {nx.to_graph6_bytes(subgraph,header=False)} and the blue subgraph is {nx.to_graph6_bytes(blue_subgraph,header=False)}")
-                
-def _make_edge_induced_subgraphs(graph_name):
+def _make_edge_induced_subgraphs(graph_name, pool=None):
     _make_graph_directory(graph_name)
-    graph = _get_graph_from_name(graph_name)
-    if os.path.exists(f"Graphs/{graph_name}/Subgraphs/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        print(f"The unique edge-induced subgraphs of {graph_name} have already been made")
+    if _stage_done(graph_name, "Subgraphs"):
+        instrument.message(f"The unique edge-induced subgraphs of {graph_name} have already been made")
     else:
-        print(f"Making the unique edge-induced subgraphs of {graph_name}")
-        _send_workers(_make_edge_induced_subgraphs_helper, graph_name)
+        with instrument.stage("subgraphs", host=graph_name):
+            instrument.message(f"Making the unique edge-induced subgraphs of {graph_name}")
+            _in_pool(_make_edge_induced_subgraphs_helper, graph_name, pool)
     return
 
-def _make_edge_induced_subgraphs_helper(graph_name, worker_id, num_workers):
-    graph = _get_graph_from_name(graph_name)
-    for edge_induced_subgraph in _allocate_work(_distinct_edge_induced_subgraph_generator(graph), worker_id, num_workers):
-        with open(f"Graphs/{graph_name}/Subgraphs/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(edge_induced_subgraph,header=False))}", "wb") as output_file:
-            output_file.write(nx.to_graph6_bytes(edge_induced_subgraph,header=False))
+def _make_edge_induced_subgraphs_helper(graph_name, pool):
+    """
+        The workers split each layer of the orderly generation between them (see orderly.edge_subset_orbits), so every candidate is labelled by exactly one process, and the classes come back here in class ID order.
+        The store is kept in this process's context, so the poset and complement stages do not generate it again.
+    """
+    store = subgraph_store(_context(graph_name, "graph"), pool=pool)
+    _contexts[graph_name]["store"] = store
+    with PackedStoreWriter(_store_path(graph_name, "Subgraphs")) as output_store:
+        for record in store:
+            output_store.append(codec.encode_rows(store.host_edges.rows(record.mask))+b"\n")
     return
 
-def _make_poset(graph_name):
+def _make_poset(graph_name, verify=False, pool=None, cache=None):
     _make_graph_directory(graph_name)
-    graph = _get_graph_from_name(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Subgraphs/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_edge_induced_subgraphs(graph_name)
-    if os.path.exists(f"Graphs/{graph_name}/Poset/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        print(f"The poset of {graph_name} have already been made")
+    if not _stage_done(graph_name, "Subgraphs"):
+        _make_edge_induced_subgraphs(graph_name, pool)
+    if _stage_done(graph_name, "Poset"):
+        instrument.message(f"The poset of {graph_name} have already been made")
     else:
-        print(f"Making the poset of {graph_name}")
-        _send_workers(_make_poset_helper, graph_name)
+        with instrument.stage("poset", host=graph_name):
+            instrument.message(f"Making the poset of {graph_name}")
+            _make_poset_helper(graph_name, verify, cache)
     return
 
-def _make_poset_helper(graph_name, worker_id, num_workers):
-    for host_graph_file_name in _allocate_work(os.scandir(f"Graphs/{graph_name}/Subgraphs/"), worker_id, num_workers):
-        with open(f"Graphs/{graph_name}/Poset/{host_graph_file_name.name}", "wb") as output_file:
-            host_graph = nx.from_graph6_bytes(_file_name_to_graph6_bytes(host_graph_file_name.name))
-            for potential_subgraph_file_name in os.scandir(f"Graphs/{graph_name}/Subgraphs/"):
-                potential_subgraph = nx.from_graph6_bytes(_file_name_to_graph6_bytes(potential_subgraph_file_name.name))
-                if nx.algorithms.isomorphism.GraphMatcher(host_graph, potential_subgraph).subgraph_is_monomorphic():
-                    output_file.write(nx.to_graph6_bytes(potential_subgraph, header=False))
+def _class_records(store, graph_name, index=None):
+    """
+        The record ID in the Subgraphs store of every class of store, found by canonical lookup so it does not matter what order the records were written in.
+    """
+    if index == None:
+        index = class_index(store)
+    record_ids = [None]*len(store)
+    with PackedStore(_store_path(graph_name, "Subgraphs")) as subgraphs:
+        for record_id,record in enumerate(subgraphs):
+            record_ids[index.lookup_rows(codec.decode_rows(record))] = record_id
+    return record_ids
+
+def _make_poset_helper(graph_name, verify=False, cache=None):
+    """
+        The down-sets come from the Hasse diagram (hasse.py), so there is one canonical lookup per (class, edge) instead of a monomorphism test per pair of classes.
+        verify=True still runs the all-pairs monomorphism check on top of it, which is only worth doing on small hosts.
+        With a graphcache.GraphCache, the covers of classes that earlier hosts had come from it (see hasse.hasse_diagram) and the new ones go into it, and the verification checks it before calling the matcher.
+    """
+    store = _context(graph_name, "store")
+    covers = hasse_diagram(store, _context(graph_name, "index"), cache)
+    down_set = down_sets(covers, store.edge_counts)
+    if verify:
+        verify_down_sets(store, down_set, cache)
+    record_ids = _class_records(store, graph_name, _context(graph_name, "index"))
+    class_ids = [None]*len(store)
+    for class_id,record_id in enumerate(record_ids):
+        class_ids[record_id] = class_id
+    DownSetMatrix.from_down_sets([sum(1 << record_ids[member] for member in members(down_set[class_ids[record_id]])) for record_id in range(len(store))]).save(f"Graphs/{graph_name}/Poset.npy")
+    with PackedStore(_store_path(graph_name, "Subgraphs")) as subgraphs, PackedStoreWriter(_store_path(graph_name, "Poset")) as output_store:
+        for record_id in range(len(subgraphs)):
+            output_store.append(b"".join(subgraphs[record_ids[member]] for member in members(down_set[class_ids[record_id]])))
     return
 
-def _make_colorings(graph_name):
+def _make_colorings(graph_name, pool=None):
     _make_graph_directory(graph_name)
-    graph = _get_graph_from_name(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Subgraphs/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_edge_induced_subgraphs(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Poset/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_poset(graph_name)
-    if os.path.exists(f"Graphs/{graph_name}/Red-Blue Colorings/Part.1.g6"):
-        print(f"The unioning each of the red and blue subgraphs of {graph_name} already exists")
+    if not _stage_done(graph_name, "Subgraphs"):
+        _make_edge_induced_subgraphs(graph_name, pool)
+    if not _stage_done(graph_name, "Poset"):
+        _make_poset(graph_name, pool=pool)
+    _make_complements(graph_name)
+    if _colorings_done(graph_name):
+        instrument.message(f"The unioning each of the red and blue subgraphs of {graph_name} already exists")
     else:
-        print(f"Unioning each of the red and blue subgraphs of {graph_name}")
-        _send_workers(_make_colorings_helper, graph_name)
+        with instrument.stage("colorings", host=graph_name):
+            instrument.message(f"Unioning each of the red and blue subgraphs of {graph_name}")
+            _in_pool(_make_colorings_helper, graph_name, pool)
+            _merge_colorings_parts(graph_name)
     return
 
-def _make_colorings_helper(graph_name, worker_id, num_workers):
-    for red_subgraph_file_name in _allocate_work(os.scandir(f"Graphs/{graph_name}/Subgraphs/"), worker_id, num_workers):
-        red_subgraph = nx.from_graph6_bytes(_file_name_to_graph6_bytes(red_subgraph_file_name.name))
-        try:
-            blue_subgraph = _graph_complement(red_subgraph,graph_name)
-        except KeyError:
-            with open(f"Graphs/{graph_name}/Logs.txt", "a") as output_file:
-                output_file.write(f"Re-check when the red subgraph is {_file_name_to_graph6_bytes(red_subgraph_file_name.name).strip()}\n")
-            continue
-        red_blue_union = _graph_iter_union_generator(_read_graph6(f"Graphs/{graph_name}/Poset/{red_subgraph_file_name.name}"),_read_graph6(f"Graphs/{graph_name}/Poset/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(blue_subgraph,header=False))}"))
-        with open(f"Graphs/{graph_name}/Red-Blue colorings/{red_subgraph_file_name.name}", "wb") as output_file:
-            for graph in red_blue_union:
-                output_file.write(nx.to_graph6_bytes(graph,header=False))
-
-def _intersect_colorings(graph_name):
+def _make_complements(graph_name):
+    if not os.path.exists(f"Graphs/{graph_name}/Complements.json"):
+        with instrument.stage("complements", host=graph_name):
+            instrument.message(f"Making the complement map of {graph_name}")
+            _make_complement_map(graph_name)
+    return
+
+def _make_complement_map(graph_name):
+    """
+        Complements.json has, for every red class ID (record ID in the Subgraphs store), the blue class IDs that it can leave behind in the host.
+        It is made once, so the coloring stage below never has to test anything for isomorphism.
+    """
+    store = _context(graph_name, "store")
+    index = _context(graph_name, "index")
+    record_ids = _class_records(store, graph_name, index)
+    complements = [None]*len(store)
+    for class_id,blue_class_ids in enumerate(complement_map(store, index)):
+        complements[record_ids[class_id]] = sorted(record_ids[blue_class_id] for blue_class_id in blue_class_ids)
+    save_complement_map(f"Graphs/{graph_name}/Complements.json", complements, floor=record_ids[monochromatic_star(store, index)])
+    return
+
+def _merge_colorings_parts(graph_name):
+    part_paths = [f"Graphs/{graph_name}/Parts/{file_name}" for file_name in sorted(os.listdir(f"Graphs/{graph_name}/Parts")) if file_name.startswith("Red-Blue Colorings.Part.") and file_name.endswith(".npy")]
+    merge_colorings(part_paths, _colorings_path(graph_name))
+    return
+
+def _make_colorings_helper(graph_name, pool):
+    """
+        Each task is a run of chunksize red class IDs and writes its own part, sorted by the size of the union.
+        The parts are merged by size, so the Red-Blue Colorings are smallest first, and (blue, red) is left out when (red, blue) is already there.
+    """
+    tasks = [(graph_name, job_id, red_class_ids) for job_id,red_class_ids in enumerate(pool.chunks(range(len(_context(graph_name, "complements")))))]
+    for job_id in instrument.progress(pool.imap(_make_colorings_task, tasks), len(tasks)):
+        continue
+    return
+
+def _make_colorings_task(arguments):
+    graph_name, job_id, red_class_ids = arguments
+    complements = _context(graph_name, "complements")
+    poset = _context(graph_name, "poset")
+    pairs = [(red_class_id, blue_class_id) for red_class_id in red_class_ids for blue_class_id in complements[red_class_id] if red_class_id <= blue_class_id]
+    instrument.count("colorings", len(pairs))
+    save_colorings(_colorings_part_path(graph_name, job_id), sized_colorings(poset, pairs))
+    return job_id
+
+def _intersect_colorings(graph_name, pool=None, budget=None):
     _make_graph_directory(graph_name)
-    graph = _get_graph_from_name(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Subgraphs/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_edge_induced_subgraphs(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Poset/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_poset(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Red-Blue Colorings/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_colorings(graph_name)
+    if not _stage_done(graph_name, "Subgraphs"):
+        _make_edge_induced_subgraphs(graph_name, pool)
+    if not _stage_done(graph_name, "Poset"):
+        _make_poset(graph_name, pool=pool)
+    if not _colorings_done(graph_name):
+        _make_colorings(graph_name, pool)
     if os.path.exists(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set.g6"):
-        print(f"The colorings of {graph_name} have already been processed")
+        instrument.message(f"The colorings of {graph_name} have already been processed")
     else:
-        print(f"Processing the colorings of {graph_name} to generate the down-arrow Ramsey set")
-        _send_workers(_intersect_colorings_helper, graph_name)
-        print(f"Parsing the work done by the different workers on the down-arrow Ramsey set")
-        down_arrow_ramsey_set = None
-        for file_name in os.scandir(f"Graphs/{graph_name}/Down-Arrow Ramsey Set/"):
-            with open(f"Graphs/{graph_name}/Down-Arrow Ramsey Set/{file_name.name}", "rb") as input_file:
-                if down_arrow_ramsey_set == None:
-                    down_arrow_ramsey_set = set(input_file)
-                else:
-                    down_arrow_ramsey_set = down_arrow_ramsey_set.copy().intersection(set(input_file))
-        with open(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set.g6", "wb") as output_file:
-            for line in down_arrow_ramsey_set:
-                output_file.write(line)
+        with instrument.stage("intersection", host=graph_name):
+            instrument.message(f"Processing the colorings of {graph_name} to generate the down-arrow Ramsey set")
+            _finish_anytime(graph_name, _in_pool(lambda graph_name, pool:_intersect_colorings_helper(graph_name, pool, budget), graph_name, pool))
     return
 
-def _intersect_colorings_helper(graph_name, worker_id, num_workers):
-    graph = _get_graph_from_name(graph_name)
-    mem_needed = num_workers * sys.getsizeof(nx.to_graph6_bytes(graph)) * graph.number_of_edges()
-    running_intersection = None
-    for file_name in _allocate_work(os.scandir(f"Graphs/{graph_name}/Red-Blue Colorings/"), worker_id, num_workers):
-        if psutil.virtual_memory().available < mem_needed:
-            with open(f"Graphs/{graph_name}/Down-Arrow Ramsey Set/{int(max(os.listdir(f'Graphs/{graph_name}/Down-Arrow Ramsey Set/'), default='0 ').split(' ')[0])+1} -Thread {worker_id} waypoint.g6", "wb") as output_file:
-                for line in running_intersection:
-                    output_file.write(line)
-            running_intersection = None
-        else:
-            if running_intersection == None:
-                running_intersection = set()
-                with open(f"Graphs/{graph_name}/Red-Blue colorings/{file_name.name}", "rb") as input_file:
-                    for line in input_file:
-                        running_intersection.add(line)
-            else:
-                with open(f"Graphs/{graph_name}/Red-Blue colorings/{file_name.name}", "rb") as input_file:
-                    running_intersection = running_intersection.copy().intersection(set(input_file))
-    if not running_intersection == None:
-        with open(f"Graphs/{graph_name}/Down-Arrow Ramsey Set/{int(max(os.listdir(f'Graphs/{graph_name}/Down-Arrow Ramsey Set/'), default='0 ').split(' ')[0])+1} -Thread {worker_id} waypoint.g6", "wb") as output_file:
-            for line in running_intersection:
-                output_file.write(line)
+def _write_down_arrow_ramsey_set(graph_name, down_arrow_ramsey_set, path=None):
+    if path == None:
+        path = f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set.g6"
+    with PackedStore(_store_path(graph_name, "Subgraphs")) as subgraphs:
+        with open(f"{path}.tmp", "wb") as output_file:
+            for class_id in row_members(down_arrow_ramsey_set):
+                output_file.write(bytes(subgraphs[class_id]))
+    os.replace(f"{path}.tmp", path)
+    return
+
+def _upper_bound_path(graph_name):
+    return f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set upper bound.g6"
+
+def _checkpoint_path(graph_name):
+    return f"Graphs/{graph_name}/Checkpoint.json"
+
+def _anytime(graph_name, total_colorings, key, budget=None):
+    """
+        The anytime.Anytime of an intersection stage. budget is a dict of its time_budget, coloring_budget and checkpoint_seconds (None for no budget, and a checkpoint a minute).
+        Each checkpoint writes the upper bound to "{host} down-arrow ramsey set upper bound.g6" and the state to Checkpoint.json, and a later run with the same key (the stage and how its work was split) picks up from there.
+    """
+    key = dict(key)
+    resume = None
+    if os.path.exists(_checkpoint_path(graph_name)):
+        with open(_checkpoint_path(graph_name)) as input_file:
+            checkpoint = json.load(input_file)
+        if checkpoint["key"] == key:
+            resume = checkpoint
+            instrument.message(f"Picking up the colorings of {graph_name} after {checkpoint['processed colorings']} of them")
+    def publish(state):
+        _write_down_arrow_ramsey_set(graph_name, anytime.row, _upper_bound_path(graph_name))
+        with open(f"{_checkpoint_path(graph_name)}.tmp", "w") as output_file:
+            json.dump({"key":key, **state}, output_file)
+        os.replace(f"{_checkpoint_path(graph_name)}.tmp", _checkpoint_path(graph_name))
+        return
+    anytime = Anytime(len(_context(graph_name, "complements")), total_colorings, _context(graph_name, "floor"), publish=publish, resume=resume, **(budget or dict()))
+    return anytime
+
+def _finish_anytime(graph_name, anytime):
+    """
+        Writes the down-arrow Ramsey set if the intersection is exact, and otherwise leaves the upper bound and the checkpoint for the next run.
+    """
+    if anytime.exact:
+        _write_down_arrow_ramsey_set(graph_name, anytime.row)
+        for path in (_checkpoint_path(graph_name), _upper_bound_path(graph_name)):
+            if os.path.exists(path):
+                os.remove(path)
+    else:
+        state = anytime.checkpoint()
+        instrument.message(f"Out of budget for {graph_name}: the down-arrow Ramsey set is inside the {len(row_members(anytime.row))} graphs of \"{_upper_bound_path(graph_name)}\", with {state['remaining colorings']} colorings left (run it again to go on)", **{key:value for key,value in state.items() if key != "row"})
+    return
+
+def _intersect_colorings_helper(graph_name, pool, budget=None):
+    """
+        Each task ANDs a run of colorings and sends back one row, so a worker gets a few long runs instead of chunksize colorings at a time.
+        A task holds its running row and one block of colorings, and the block is sized from the pool's memory_budget, so memory stays the same however many colorings there are.
+        The colorings are smallest first, and tasks go out one wave (a task per worker) at a time, so once the intersection is down to the floor the later, larger colorings are never read.
+        Each wave is a step of the anytime intersection (see _anytime), so with a budget it stops after the wave that used it up, with the smallest colorings in.
+    """
+    number_of_classes = len(_context(graph_name, "complements"))
+    number_of_colorings = len(load_colorings(_colorings_path(graph_name)))
+    task_size = max(pool.chunksize, -(-number_of_colorings//(4*pool.num_workers)))
+    tasks = [(graph_name, coloring_ids, block_rows(pool.memory_budget, number_of_classes)) for coloring_ids in pool.chunks(range(number_of_colorings), task_size)]
+    waves = pool.chunks(tasks, pool.num_workers)
+    anytime = _anytime(graph_name, number_of_colorings, {"stage":"intersection", "colorings":number_of_colorings, "task size":task_size, "wave":pool.num_workers}, budget)
+    for wave in instrument.progress(waves[anytime.steps:], len(waves)-anytime.steps):
+        wave_intersection = full_row(number_of_classes).copy()
+        for row in pool.map(_intersect_colorings_task, wave):
+            wave_intersection &= np.frombuffer(row, dtype="<u8")
+        if anytime.add(wave_intersection, sum(len(coloring_ids) for graph_name,coloring_ids,block_size in wave)):
+            break
+    return anytime
+
+def _intersect_colorings_task(arguments):
+    """
+        The run of (red, blue) pairs is a slice of the memory-mapped colorings file, and each block of it is turned back into rows from the poset matrix (which is memory-mapped too), so only the pairs and the poset rows they name are read.
+    """
+    graph_name, coloring_ids, block_size = arguments
+    poset = _context(graph_name, "poset")
+    instrument.count("colorings", len(coloring_ids))
+    colorings = load_colorings(_colorings_path(graph_name))[coloring_ids[0]:coloring_ids[-1]+1]
+    return intersect_rows(coloring_rows(poset, colorings, block_size), len(poset), _context(graph_name, "floor")).tobytes()
+
+def _stream_colorings(graph_name, pool=None, budget=None):
+    """
+        The colorings and intersection stages run as one stream, so no Red-Blue Colorings store is written at all.
+        Each task makes the colorings of a run of red class IDs and ANDs them as it goes (a block at a time, sized from the pool's memory_budget), and sends back one row, which is ANDed into the running intersection as soon as it comes in.
+        Only a few tasks are in flight at once (see WorkerPool.stream), so once the running intersection is down to the floor the rest are never sent.
+        The subgraphs, poset and complement map still have to be finished first, since every down-set comes out of the whole Hasse diagram.
+        Without a budget the red classes go out in the order of their smallest coloring (see bitmatrix.smallest_first), so the intersection gets down to the floor as early as it can.
+        With one they go out in a random order (the same one every run), so an anytime answer cut short by budget (see _anytime) has seen a fair sample of the colorings rather than only the smallest ones.
+    """
+    _make_graph_directory(graph_name)
+    if not _stage_done(graph_name, "Subgraphs"):
+        _make_edge_induced_subgraphs(graph_name, pool)
+    if not _stage_done(graph_name, "Poset"):
+        _make_poset(graph_name, pool=pool)
+    _make_complements(graph_name)
+    if os.path.exists(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set.g6"):
+        instrument.message(f"The colorings of {graph_name} have already been processed")
+    else:
+        with instrument.stage("stream", host=graph_name):
+            instrument.message(f"Streaming the colorings of {graph_name} into the down-arrow Ramsey set")
+            _finish_anytime(graph_name, _in_pool(lambda graph_name, pool:_stream_colorings_helper(graph_name, pool, budget), graph_name, pool))
+    return
+
+def _stream_colorings_helper(graph_name, pool, budget=None):
+    complements = _context(graph_name, "complements")
+    number_of_classes = len(complements)
+    if budget == None:
+        pairs = [(red_class_id, blue_class_id) for red_class_id in range(number_of_classes) for blue_class_id in complements[red_class_id] if red_class_id <= blue_class_id]
+        order = "smallest first"
+        red_class_ids = list(dict.fromkeys(red_class_id for red_class_id,blue_class_id in smallest_first(_context(graph_name, "poset"), pairs, block_rows(pool.memory_budget, number_of_classes))))
+    else:
+        order = "random"
+        red_class_ids = np.random.default_rng(0).permutation(number_of_classes).tolist()
+    chunks = pool.chunks(red_class_ids)
+    sizes = [sum(1 for red_class_id in red_class_ids for blue_class_id in complements[red_class_id] if red_class_id <= blue_class_id) for red_class_ids in chunks]
+    anytime = _anytime(graph_name, sum(sizes), {"stage":"stream", "classes":number_of_classes, "chunksize":pool.chunksize, "order":order}, budget)
+    steps = range(anytime.steps, len(chunks))
+    for step,row in zip(steps, instrument.progress(pool.stream(_stream_colorings_task, ((graph_name, chunks[step], block_rows(pool.memory_budget, number_of_classes)) for step in steps)), len(steps))):
+        if anytime.add(row, sizes[step]):
+            break
+    return anytime
+
+def _stream_colorings_task(arguments):
+    graph_name, red_class_ids, block_size = arguments
+    complements = _context(graph_name, "complements")
+    poset = _context(graph_name, "poset")
+    pairs = [(red_class_id, blue_class_id) for red_class_id in red_class_ids for blue_class_id in complements[red_class_id] if red_class_id <= blue_class_id]
+    instrument.count("colorings", len(pairs))
+    return intersect_rows(coloring_blocks(poset, pairs, block_size), len(poset), _context(graph_name, "floor")).tobytes()
+
 """
     _intersect_colorings_single_threaded is still here, because I haven't ran into an issue with the newly written one yet, and I'm not quite confident that it works as expected, and don't know how to make a unit test for it..... oops.
 """
@@ -326,33 +506,58 @@ def _intersect_colorings_helper(graph_name, worker_id, num_workers):
 #                     output_file.write(graph)
 #     return
 
-def make_down_arrow_ramsey_set_ideals(graph_name):
+def _make_down_arrow_ramsey_set(graph_name, pool, cache_path, stream=True, budget=None):
+    if not _stage_done(graph_name, "Subgraphs"):
+        _make_edge_induced_subgraphs(graph_name, pool)
+    if not _stage_done(graph_name, "Poset"):
+        _make_poset(graph_name, pool=pool, cache=None if cache_path == None else GraphCache(cache_path))
+    if stream:
+        _stream_colorings(graph_name, pool, budget)
+        return
+    if not _colorings_done(graph_name):
+        _make_colorings(graph_name, pool)
+    if not os.path.exists(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set.g6"):
+        _intersect_colorings(graph_name, pool, budget)
+    return
+
+def make_down_arrow_ramsey_set_ideals(graph_name, num_workers=None, chunksize=64, memory_budget=2**26, cache_path=None, pool=None, draw=True, stream=True, budget=None):
+    """
+        One worker pool is shared by every stage of the run. num_workers defaults to one less than the number of CPUs, and chunksize is how many red classes go in each coloring task.
+        memory_budget is the number of bytes of colorings each worker reads in at once when intersecting them (64 MiB by default).
+        cache_path is the cache of classes and monomorphism answers shared by every host (see graphcache.py, graphcache.DEFAULT_PATH is where the command line keeps it), and None (the default) runs without one.
+        With a pool (a workerpool.WorkerPool, like sweep.py shares between hosts), num_workers, chunksize and memory_budget are the pool's, and it is left open. draw=False skips the picture of the ideals.
+        stream=False makes and keeps the Red-Blue Colorings and intersects them afterwards, instead of intersecting the colorings as they are made (see _stream_colorings).
+        budget (a dict with any of time_budget, coloring_budget and checkpoint_seconds, see anytime.py) makes the intersection an anytime one: it publishes an upper bound of the down-arrow Ramsey set as it goes, and stops when the budget is used up, leaving the ideals for a later run that finishes the intersection.
+    """
 
     if type(graph_name) == type(nx.null_graph()):
         graph_name = _graph6_bytes_to_file_name(nx.to_graph6_bytes(graph_name))
 
     _make_graph_directory(graph_name)
-    graph = _get_graph_from_name(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Subgraphs/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_edge_induced_subgraphs(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Poset/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_poset(graph_name)
-    if not os.path.exists(f"Graphs/{graph_name}/Red-Blue Colorings/{_graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False))}"):
-        _make_colorings(graph_name)
+    if pool == None:
+        with _worker_pool(graph_name, num_workers, chunksize, memory_budget) as pool:
+            _make_down_arrow_ramsey_set(graph_name, pool, cache_path, stream, budget)
+    else:
+        _make_down_arrow_ramsey_set(graph_name, pool, cache_path, stream, budget)
     if not os.path.exists(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set.g6"):
-        _intersect_colorings(graph_name)
+        return
     if os.path.exists(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set ideals.g6"):
-        print(f"The ideals of the down-arrow Ramsey set of {graph_name} have already been made")
-    else:
+        instrument.message(f"The ideals of the down-arrow Ramsey set of {graph_name} have already been made")
+        return
+    with instrument.stage("ideals", host=graph_name):
         poset_graph = nx.DiGraph()
-        for graph in _read_graph6(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set.g6"):
-            node_graph6_string = _graph6_bytes_to_file_name(nx.to_graph6_bytes(graph,header=False)).split(".")[0]
-            for subgraph in _read_graph6(f"Graphs/{graph_name}/Poset/{node_graph6_string}.g6"):
-                subgraph_graph6_string = _graph6_bytes_to_file_name(nx.to_graph6_bytes(subgraph,header=False)).split(".")[0]
-                if node_graph6_string != subgraph_graph6_string:
-                    poset_graph.add_edge(subgraph_graph6_string,node_graph6_string)
-        with open(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set ideals.g6", "wb") as output_file:
-            for node in poset_graph.nodes():
-                if poset_graph.out_degree(node)==0:
-                    output_file.write(_file_name_to_graph6_bytes(f"{node}.g6")+b"\n")
-        _draw_graphs(_read_graph6(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set ideals.g6"),f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set ideals")
\ No newline at end of file
+        with PackedStore(_store_path(graph_name, "Subgraphs")) as subgraphs, PackedStore(_store_path(graph_name, "Poset")) as poset:
+            class_ids = {bytes(record):class_id for class_id,record in enumerate(subgraphs)}
+            with open(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set.g6", "rb") as input_file:
+                for line in input_file:
+                    node = class_ids[line]
+                    for subgraph_line in poset.lines(node):
+                        if class_ids[subgraph_line] != node:
+                            poset_graph.add_edge(class_ids[subgraph_line],node)
+            with open(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set ideals.g6", "wb") as output_file:
+                for node in poset_graph.nodes():
+                    if poset_graph.out_degree(node)==0:
+                        output_file.write(bytes(subgraphs[node]))
+        if draw:
+            _draw_graphs(_read_graph6(f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set ideals.g6"),f"Graphs/{graph_name}/{graph_name} down-arrow ramsey set ideals")
+    return
@@ -0,0 +1,63 @@
+"""
+    The running intersection of the colorings as an anytime answer.
+    Every coloring's union contains the whole down-arrow Ramsey set, so the AND of any of them, in any order, is an upper bound of it (a superset), and it only ever shrinks towards the exact set as more colorings go in.
+    Anytime keeps that row with how many colorings it has seen, stops when a time or coloring budget runs out, and hands its state to publish every checkpoint_seconds (and when it stops), so a long run has a usable answer on disk the whole time.
+    The state is plain JSON, so a later run can pick it up with resume=state and carry on from where the last one stopped.
+"""
+import time
+import numpy as np
+import instrument
+from bitmatrix import full_row, is_fixed
+
+class Anytime:
+    def __init__(self, number_of_classes, total_colorings, floor=None, time_budget=None, coloring_budget=None, checkpoint_seconds=60, publish=None, resume=None):
+        self.total_colorings = total_colorings
+        self.floor = floor
+        self.time_budget = time_budget
+        self.coloring_budget = coloring_budget
+        self.checkpoint_seconds = checkpoint_seconds
+        self.publish = publish
+        if resume == None:
+            self.row = full_row(number_of_classes).copy()
+            self.processed = 0
+            self.steps = 0
+            self.seconds = 0.0
+        else:
+            self.row = np.frombuffer(bytes.fromhex(resume["row"]), dtype="<u8").copy()
+            self.processed = resume["processed colorings"]
+            self.steps = resume["steps"]
+            self.seconds = resume["seconds"]
+        self._processed_before = self.processed
+        self._started = time.perf_counter()
+        self._last_checkpoint = self._started
+
+    def add(self, row, number_of_colorings):
+        """
+            ANDs in the row of one step (a task's worth of colorings), and returns True when there is no point in (or no budget for) another step.
+        """
+        self.row &= np.frombuffer(row, dtype="<u8") if isinstance(row, bytes) else row
+        self.processed += number_of_colorings
+        self.steps += 1
+        if time.perf_counter()-self._last_checkpoint >= self.checkpoint_seconds:
+            self.checkpoint()
+        return self.exact or self.out_of_budget()
+
+    @property
+    def exact(self):
+        return self.processed >= self.total_colorings or is_fixed(self.row, self.floor)
+
+    def out_of_budget(self):
+        if self.time_budget != None and time.perf_counter()-self._started >= self.time_budget:
+            return True
+        return self.coloring_budget != None and self.processed-self._processed_before >= self.coloring_budget
+
+    def state(self):
+        return {"processed colorings":self.processed, "remaining colorings":0 if self.exact else self.total_colorings-self.processed, "steps":self.steps, "seconds":round(self.seconds+time.perf_counter()-self._started, 3), "exact":self.exact, "row":self.row.tobytes().hex()}
+
+    def checkpoint(self):
+        self._last_checkpoint = time.perf_counter()
+        state = self.state()
+        instrument.event("checkpoint", **{key:value for key,value in state.items() if key != "row"})
+        if self.publish != None:
+            self.publish(state)
+        return state
@@ -0,0 +1,209 @@
+"""
+    Stage by stage benchmarks of the three pipelines (DownArrowRamseySetGenerator, DownArrow and newposet) over the built-in hosts.
+    "streamed" is DownArrowRamseySetGenerator with the colorings intersected as they are made (see _stream_colorings there) instead of its colorings and intersection stages.
+
+        python benchmark.py                                  every host in HOSTS
+        python benchmark.py K_5 "Barbell 3-0" -o results.json
+
+    Every stage records its wall time, CPU time (its own and its workers'), peak RSS and the counters of instrument.py (matcher calls, cache hits, bytes written, ...), and the results go to a JSON file.
+    At the end, the down-arrow Ramsey sets of the three pipelines are compared for every host, and the exit status is 1 if any of them disagree.
+    Each (pipeline, host) pair runs in a scratch directory of its own, so nothing is reused from an earlier run (the monomorphism cache included).
+    The file based pipelines also record how many bytes they left on disk.
+    Nothing is drawn, so the ideals stages time the ideals and not matplotlib.
+    The DownArrowRamseySetGenerator and DownArrow stages each run in a fresh process, so their peak RSS is per stage. newposet keeps everything in memory, so its stages share a process and its peak RSS is the peak so far.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import matplotlib
+matplotlib.use("Agg")
+import networkx as nx
+import DownArrowRamseySetGenerator
+import DownArrow
+import newposet
+import instrument
+import graphcache
+from graphcache import form
+try:
+    import resource
+except ImportError:
+    resource = None
+
+HOSTS = ["K_3", "K_4", "K_5", "K_6", "C_4", "C_5", "C_6", "P_4", "P_5", "P_6", "K_2,2", "K_2,3", "K_3,3", "Barioli-Fallat Tree", "Barbell 3-0", "ZimGraph"]
+PIPELINES = ["DownArrowRamseySetGenerator", "streamed", "DownArrow", "newposet"]
+STAGES = ["subgraphs", "poset", "colorings", "intersection", "stream", "ideals"]
+
+def _cpu_time():
+    times = os.times()
+    return times.user+times.system+times.children_user+times.children_system
+
+def _peak_rss():
+    """
+        Bytes, for this process and the largest of its finished children (the pool workers).
+    """
+    if resource == None:
+        import psutil
+        return psutil.Process().memory_info().rss
+    scale = 1 if sys.platform == "darwin" else 1024
+    return scale*max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def _measure(function, *arguments):
+    """
+        instrument.py has to be on (see _run_stage) for the counters to be filled in.
+    """
+    counters = instrument.totals()
+    wall_time = time.perf_counter()
+    cpu_time = _cpu_time()
+    result = function(*arguments)
+    metrics = {"wall_time":time.perf_counter()-wall_time, "cpu_time":_cpu_time()-cpu_time, "peak_rss":_peak_rss()}
+    instrument.collect()
+    metrics["counters"] = dict(instrument.totals()-counters)
+    return metrics, result
+
+def _down_arrow_forms(path):
+    with open(path, "rb") as input_file:
+        return sorted(form(nx.from_graph6_bytes(line.strip())).decode() for line in input_file if line.strip())
+
+def _generator_stages(host_name):
+    generator = DownArrowRamseySetGenerator
+    return {"subgraphs":(generator._make_edge_induced_subgraphs, host_name), "poset":(generator._make_poset, host_name), "colorings":(generator._make_colorings, host_name), "intersection":(generator._intersect_colorings, host_name), "ideals":(generator.make_down_arrow_ramsey_set_ideals, host_name, None, 64, 2**26, graphcache.DEFAULT_PATH, None, False)}
+
+def _streamed_stages(host_name):
+    generator = DownArrowRamseySetGenerator
+    return {"subgraphs":(generator._make_edge_induced_subgraphs, host_name), "poset":(generator._make_poset, host_name), "stream":(generator._stream_colorings, host_name), "ideals":(generator.make_down_arrow_ramsey_set_ideals, host_name, None, 64, 2**26, graphcache.DEFAULT_PATH, None, False)}
+
+def _down_arrow_stages(host_name):
+    return {"subgraphs":(DownArrow._make_subgraphs, host_name), "poset":(DownArrow._make_poset, host_name), "intersection":(DownArrow.make_down_arrow_set, host_name, None, 64, 2**26, False), "ideals":(DownArrow._make_ideals, host_name, False, graphcache.DEFAULT_PATH)}
+
+def _run_stage(directory, stage, connection):
+    os.chdir(directory)
+    instrument.enable("events.jsonl", quiet=True)
+    try:
+        metrics, result = _measure(*stage)
+        connection.send((metrics, None))
+    except Exception as error:
+        connection.send((None, repr(error)))
+    connection.close()
+    return
+
+def _in_process(target, *arguments):
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=target, args=(*arguments, sender))
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    return result
+
+def _disk_bytes(directory):
+    return sum(os.path.getsize(os.path.join(root, file_name)) for root,directories,file_names in os.walk(directory) for file_name in file_names)
+
+def _staged_pipeline(stages, directory, down_arrow_path):
+    """
+        Runs the stages of a file based pipeline one process each, in order, stopping at the first error.
+    """
+    result = {"stages":dict(), "error":None, "down_arrow_set":None}
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        metrics, error = _in_process(_run_stage, directory, stages[stage])
+        if error != None:
+            result["error"] = f"{stage}: {error}"
+            return result
+        result["stages"][stage] = metrics
+    result["down_arrow_set"] = _down_arrow_forms(os.path.join(directory, down_arrow_path))
+    result["disk_bytes"] = _disk_bytes(directory)
+    return result
+
+def _newposet_ideals(poset_graph, down_arrow_set_nodes):
+    down_arrow_set_poset = nx.induced_subgraph(poset_graph, down_arrow_set_nodes)
+    return set(node for node in down_arrow_set_poset.nodes() if down_arrow_set_poset.out_degree(node) == 0)
+
+def _run_newposet(directory, host_name, connection):
+    os.chdir(directory)
+    instrument.enable("events.jsonl", quiet=True)
+    result = {"stages":dict(), "error":None, "down_arrow_set":None}
+    stage = "poset"
+    try:
+        host = DownArrowRamseySetGenerator._get_graph_from_name(host_name)
+        result["stages"]["poset"], poset_graph = _measure(newposet.make_poset, host)
+        stage = "colorings"
+        result["stages"]["colorings"], colorings = _measure(newposet.make_colorings, poset_graph)
+        stage = "intersection"
+        result["stages"]["intersection"], down_arrow_set_nodes = _measure(newposet.make_down_arrow_set, colorings, None, newposet.floor_row(poset_graph))
+        stage = "ideals"
+        result["stages"]["ideals"], ideals = _measure(_newposet_ideals, poset_graph, down_arrow_set_nodes)
+        result["down_arrow_set"] = sorted(form(nx.from_graph6_bytes(poset_graph.nodes[node]["graph6_bytes"])).decode() for node in down_arrow_set_nodes)
+    except Exception as error:
+        result["error"] = f"{stage}: {error!r}"
+    connection.send(result)
+    connection.close()
+    return
+
+def benchmark_host(host_name, pipelines=PIPELINES):
+    """
+        Returns {pipeline: {"stages": {stage: metrics}, "error": ..., "down_arrow_set": sorted canonical forms}}.
+    """
+    results = dict()
+    for pipeline in pipelines:
+        directory = tempfile.mkdtemp(prefix="benchmark-")
+        try:
+            if pipeline == "DownArrowRamseySetGenerator":
+                results[pipeline] = _staged_pipeline(_generator_stages(host_name), directory, f"Graphs/{host_name}/{host_name} down-arrow ramsey set.g6")
+            elif pipeline == "streamed":
+                results[pipeline] = _staged_pipeline(_streamed_stages(host_name), directory, f"Graphs/{host_name}/{host_name} down-arrow ramsey set.g6")
+            elif pipeline == "DownArrow":
+                if DownArrow._get_graph_from_name(host_name) == None:
+                    results[pipeline] = {"stages":dict(), "error":"unsupported host", "down_arrow_set":None}
+                else:
+                    results[pipeline] = _staged_pipeline(_down_arrow_stages(host_name), directory, f"Graphs/{host_name}/{host_name}.Down.Arrow.Set.g6")
+            elif pipeline == "newposet":
+                results[pipeline] = _in_process(_run_newposet, directory, host_name)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+def agreement(results):
+    """
+        True when every pipeline that finished found the same down-arrow Ramsey set, None when fewer than two finished.
+    """
+    down_arrow_sets = [result["down_arrow_set"] for result in results.values() if result["down_arrow_set"] != None]
+    if len(down_arrow_sets) < 2:
+        return None
+    return all(down_arrow_set == down_arrow_sets[0] for down_arrow_set in down_arrow_sets)
+
+def _print_host(host_name, results, agrees):
+    print(f"{host_name}: {'agree' if agrees else 'DISAGREE' if agrees == False else 'nothing to compare'}")
+    for pipeline,result in results.items():
+        stages = ", ".join(f"{stage} {metrics['wall_time']:.2f}s" for stage,metrics in result["stages"].items())
+        disk = f", {result['disk_bytes']} bytes on disk" if "disk_bytes" in result else ""
+        print(f"    {pipeline}: {stages}{disk}" + (f" (failed at {result['error']})" if result["error"] != None else ""))
+    return
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark each stage of each pipeline and check that they agree.")
+    parser.add_argument("hosts", nargs="*", default=HOSTS, help="host names, as _get_graph_from_name takes them (default: all of HOSTS)")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="where to write the JSON results")
+    parser.add_argument("-p", "--pipelines", nargs="+", choices=PIPELINES, default=PIPELINES)
+    options = parser.parse_args(arguments)
+    report = {"python":platform.python_version(), "platform":platform.platform(), "cpu_count":multiprocessing.cpu_count(), "hosts":dict()}
+    all_agree = True
+    for host_name in options.hosts:
+        results = benchmark_host(host_name, options.pipelines)
+        agrees = agreement(results)
+        report["hosts"][host_name] = {"pipelines":results, "agree":agrees}
+        _print_host(host_name, results, agrees)
+        if agrees == False:
+            all_agree = False
+    with open(options.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    return 0 if all_agree else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+    Every edge-induced subgraph of a host is stored as an int whose bit i says whether the i-th host edge (in the order of host.edges()) is present.
+    So the complement inside the host is full_mask ^ mask and the number of edges is a popcount.
+    networkx graphs only need to be built when something is drawn or written out.
+"""
+import networkx as nx
+import array
+import matcher
+
+def popcount(mask):
+    return mask.bit_count()
+
+class HostEdges:
+    """
+        The fixed edge order of a host graph, and the conversions between edge bitmasks and graphs.
+    """
+    __slots__ = ("host", "vertices", "position", "edges", "edge_index", "full_mask")
+
+    def __init__(self, host):
+        self.host = host
+        self.vertices = list(host.nodes())
+        self.position = {vertex:index for index,vertex in enumerate(self.vertices)}
+        self.edges = [(source,target) for source,target in host.edges() if source != target]
+        self.edge_index = dict()
+        for index,(source,target) in enumerate(self.edges):
+            self.edge_index[(source,target)] = index
+            self.edge_index[(target,source)] = index
+        self.full_mask = (1 << len(self.edges))-1
+
+    def __len__(self):
+        return len(self.edges)
+
+    def mask(self, edges):
+        mask = 0
+        for edge in edges:
+            mask |= 1 << self.edge_index[edge]
+        return mask
+
+    def mask_of(self, subgraph):
+        """
+            subgraph has to be labelled inside the host (i.e. every edge of it is an edge of the host).
+        """
+        return self.mask(subgraph.edges())
+
+    def embed(self, subgraph):
+        """
+            Finds some copy of subgraph inside the host and returns its mask, for graphs that are not labelled inside the host (for example anything decoded from graph6).
+            Raises KeyError if subgraph does not embed in the host.
+        """
+        monomorphism = matcher.monomorphism(self.host, subgraph)
+        if monomorphism != None:
+            inverse = {value:key for key,value in monomorphism.items()}
+            return self.mask((inverse[source],inverse[target]) for source,target in subgraph.edges())
+        raise KeyError(f"{nx.to_graph6_bytes(subgraph, header=False).strip()} does not embed in the host")
+
+    def edges_of(self, mask):
+        edges = []
+        while mask:
+            lowest_bit = mask & -mask
+            edges.append(self.edges[lowest_bit.bit_length()-1])
+            mask ^= lowest_bit
+        return edges
+
+    def graph(self, mask):
+        return self.host.edge_subgraph(self.edges_of(mask))
+
+    def complement(self, mask):
+        return self.full_mask ^ mask
+
+    def vertex_rows(self, mask):
+        """
+            Adjacency row bitmasks of the subgraph over all of the host's vertices (isolated ones included).
+        """
+        rows = [0]*len(self.vertices)
+        for source,target in self.edges_of(mask):
+            source = self.position[source]
+            target = self.position[target]
+            rows[source] |= 1 << target
+            rows[target] |= 1 << source
+        return rows
+
+    def rows(self, mask):
+        """
+            Adjacency row bitmasks of the edge-induced subgraph, so only over the vertices that the mask touches.
+        """
+        rows = self.vertex_rows(mask)
+        touched = [index for index,row in enumerate(rows) if row]
+        compressed = {index:new_index for new_index,index in enumerate(touched)}
+        compressed_rows = []
+        for index in touched:
+            row = rows[index]
+            compressed_row = 0
+            while row:
+                lowest_bit = row & -row
+                compressed_row |= 1 << compressed[lowest_bit.bit_length()-1]
+                row ^= lowest_bit
+            compressed_rows.append(compressed_row)
+        return compressed_rows
+
+class SubgraphRecord:
+    __slots__ = ("class_id", "mask", "number_of_edges")
+
+    def __init__(self, class_id, mask, number_of_edges):
+        self.class_id = class_id
+        self.mask = mask
+        self.number_of_edges = number_of_edges
+
+    def __repr__(self):
+        return f"SubgraphRecord({self.class_id}, {bin(self.mask)}, {self.number_of_edges})"
+
+class SubgraphStore:
+    """
+        One mask per isomorphism class, indexed by class ID.
+        The masks live in a flat array (uint64 while the host has at most 64 edges, Python ints past that).
+    """
+    def __init__(self, host_edges):
+        self.host_edges = host_edges
+        self._wide = len(host_edges) > 64
+        self.masks = list() if self._wide else array.array("Q")
+        self.edge_counts = array.array("H")
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __getitem__(self, class_id):
+        return SubgraphRecord(class_id, int(self.masks[class_id]), self.edge_counts[class_id])
+
+    def __iter__(self):
+        for class_id in range(len(self)):
+            yield self[class_id]
+
+    def add(self, mask):
+        self.masks.append(mask)
+        self.edge_counts.append(popcount(mask))
+        return len(self.masks)-1
+
+    def graph(self, class_id):
+        return self.host_edges.graph(int(self.masks[class_id]))
@@ -0,0 +1,210 @@
+"""
+    The poset as an N x N bit matrix: row i has bit j set when class j is in the down-set of class i, packed into ceil(N/64) little-endian uint64 words per row.
+    A coloring's union down(red) | down(blue) is the OR of two rows, and the down-arrow Ramsey set is the AND of those unions over every coloring, which NumPy does a block of rows at a time.
+    So a coloring is stored as nothing but its (red, blue) class IDs, next to the size of its union (see sized_colorings), and its row is made again from the matrix when it is read.
+"""
+import heapq
+import os
+import numpy as np
+import instrument
+
+def number_of_words(number_of_classes):
+    return max(1, (number_of_classes+63)//64)
+
+def bits_to_words(bits, words):
+    return np.frombuffer(bits.to_bytes(8*words, "little"), dtype="<u8")
+
+def words_to_bits(row):
+    return int.from_bytes(np.ascontiguousarray(row, dtype="<u8").tobytes(), "little")
+
+def full_row(number_of_classes):
+    return bits_to_words((1 << number_of_classes)-1, number_of_words(number_of_classes))
+
+def row_size(row):
+    return words_to_bits(row).bit_count()
+
+def row_sizes(block):
+    """
+        The number of classes in each row of a (k x words) block.
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(block).sum(axis=1, dtype=np.int64)
+    return np.unpackbits(np.ascontiguousarray(block).view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+def row_members(row):
+    class_ids = []
+    bits = words_to_bits(row)
+    while bits:
+        lowest_bit = bits & -bits
+        class_ids.append(lowest_bit.bit_length()-1)
+        bits ^= lowest_bit
+    return class_ids
+
+class DownSetMatrix:
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def from_down_sets(cls, down_set):
+        """
+            down_set is a list of int bitsets, like hasse.down_sets() returns.
+        """
+        words = number_of_words(len(down_set))
+        rows = np.zeros((len(down_set), words), dtype="<u8")
+        for class_id,bits in enumerate(down_set):
+            rows[class_id] = bits_to_words(bits, words)
+        return cls(rows)
+
+    @classmethod
+    def load(cls, path):
+        """
+            Memory-mapped, so only the rows that get touched are read from disk.
+        """
+        return cls(np.load(path, mmap_mode="r"))
+
+    def save(self, path):
+        np.save(path, np.ascontiguousarray(self.rows))
+        return
+
+    def __len__(self):
+        return len(self.rows)
+
+    def union(self, red_class_id, blue_class_id):
+        return self.rows[red_class_id] | self.rows[blue_class_id]
+
+    def unions(self, red_class_ids, blue_class_ids):
+        return self.rows[np.asarray(red_class_ids, dtype=np.int64)] | self.rows[np.asarray(blue_class_ids, dtype=np.int64)]
+
+def intersect_rows(row_blocks, number_of_classes, floor=None):
+    """
+        AND of every row in an iterable of (k x words) blocks, starting from the row with every class in it.
+        floor is a row that is known to be inside every row (see complements.monochromatic_star). Once the running AND is down to it, or to nothing, no later block can change it, so the rest of the blocks are never read.
+    """
+    running_intersection = full_row(number_of_classes).copy()
+    for block in row_blocks:
+        if len(block):
+            running_intersection &= np.bitwise_and.reduce(block, axis=0)
+            if is_fixed(running_intersection, floor):
+                break
+    return running_intersection
+
+def is_fixed(running_intersection, floor=None):
+    if not running_intersection.any():
+        return True
+    return floor is not None and np.array_equal(running_intersection, floor)
+
+def stacked_blocks(rows, block_size=4096):
+    """
+        Groups an iterable of rows (for example np.frombuffer views of packed store records) into (k x words) blocks.
+    """
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) == block_size:
+            yield np.stack(block)
+            block = []
+    if block:
+        yield np.stack(block)
+
+def block_rows(memory_budget, number_of_classes):
+    """
+        How many rows fit in memory_budget bytes (at least one), for sizing blocks so a stage stays within a fixed amount of memory however many colorings there are.
+    """
+    if memory_budget == None:
+        return 4096
+    return max(1, memory_budget//(8*number_of_words(number_of_classes)))
+
+def coloring_blocks(matrix, pairs, block_size=4096):
+    """
+        The unions of (red, blue) class pairs, block_size colorings at a time.
+    """
+    red_class_ids = []
+    blue_class_ids = []
+    for red_class_id,blue_class_id in pairs:
+        red_class_ids.append(red_class_id)
+        blue_class_ids.append(blue_class_id)
+        if len(red_class_ids) == block_size:
+            yield matrix.unions(red_class_ids, blue_class_ids)
+            red_class_ids = []
+            blue_class_ids = []
+    if red_class_ids:
+        yield matrix.unions(red_class_ids, blue_class_ids)
+
+def smallest_first(matrix, pairs, block_size=4096):
+    """
+        The (red, blue) pairs with each coloring once, in order of the size of their union. The small unions take the most out of the intersection, so they go first.
+    """
+    pairs = sorted(set((min(red_class_id, blue_class_id), max(red_class_id, blue_class_id)) for red_class_id,blue_class_id in pairs))
+    sizes = []
+    for block in coloring_blocks(matrix, pairs, block_size):
+        sizes.extend(row_size(row) for row in block)
+    return [pair for size,pair in sorted(zip(sizes, pairs))]
+
+def sized_colorings(matrix, pairs, block_size=4096):
+    """
+        A (k x 3) uint32 array of (size of the union, red, blue), one row per pair, smallest union first (ties stay in the order of pairs).
+    """
+    pairs = np.array(pairs, dtype=np.uint32).reshape(-1, 2)
+    sizes = np.zeros(len(pairs), dtype=np.uint32)
+    for start in range(0, len(pairs), block_size):
+        sizes[start:start+block_size] = row_sizes(matrix.unions(pairs[start:start+block_size, 0], pairs[start:start+block_size, 1]))
+    colorings = np.column_stack((sizes, pairs))
+    return colorings[np.argsort(sizes, kind="stable")]
+
+def save_colorings(path, colorings):
+    """
+        path ends in ".npy". Like the packed stores, it is written to "*.tmp" and renamed into place, so if it exists it is complete.
+    """
+    with open(f"{path}.tmp", "wb") as output_file:
+        np.save(output_file, np.ascontiguousarray(colorings, dtype=np.uint32).reshape(-1, 3))
+        instrument.count("bytes_written", output_file.tell())
+    os.replace(f"{path}.tmp", path)
+    return
+
+def load_colorings(path):
+    return np.load(path, mmap_mode="r")
+
+def _part_colorings(colorings, block_size=4096):
+    for start in range(0, len(colorings), block_size):
+        yield from np.asarray(colorings[start:start+block_size]).tolist()
+
+def merge_colorings(part_paths, path, block_size=4096):
+    """
+        One smallest-first colorings file out of smallest-first parts (which are removed).
+        The parts are memory-mapped and merged by size into a memory-mapped output (like packedstore.merge with a key), so only a block of each part and of the output is held at a time, however many colorings there are. Ties keep the order of the parts.
+    """
+    parts = [load_colorings(part_path) for part_path in part_paths if os.path.exists(part_path)]
+    number_of_colorings = sum(len(part) for part in parts)
+    if number_of_colorings == 0:
+        save_colorings(path, np.zeros((0, 3), dtype=np.uint32))
+    else:
+        output = np.lib.format.open_memmap(f"{path}.tmp", mode="w+", dtype=np.uint32, shape=(number_of_colorings, 3))
+        position = 0
+        block = []
+        for coloring in heapq.merge(*(_part_colorings(part, block_size) for part in parts), key=lambda coloring:coloring[0]):
+            block.append(coloring)
+            if len(block) == block_size:
+                output[position:position+block_size] = block
+                position += block_size
+                block = []
+        output[position:position+len(block)] = block
+        output.flush()
+        del output
+        instrument.count("bytes_written", os.path.getsize(f"{path}.tmp"))
+        os.replace(f"{path}.tmp", path)
+    del parts
+    for part_path in part_paths:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return
+
+def coloring_rows(matrix, colorings, block_size=4096):
+    """
+        The unions of a (k x 3) colorings array (or a slice of a loaded one), block_size at a time.
+    """
+    for start in range(0, len(colorings), block_size):
+        block = np.asarray(colorings[start:start+block_size])
+        yield matrix.unions(block[:, 1], block[:, 2])
+
+def intersect_colorings(matrix, pairs, block_size=4096, floor=None):
+    return intersect_rows(coloring_blocks(matrix, smallest_first(matrix, pairs, block_size), block_size), len(matrix), floor)
@@ -0,0 +1,202 @@
+from codec import encode_rows
+
+def _adjacency_rows(graph):
+    vertices = list(graph.nodes())
+    position = {vertex:index for index,vertex in enumerate(vertices)}
+    rows = [0]*len(vertices)
+    for source,target in graph.edges():
+        if source == target:
+            continue
+        rows[position[source]] |= 1 << position[target]
+        rows[position[target]] |= 1 << position[source]
+    return vertices, rows
+
+def _refine(cells, layers):
+    while True:
+        cell_masks = [sum(1 << vertex for vertex in cell) for cell in cells]
+        refined_cells = []
+        for cell in cells:
+            if len(cell) == 1:
+                refined_cells.append(cell)
+                continue
+            signatures = dict()
+            for vertex in cell:
+                signature = tuple((rows[vertex] & cell_mask).bit_count() for rows in layers for cell_mask in cell_masks)
+                signatures.setdefault(signature, []).append(vertex)
+            for signature in sorted(signatures):
+                refined_cells.append(signatures[signature])
+        if len(refined_cells) == len(cells):
+            return refined_cells
+        cells = refined_cells
+
+def _are_twins(vertex_1, vertex_2, layers):
+    for rows in layers:
+        if rows[vertex_1] & ~(1 << vertex_2) != rows[vertex_2] & ~(1 << vertex_1):
+            return False
+    return True
+
+def _certificate(order, layers):
+    position = [0]*len(order)
+    for index,vertex in enumerate(order):
+        position[vertex] = index
+    certificate = []
+    for rows in layers:
+        for vertex in order:
+            relabeled_row = 0
+            neighbours = rows[vertex]
+            while neighbours:
+                lowest_bit = neighbours & -neighbours
+                relabeled_row |= 1 << position[lowest_bit.bit_length()-1]
+                neighbours ^= lowest_bit
+            certificate.append(relabeled_row)
+    return tuple(certificate)
+
+def _orbit_roots(number_of_vertices, automorphisms, fixed_vertices):
+    parent = list(range(number_of_vertices))
+    def find(vertex):
+        while parent[vertex] != vertex:
+            parent[vertex] = parent[parent[vertex]]
+            vertex = parent[vertex]
+        return vertex
+    for automorphism in automorphisms:
+        if any(automorphism[vertex] != vertex for vertex in fixed_vertices):
+            continue
+        for vertex,image in enumerate(automorphism):
+            root_1 = find(vertex)
+            root_2 = find(image)
+            if root_1 != root_2:
+                parent[root_1] = root_2
+    return [find(vertex) for vertex in range(number_of_vertices)]
+
+def _record_leaf(order, certificate, state):
+    for leaf_order,leaf_certificate in (state["first"], state["best"]):
+        if leaf_certificate == certificate:
+            automorphism = [0]*len(order)
+            for leaf_vertex,vertex in zip(leaf_order, order):
+                automorphism[leaf_vertex] = vertex
+            state["automorphisms"].append(automorphism)
+            return
+    if state["first"][1] == None:
+        state["first"] = (order, certificate)
+    if state["best"][1] == None or certificate < state["best"][1]:
+        state["best"] = (order, certificate)
+
+def _search(cells, prefix, layers, state):
+    cells = _refine(cells, layers)
+    for target_cell,cell in enumerate(cells):
+        if len(cell) > 1:
+            break
+    else:
+        order = [cell[0] for cell in cells]
+        _record_leaf(order, _certificate(order, layers), state)
+        return
+    explored = []
+    explored_roots = set()
+    for vertex in cells[target_cell]:
+        if any(_are_twins(vertex, explored_vertex, layers) for explored_vertex in explored):
+            continue
+        if state["automorphisms"]:
+            roots = _orbit_roots(len(layers[0]), state["automorphisms"], prefix)
+            if roots[vertex] in explored_roots:
+                continue
+            explored_roots.update(roots[explored_vertex] for explored_vertex in explored)
+            explored_roots.add(roots[vertex])
+        explored.append(vertex)
+        rest_of_cell = [other_vertex for other_vertex in cells[target_cell] if other_vertex != vertex]
+        _search(cells[:target_cell]+[[vertex], rest_of_cell]+cells[target_cell+1:], prefix+[vertex], layers, state)
+
+def canonical_labeling(layers, colors=None, automorphisms=None):
+    """
+        layers is a list of adjacency row bitmasks over the same vertices 0..n-1 (one list per edge colour), and colors is an optional vertex colouring that has to be respected.
+        Returns (certificate, order) where order[i] is the vertex that gets canonical label i. Two inputs have the same certificate exactly when they are isomorphic.
+        This is the usual refine-then-individualize search. Swapping twin vertices is always an automorphism, and any two leaves with the same certificate give another one, so branches in the same orbit as an explored branch are skipped.
+        If automorphisms is a list, every automorphism found along the way is appended to it (as a list mapping vertex -> image). They are genuine automorphisms, but not necessarily a generating set.
+    """
+    number_of_vertices = len(layers[0]) if layers else 0
+    if number_of_vertices == 0:
+        return (), []
+    if colors == None:
+        colors = [0]*number_of_vertices
+    initial_cells = dict()
+    for vertex in range(number_of_vertices):
+        initial_cells.setdefault((colors[vertex],)+tuple(rows[vertex].bit_count() for rows in layers), []).append(vertex)
+    if automorphisms == None:
+        automorphisms = []
+    state = {"first":(None, None), "best":(None, None), "automorphisms":automorphisms}
+    _search([initial_cells[key] for key in sorted(initial_cells)], [], layers, state)
+    order, certificate = state["best"]
+    return certificate, order
+
+def rows_canonical_form(rows):
+    certificate, order = canonical_labeling([rows])
+    return encode_rows(list(certificate))
+
+def canonical_form(graph):
+    """
+        Returns the graph6 bytes (no header, no newline) of a canonical relabeling of graph, so two graphs are isomorphic exactly when their canonical forms are equal.
+    """
+    vertices, rows = _adjacency_rows(graph)
+    return rows_canonical_form(rows)
+
+def rows_invariant(rows):
+    degrees = sorted(row.bit_count() for row in rows)
+    return (len(rows), sum(degrees)//2, tuple(degrees))
+
+def invariant(graph):
+    return rows_invariant(_adjacency_rows(graph)[1])
+
+class CanonicalIndex:
+    """
+        Hash-map index of isomorphism classes.
+        Graphs are bucketed by cheap invariants first, and a canonical form is only computed once a second graph lands in the same bucket, so most lookups never pay for the search.
+        Graphs can be given either as networkx graphs or as adjacency row bitmasks (the *_rows methods); representatives keeps whatever was handed in for each class.
+    """
+    def __init__(self):
+        self._buckets = dict()
+        self._unresolved = dict()
+        self.representatives = []
+
+    def __len__(self):
+        return len(self.representatives)
+
+    def __contains__(self, graph):
+        return self.lookup(graph) != None
+
+    def _resolve(self, key):
+        if key in self._unresolved:
+            class_id, rows = self._unresolved.pop(key)
+            self._buckets[key] = {rows_canonical_form(rows):class_id}
+        return self._buckets.get(key)
+
+    def lookup_rows(self, rows):
+        bucket = self._resolve(rows_invariant(rows))
+        if bucket == None:
+            return None
+        return bucket.get(rows_canonical_form(rows))
+
+    def add_rows(self, rows, representative=None):
+        """
+            Returns (class_id, is_new).
+        """
+        key = rows_invariant(rows)
+        bucket = self._resolve(key)
+        if representative == None:
+            representative = rows
+        if bucket == None:
+            class_id = len(self.representatives)
+            self.representatives.append(representative)
+            self._unresolved[key] = (class_id, rows)
+            return class_id, True
+        form = rows_canonical_form(rows)
+        if form in bucket:
+            return bucket[form], False
+        class_id = len(self.representatives)
+        self.representatives.append(representative)
+        bucket[form] = class_id
+        return class_id, True
+
+    def lookup(self, graph):
+        return self.lookup_rows(_adjacency_rows(graph)[1])
+
+    def add(self, graph):
+        return self.add_rows(_adjacency_rows(graph)[1], graph)
@@ -0,0 +1,116 @@
+"""
+    The command line entry point.
+
+        python cli.py sweep "C_4..12" "K_1..8,1..8" --max-vertices 9
+        python cli.py sweep K_6 --events events.jsonl --profile Profiles
+        python cli.py shard K_7 --shards 16
+        python cli.py query K_6 K_3 C_4 Bw
+"""
+import argparse
+import sys
+import matplotlib
+matplotlib.use("Agg")
+import graphcache
+import instrument
+import query
+import shard
+import sweep
+import DownArrowRamseySetGenerator as generator
+from workerpool import WorkerPool
+
+def _budget(options):
+    if options.time_budget == None and options.coloring_budget == None:
+        return None
+    return {"time_budget":options.time_budget, "coloring_budget":options.coloring_budget, "checkpoint_seconds":options.checkpoint_seconds}
+
+def _sweep(options):
+    rows = sweep.sweep(options.hosts, options.workers, options.chunksize, options.memory_budget, None if options.no_cache else options.cache, options.max_vertices, options.draw, options.summary, not options.no_stream, _budget(options))
+    print(sweep.format_table(rows))
+    return 1 if any(row["status"].startswith("failed") for row in rows) else 0
+
+def _shard(options):
+    cache_path = None if options.no_cache else options.cache
+    if options.merge:
+        for manifest in shard.merge(options.host, options.stage, options.shards):
+            print(f"shard {manifest['shard']}: {manifest['records']} records from {manifest['node']} in {manifest['seconds']}s")
+    elif options.shard != None:
+        with WorkerPool(options.workers, options.chunksize, generator._init_worker, (options.host,), options.memory_budget) as pool:
+            shard.prepare(options.host, pool, cache_path)
+            manifest = shard.run_shard(options.host, options.stage, options.shard, options.shards, pool, options.node)
+        shard.write_manifest(manifest)
+        print(f"shard {manifest['shard']} of {manifest['shards']}: {manifest['records']} records in {manifest['seconds']}s")
+    else:
+        finished = shard.run_node(options.host, options.stage, options.shards, options.node, options.lease_seconds, options.workers, options.chunksize, options.memory_budget, cache_path)
+        print(f"finished shards {', '.join(str(manifest['shard']) for manifest in finished) or 'none'} of {options.shards}")
+    return 0
+
+def _query(options):
+    for answer in query.query(options.host, options.graphs, options.time_limit, not options.search):
+        if answer["member"] == None:
+            verdict = f"unknown (gave up after {options.time_limit}s)"
+        elif answer["member"]:
+            verdict = "in"
+        else:
+            verdict = "not in"
+        print(f"{answer['graph']}: {verdict} the down-arrow Ramsey set of {options.host} ({answer['source']}, {answer['seconds']}s)")
+        if answer["witness"] != None:
+            print(f"    red: {answer['witness'][0]}")
+            print(f"    blue: {answer['witness'][1]}")
+    return 0
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Down-arrow Ramsey sets of graphs.")
+    parser.add_argument("--events", help="log stage timers, counters and progress to this file (see instrument.py)")
+    parser.add_argument("--profile", help="profile every stage and worker into this directory (see profiling.py), needs --events")
+    parser.add_argument("--quiet", action="store_true", help="with --events, only log the messages instead of printing them too")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    sweep_parser = subcommands.add_parser("sweep", help="make the down-arrow Ramsey sets and ideals of many hosts, smallest first, over one worker pool")
+    sweep_parser.add_argument("hosts", nargs="+", help='host names or patterns, where a..b is a range of numbers ("C_4..12", "K_1..8,1..8")')
+    sweep_parser.add_argument("--max-vertices", type=int, help="leave out hosts with more vertices than this")
+    sweep_parser.add_argument("--workers", type=int, help="worker processes (default: one less than the number of CPUs)")
+    sweep_parser.add_argument("--chunksize", type=int, default=64, help="red classes per coloring task")
+    sweep_parser.add_argument("--memory-budget", type=int, default=2**26, help="bytes of colorings each worker holds at once")
+    sweep_parser.add_argument("--cache", default=graphcache.DEFAULT_PATH, help="the cache of classes and monomorphism answers shared by every host")
+    sweep_parser.add_argument("--no-cache", action="store_true", help="do not use the cache")
+    sweep_parser.add_argument("--no-stream", action="store_true", help="write the Red-Blue Colorings store and intersect it afterwards, instead of intersecting the colorings as they are made")
+    sweep_parser.add_argument("--time-budget", type=float, help="seconds each host gets to intersect its colorings, after which it is left with an upper bound of its down-arrow Ramsey set that the next sweep refines")
+    sweep_parser.add_argument("--coloring-budget", type=int, help="like --time-budget, but a number of colorings")
+    sweep_parser.add_argument("--checkpoint-seconds", type=float, default=60, help="with a budget, how often to write the upper bound and checkpoint to disk")
+    sweep_parser.add_argument("--draw", action="store_true", help="draw the ideals of every host")
+    sweep_parser.add_argument("--summary", default=sweep.SUMMARY_PATH, help="where to write the summary table (CSV)")
+    sweep_parser.set_defaults(function=_sweep)
+
+    shard_parser = subcommands.add_parser("shard", help="run the colorings of one host as shards, on any number of machines that share the Graphs directory")
+    shard_parser.add_argument("host")
+    shard_parser.add_argument("--shards", type=int, default=16, help="how many shards the work is split into (the same on every node)")
+    shard_parser.add_argument("--stage", choices=shard.STAGES, default="stream", help="stream makes the down-arrow Ramsey set, colorings makes the Red-Blue Colorings store")
+    shard_parser.add_argument("--shard", type=int, help="run only this shard (from 0) and write its manifest, without the queue")
+    shard_parser.add_argument("--merge", action="store_true", help="only merge the finished shards")
+    shard_parser.add_argument("--node", help="this node's name in the queue (default: host name and process ID)")
+    shard_parser.add_argument("--lease-seconds", type=float, default=300, help="how long a node can go silent before its work is taken over")
+    shard_parser.add_argument("--workers", type=int, help="worker processes on this node (default: one less than the number of CPUs)")
+    shard_parser.add_argument("--chunksize", type=int, default=64, help="red classes per task")
+    shard_parser.add_argument("--memory-budget", type=int, default=2**26, help="bytes of colorings each worker holds at once")
+    shard_parser.add_argument("--cache", default=graphcache.DEFAULT_PATH, help="the cache of classes and monomorphism answers")
+    shard_parser.add_argument("--no-cache", action="store_true", help="do not use the cache")
+    shard_parser.set_defaults(function=_shard)
+
+    query_parser = subcommands.add_parser("query", help="is each graph in the down-arrow Ramsey set of host? (a coloring of the host with the graph in neither color is printed when it is not)")
+    query_parser.add_argument("host")
+    query_parser.add_argument("graphs", nargs="+", help="graph names (like C_4) or graph6 strings")
+    query_parser.add_argument("--time-limit", type=float, help="seconds to search for each graph before giving up")
+    query_parser.add_argument("--search", action="store_true", help="search even if the down-arrow Ramsey set of the host is on disk already")
+    query_parser.set_defaults(function=_query)
+
+    options = parser.parse_args(arguments)
+    if options.events != None:
+        instrument.enable(options.events, options.quiet, options.profile)
+    try:
+        return options.function(options)
+    finally:
+        if options.events != None:
+            instrument.disable()
+
+if __name__ == "__main__":
+    sys.exit(main())
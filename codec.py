@@ -0,0 +1,191 @@
+"""
+    graph6 to and from adjacency row bitmasks, edge bitmasks and NumPy adjacency matrices, without building networkx graphs, one graph or a whole batch at a time.
+    An edge bitmask here is over the pairs of vertices in graph6 order, (0,1), (0,2), (1,2), (0,3), ..., so bit k is the k-th bit of the graph6 data and pair (i, j) with i < j is bit j*(j-1)//2+i.
+    Also the Windows-safe file names of graph6 strings (see DownArrowRamseySetGenerator._graph6_bytes_to_file_name), each way in one pass instead of a chain of replaces.
+"""
+import string
+import numpy as np
+
+_pairs = dict()
+
+def pairs(number_of_vertices):
+    """
+        The (i, j) of every bit of an edge bitmask, in order.
+    """
+    if number_of_vertices not in _pairs:
+        _pairs[number_of_vertices] = [(i, j) for j in range(1, number_of_vertices) for i in range(j)]
+    return _pairs[number_of_vertices]
+
+def pair_index(i, j):
+    if i > j:
+        i, j = j, i
+    return j*(j-1)//2+i
+
+def size_bytes(number_of_vertices):
+    if number_of_vertices < 63:
+        return bytes([number_of_vertices+63])
+    if number_of_vertices < 258048:
+        return bytes([126, ((number_of_vertices >> 12) & 63)+63, ((number_of_vertices >> 6) & 63)+63, (number_of_vertices & 63)+63])
+    return bytes([126, 126]+[((number_of_vertices >> shift) & 63)+63 for shift in (30, 24, 18, 12, 6, 0)])
+
+def _split(graph6):
+    """
+        (number of vertices, the data bytes) of a graph6 string, with or without its ">>graph6<<" header and newline.
+    """
+    graph6 = bytes(graph6).strip()
+    if graph6.startswith(b">>graph6<<"):
+        graph6 = graph6[10:]
+    if graph6[0] != 126:
+        return graph6[0]-63, graph6[1:]
+    if graph6[1] != 126:
+        return ((graph6[1]-63) << 12) | ((graph6[2]-63) << 6) | (graph6[3]-63), graph6[4:]
+    number_of_vertices = 0
+    for character in graph6[2:8]:
+        number_of_vertices = (number_of_vertices << 6) | (character-63)
+    return number_of_vertices, graph6[8:]
+
+def decode_mask(graph6):
+    """
+        (number of vertices, edge bitmask).
+    """
+    number_of_vertices, data = _split(graph6)
+    number_of_pairs = number_of_vertices*(number_of_vertices-1)//2
+    if number_of_pairs == 0:
+        return number_of_vertices, 0
+    bits = 0
+    for character in data:
+        bits = (bits << 6) | (character-63)
+    return number_of_vertices, int(f"{bits:0{6*len(data)}b}"[:number_of_pairs][::-1], 2)
+
+def encode_mask(mask, number_of_vertices):
+    number_of_pairs = number_of_vertices*(number_of_vertices-1)//2
+    if number_of_pairs == 0:
+        return size_bytes(number_of_vertices)
+    bits = f"{mask:0{number_of_pairs}b}"[::-1]
+    bits += "0"*(-len(bits) % 6)
+    return size_bytes(number_of_vertices)+bytes(int(bits[start:start+6], 2)+63 for start in range(0, len(bits), 6))
+
+def mask_to_rows(mask, number_of_vertices):
+    rows = [0]*number_of_vertices
+    vertex_pairs = pairs(number_of_vertices)
+    while mask:
+        lowest_bit = mask & -mask
+        i, j = vertex_pairs[lowest_bit.bit_length()-1]
+        rows[i] |= 1 << j
+        rows[j] |= 1 << i
+        mask ^= lowest_bit
+    return rows
+
+def rows_to_mask(rows):
+    mask = 0
+    for j,row in enumerate(rows):
+        row &= (1 << j)-1
+        while row:
+            lowest_bit = row & -row
+            mask |= 1 << (j*(j-1)//2+lowest_bit.bit_length()-1)
+            row ^= lowest_bit
+    return mask
+
+def decode_rows(graph6):
+    """
+        Adjacency row bitmasks, one per vertex (isolated ones included), like canonical.py works with.
+    """
+    number_of_vertices, mask = decode_mask(graph6)
+    return mask_to_rows(mask, number_of_vertices)
+
+def encode_rows(rows):
+    return encode_mask(rows_to_mask(rows), len(rows))
+
+def edges(graph6):
+    number_of_vertices, mask = decode_mask(graph6)
+    vertex_pairs = pairs(number_of_vertices)
+    found = []
+    while mask:
+        lowest_bit = mask & -mask
+        found.append(vertex_pairs[lowest_bit.bit_length()-1])
+        mask ^= lowest_bit
+    return found
+
+def decode_matrix(graph6):
+    """
+        The n x n uint8 adjacency matrix.
+    """
+    return decode_matrices([graph6])[0]
+
+def encode_matrix(matrix):
+    return encode_matrices(np.asarray(matrix)[np.newaxis])[0]
+
+def _graph6_order(number_of_vertices):
+    """
+        The (rows, columns) of the upper triangle in graph6 order, so matrix[rows, columns] is the graph6 bit string.
+    """
+    columns, rows = np.tril_indices(number_of_vertices, -1)
+    return rows, columns
+
+def decode_matrices(lines):
+    """
+        A (k x n x n) uint8 array from k graph6 strings with the same number of vertices, all decoded in one go.
+    """
+    split = [_split(line) for line in lines]
+    if not split:
+        return np.zeros((0, 0, 0), dtype=np.uint8)
+    number_of_vertices = split[0][0]
+    if any(size != number_of_vertices for size,data in split):
+        raise ValueError("decode_matrices needs graphs that all have the same number of vertices")
+    matrices = np.zeros((len(split), number_of_vertices, number_of_vertices), dtype=np.uint8)
+    if number_of_vertices > 1:
+        number_of_pairs = number_of_vertices*(number_of_vertices-1)//2
+        data = np.frombuffer(b"".join(data for size,data in split), dtype=np.uint8).reshape(len(split), -1)-63
+        bits = np.unpackbits(data[:, :, np.newaxis], axis=2)[:, :, 2:].reshape(len(split), -1)[:, :number_of_pairs]
+        rows, columns = _graph6_order(number_of_vertices)
+        matrices[:, rows, columns] = bits
+        matrices |= matrices.transpose(0, 2, 1)
+    return matrices
+
+def encode_matrices(matrices):
+    """
+        The graph6 strings (no header, no newline) of a (k x n x n) stack of adjacency matrices, all encoded in one go.
+    """
+    matrices = np.asarray(matrices)
+    number_of_graphs, number_of_vertices = matrices.shape[0], matrices.shape[1]
+    header = size_bytes(number_of_vertices)
+    if number_of_vertices < 2:
+        return [header]*number_of_graphs
+    rows, columns = _graph6_order(number_of_vertices)
+    bits = (matrices[:, rows, columns] != 0).astype(np.uint8)
+    bits = np.pad(bits, ((0, 0), (0, -bits.shape[1] % 6))).reshape(number_of_graphs, -1, 6)
+    data = np.packbits(np.pad(bits, ((0, 0), (0, 0), (2, 0))), axis=2)[:, :, 0]+63
+    return [header+row.tobytes() for row in data]
+
+_TO_FILE_NAME = [chr(character) for character in range(256)]
+for character,replacement in {"?":"1", "\\":"2", "|":"3", **{letter:f"+{letter.lower()}" for letter in string.ascii_uppercase}}.items():
+    _TO_FILE_NAME[ord(character)] = replacement
+_FROM_FILE_NAME = bytes.maketrans(b"123", b"?\\|")
+
+def to_file_name(graph6):
+    return "".join([_TO_FILE_NAME[character] for character in bytes(graph6).strip()])+".g6"
+
+def from_file_name(file_name):
+    """
+        "+" only ever comes in front of a letter that was upper case, so after the one translation the pieces between the "+"s just get their first letter back.
+    """
+    pieces = file_name.split(".g6")[0].encode().translate(_FROM_FILE_NAME).split(b"+")
+    return b"".join([pieces[0]]+[piece[:1].upper()+piece[1:] for piece in pieces[1:]])
+
+def unescape_name(name):
+    """
+        The graph6 bytes back out of a name that was made with f"{graph6_bytes}" (the "b'...'" repr), like DownArrow.py's poset node names.
+    """
+    return name[2:len(name)-1].encode().replace(b"\\\\", b"\\")
+
+def read_lines(path):
+    """
+        The graph6 strings of a file, one per line (no header, no newline), without decoding them. Unlike nx.read_graph6, a file with one graph still gives a list.
+    """
+    with open(path, "rb") as input_file:
+        return [line.strip() for line in input_file if line.strip()]
+
+def write_lines(path, lines):
+    with open(path, "wb") as output_file:
+        output_file.writelines(line+b"\n" for line in lines)
+    return
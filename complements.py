@@ -0,0 +1,58 @@
+"""
+    Complementing inside the host, as a map between class IDs that is computed once.
+    In a complete host every copy of a class has the same complement, but in general different copies of the red class leave non-isomorphic blue graphs behind (an edge in the middle of P_4 versus one at the end), so the map sends each red class to every blue class it can leave.
+    Those come from one red edge subset per orbit under the host's automorphisms (see orderly.py), so every red-blue coloring of the host is accounted for.
+"""
+import json
+from orderly import edge_subset_orbits, is_complete
+from hasse import class_index, lookup_class
+
+def complement_map(store, index=None):
+    """
+        Returns complements, where complements[red_class_id] is the sorted list of blue class IDs.
+    """
+    host_edges = store.host_edges
+    if index == None:
+        index = class_index(store)
+    if is_complete(host_edges):
+        return [[lookup_class(store, index, host_edges.complement(record.mask))] for record in store]
+    complements = [set() for class_id in range(len(store))]
+    for layer in edge_subset_orbits(host_edges):
+        for mask in layer:
+            complements[lookup_class(store, index, mask)].add(lookup_class(store, index, host_edges.complement(mask)))
+    return [sorted(blue_class_ids) for blue_class_ids in complements]
+
+def monochromatic_star(store, index=None):
+    """
+        The class of the star with ceil(d/2) edges, where d is the largest degree in the host. One colour gets at least half of the edges at a vertex of degree d, so this star is in the union of every coloring.
+        Its down-set is therefore a floor under the down-arrow Ramsey set, and an intersection that has come down to it can stop.
+    """
+    host_edges = store.host_edges
+    if index == None:
+        index = class_index(store)
+    incident_edges = dict()
+    for edge_index,(source,target) in enumerate(host_edges.edges):
+        incident_edges.setdefault(source, []).append(edge_index)
+        incident_edges.setdefault(target, []).append(edge_index)
+    star_edges = max(incident_edges.values(), key=len, default=[])
+    return lookup_class(store, index, sum(1 << edge_index for edge_index in star_edges[:(len(star_edges)+1)//2]))
+
+def save_complement_map(path, complements, names=None, floor=None):
+    """
+        floor is the class ID of monochromatic_star, when the caller wants it kept with the map.
+    """
+    with open(path, "w") as output_file:
+        json.dump({"names":names, "complements":complements, "floor":floor}, output_file)
+    return
+
+def load_complement_map(path):
+    """
+        Returns (complements, names); names is None when the class IDs are all the caller needs.
+    """
+    with open(path, "r") as input_file:
+        saved = json.load(input_file)
+    return saved["complements"], saved["names"]
+
+def load_floor(path):
+    with open(path, "r") as input_file:
+        return json.load(input_file).get("floor")
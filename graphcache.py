@@ -0,0 +1,180 @@
+"""
+    An on-disk cache, shared by every host, of the subgraph classes that have been seen (with the classes each one covers, see hasse.py) and of "pattern embeds in target" answers.
+    Both are keyed by the canonical form (see canonical.py) of the graph with its isolated vertices dropped, so they carry over from one host to the next: every class of K_n is a class of K_{n+1} as well, with the same covers.
+    Dropping isolated vertices is safe for the answers as long as the caller also checks that the pattern has no more vertices than the target, which MonomorphismFilter does.
+    It is one sqlite file (Graphs/cache.sqlite by default), and each table is kept to max_entries rows by throwing out the least recently used ones.
+"""
+import atexit
+import os
+import sqlite3
+import time
+import networkx as nx
+from canonical import canonical_form
+import instrument
+
+DEFAULT_PATH = os.path.join("Graphs", "cache.sqlite")
+
+def form(graph):
+    return canonical_form(nx.Graph(list(graph.edges())))
+
+class GraphCache:
+    """
+        Safe to share between processes: each process opens its own connection the first time it uses the cache, and writes are committed every commit_every of them (and on close).
+        A hit on embeds() only notes the pair, and the last_used of every pair noted since the last commit is brought up to date in one executemany there, like class_covers does for a batch.
+    """
+    def __init__(self, path=DEFAULT_PATH, max_entries=1000000, commit_every=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._process_id = None
+        self._pending = 0
+        self._row_bounds = None
+        self._touched = set()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_process_id"] = None
+        state["_pending"] = 0
+        state["_row_bounds"] = None
+        state["_touched"] = set()
+        return state
+
+    def _connect(self):
+        if self._connection == None or self._process_id != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._process_id = os.getpid()
+            atexit.register(self.close)
+            self._pending = 0
+            self._touched = set()
+            if "covers" not in [column[1] for column in self._connection.execute("PRAGMA table_info(classes)")]:
+                self._connection.execute("DROP TABLE IF EXISTS classes")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS classes (form BLOB PRIMARY KEY, number_of_edges INTEGER, number_of_vertices INTEGER, covers BLOB, last_used REAL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS embeds (pattern BLOB, target BLOB, answer INTEGER, last_used REAL, PRIMARY KEY (pattern, target))")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS classes_last_used ON classes (last_used)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS embeds_last_used ON embeds (last_used)")
+            self._connection.commit()
+            self._row_bounds = {table:self._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("classes", "embeds")}
+        return self._connection
+
+    def _wrote(self, number_of_writes=1, table=None):
+        """
+            table is where the writes may have added rows, for evict.
+        """
+        if table != None:
+            self._row_bounds[table] += number_of_writes
+        self._pending += number_of_writes
+        if self._pending >= self.commit_every:
+            self.commit()
+        return
+
+    def embeds(self, pattern_form, target_form):
+        """
+            True or False when the answer is cached, None when it is not.
+        """
+        connection = self._connect()
+        row = connection.execute("SELECT answer FROM embeds WHERE pattern = ? AND target = ?", (pattern_form, target_form)).fetchone()
+        if row == None:
+            self.misses += 1
+            instrument.count("cache_misses")
+            return None
+        self.hits += 1
+        instrument.count("cache_hits")
+        self._touched.add((pattern_form, target_form))
+        self._wrote()
+        return bool(row[0])
+
+    def record_embeds(self, pattern_form, target_form, answer):
+        self._connect().execute("INSERT OR REPLACE INTO embeds VALUES (?, ?, ?, ?)", (pattern_form, target_form, int(answer), time.time()))
+        self._wrote(1, "embeds")
+        return
+
+    def record_embeds_many(self, answers):
+        """
+            answers is an iterable of (pattern_form, target_form, answer).
+        """
+        now = time.time()
+        rows = [(pattern_form, target_form, int(answer), now) for pattern_form,target_form,answer in answers]
+        self._connect().executemany("INSERT OR REPLACE INTO embeds VALUES (?, ?, ?, ?)", rows)
+        self._wrote(len(rows), "embeds")
+        return
+
+    def class_covers(self, class_forms):
+        """
+            {class_form: [forms of the classes it covers]} for the class_forms that are cached.
+        """
+        connection = self._connect()
+        class_forms = list(class_forms)
+        covers = dict()
+        for start in range(0, len(class_forms), 500):
+            batch = class_forms[start:start+500]
+            for class_form,covered_forms in connection.execute(f"SELECT form, covers FROM classes WHERE form IN ({', '.join('?'*len(batch))})", batch):
+                covers[class_form] = covered_forms.split(b"\n") if covered_forms else []
+        if covers:
+            now = time.time()
+            connection.executemany("UPDATE classes SET last_used = ? WHERE form = ?", [(now, class_form) for class_form in covers])
+            self._wrote(len(covers))
+        self.hits += len(covers)
+        self.misses += len(class_forms)-len(covers)
+        instrument.count("cache_hits", len(covers))
+        instrument.count("cache_misses", len(class_forms)-len(covers))
+        return covers
+
+    def record_classes(self, classes):
+        """
+            classes is an iterable of (class_form, number_of_edges, number_of_vertices, forms of the classes it covers).
+        """
+        now = time.time()
+        rows = [(class_form, number_of_edges, number_of_vertices, b"\n".join(covered_forms), now) for class_form,number_of_edges,number_of_vertices,covered_forms in classes]
+        self._connect().executemany("INSERT OR REPLACE INTO classes VALUES (?, ?, ?, ?, ?)", rows)
+        self._wrote(len(rows), "classes")
+        return
+
+    def evict(self):
+        """
+            The row counts are only looked up once a table might have gone over max_entries, going by an upper bound that every write adds to (a replaced row counts as an added one).
+        """
+        connection = self._connect()
+        for table in ("classes", "embeds"):
+            if self._row_bounds[table] <= self.max_entries:
+                continue
+            number_of_rows = connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if number_of_rows > self.max_entries:
+                connection.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY last_used LIMIT ?)", (number_of_rows-self.max_entries,))
+            self._row_bounds[table] = min(number_of_rows, self.max_entries)
+        return
+
+    def _touch(self):
+        """
+            The embeds() hits since the last commit, marked as used now, before evict can throw them out.
+        """
+        if self._touched:
+            now = time.time()
+            self._connection.executemany("UPDATE embeds SET last_used = ? WHERE pattern = ? AND target = ?", [(now, pattern_form, target_form) for pattern_form,target_form in self._touched])
+            self._touched = set()
+        return
+
+    def commit(self):
+        if self._connection != None and self._process_id == os.getpid():
+            self._touch()
+            self.evict()
+            self._connection.commit()
+            self._pending = 0
+        return
+
+    def close(self):
+        if self._connection != None and self._process_id == os.getpid():
+            self.commit()
+            self._connection.close()
+        self._connection = None
+        self._process_id = None
+        return
+
+    def summary(self):
+        return f"{self.hits} cached answers used, {self.misses} missed"
@@ -0,0 +1,92 @@
+"""
+    The edge-induced subgraphs of a host, ordered by "is a subgraph of", are graded by the number of edges, and Y is covered by X exactly when Y is X with one edge deleted.
+    So the Hasse diagram comes from deleting each edge of each class and looking the result up, which is about N*m canonical lookups instead of N^2 monomorphism tests.
+    Classes are the integer IDs of a SubgraphStore, and down-sets are int bitsets over those IDs.
+"""
+from canonical import CanonicalIndex, rows_canonical_form
+from prefilter import MonomorphismFilter
+
+def class_index(store):
+    """
+        Canonical index over the classes of a store, built in store order so the index's class IDs are the store's class IDs.
+    """
+    index = CanonicalIndex()
+    for record in store:
+        index.add_rows(store.host_edges.rows(record.mask), record.class_id)
+    return index
+
+def lookup_class(store, index, mask):
+    class_id = index.lookup_rows(store.host_edges.rows(mask))
+    if class_id == None:
+        raise KeyError(f"No class in the store matches the edges {store.host_edges.edges_of(mask)}")
+    return class_id
+
+def hasse_diagram(store, index=None, cache=None):
+    """
+        Returns covers, where covers[class_id] is the set of class IDs that class_id covers.
+        With a graphcache.GraphCache, the covers of a class that an earlier host already had are read from it by canonical form, which is one canonical form per class instead of one lookup per edge, and the rest are added to it.
+    """
+    if index == None:
+        index = class_index(store)
+    forms = None
+    cached = dict()
+    if cache != None:
+        forms = [rows_canonical_form(store.host_edges.rows(record.mask)) for record in store]
+        class_ids = {form:class_id for class_id,form in enumerate(forms)}
+        cached = cache.class_covers(forms)
+    covers = []
+    for record in store:
+        if forms != None and forms[record.class_id] in cached:
+            covers.append(set(class_ids[form] for form in cached[forms[record.class_id]]))
+            continue
+        covered = set()
+        mask = record.mask
+        remaining = mask
+        while remaining:
+            lowest_bit = remaining & -remaining
+            covered.add(lookup_class(store, index, mask ^ lowest_bit))
+            remaining ^= lowest_bit
+        covers.append(covered)
+    if cache != None:
+        cache.record_classes((forms[record.class_id], record.number_of_edges, len(store.host_edges.rows(record.mask)), [forms[covered] for covered in covers[record.class_id]]) for record in store if forms[record.class_id] not in cached)
+        cache.commit()
+    return covers
+
+def down_sets(covers, edge_counts):
+    """
+        Transitive closure over the class IDs: down_set[class_id] has bit i set when class i is a subgraph of class_id (itself included).
+    """
+    down_set = [0]*len(covers)
+    for class_id in sorted(range(len(covers)), key=lambda class_id:edge_counts[class_id]):
+        bits = 1 << class_id
+        for covered in covers[class_id]:
+            bits |= down_set[covered]
+        down_set[class_id] = bits
+    return down_set
+
+def members(bits):
+    class_ids = []
+    while bits:
+        lowest_bit = bits & -bits
+        class_ids.append(lowest_bit.bit_length()-1)
+        bits ^= lowest_bit
+    return class_ids
+
+def make_down_sets(store):
+    return down_sets(hasse_diagram(store), store.edge_counts)
+
+def verify_down_sets(store, down_set, cache=None):
+    """
+        The old all-pairs check, kept as an optional verification mode: runs a monomorphism test for every ordered pair of classes and raises ValueError at the first disagreement.
+        A graphcache.GraphCache is checked before each matcher call.
+    """
+    graphs = [store.graph(class_id) for class_id in range(len(store))]
+    monomorphism_filter = MonomorphismFilter(cache)
+    for target_id,target in enumerate(graphs):
+        for source_id,source in enumerate(graphs):
+            expected = monomorphism_filter.is_monomorphic(target, source, target_id, source_id)
+            if expected != bool((down_set[target_id] >> source_id) & 1):
+                raise ValueError(f"The down-set of class {target_id} disagrees with the matcher about class {source_id}")
+    if cache != None:
+        cache.commit()
+    return True
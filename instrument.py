@@ -0,0 +1,261 @@
+"""
+    Stage timers, counters, progress and a JSON lines event log, in the parent process and in the workers of a WorkerPool alike.
+    It is off until enable() is called (or until the DOWN_ARROW_EVENTS environment variable names a log file), and while it is off every call returns after checking one flag, so it can stay in the hot paths.
+    message() stands in for print: the text is printed like before (unless quiet) and, when enabled, logged as well.
+    Workers write to their own "{path}.{pid}" file and count what they do against the stage that sent them the task. WorkerPool.close() calls collect(), which adds those files to the parent's log and its stage totals.
+    With profile set to a directory, every stage is also run under cProfile, in the parent and in each worker, and disable() merges the profiles into one report per stage (see profiling.py).
+
+        instrument.enable("events.jsonl", profile="Profiles")
+        make_down_arrow_ramsey_set_ideals("K_6")
+        print(instrument.summary())
+"""
+import atexit
+import collections
+import functools
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing import util
+import profiling
+
+_enabled = False
+_quiet = False
+_path = None
+_owner = None
+_profile = None
+_process_id = None
+_file = None
+_stack = []
+_stages = dict()
+_task_stage = None
+
+def enable(path="events.jsonl", quiet=False, profile=None):
+    """
+        The process that calls this is the parent: its events go to path, and it is the one that collects the workers' files.
+        profile is the directory for the profiles, None to leave profiling off.
+    """
+    global _enabled, _quiet, _path, _owner, _profile
+    disable()
+    _enabled, _quiet, _path, _owner, _profile = True, quiet, path, os.getpid(), profile
+    _stages.clear()
+    atexit.register(disable)
+    return
+
+def disable():
+    """
+        Collects the workers' files, logs the totals and closes the log.
+    """
+    global _enabled, _file, _process_id
+    if _enabled and os.getpid() == _owner:
+        collect()
+        event("report", stages=report())
+        if _profile != None:
+            profiling.dump(_profile)
+            event("profiles", stages=profiling.merge(_profile))
+    if _file != None and _process_id == os.getpid():
+        _file.close()
+    _enabled, _file, _process_id = False, None, None
+    return
+
+def enabled():
+    return _enabled
+
+def settings():
+    return (_enabled, _quiet, _path, _owner, _profile)
+
+def configure(settings):
+    """
+        For workers that do not inherit the parent's globals (the spawn start method), see workerpool._init_worker.
+    """
+    global _enabled, _quiet, _path, _owner, _profile
+    _enabled, _quiet, _path, _owner, _profile = settings
+    profiling.reset()
+    return
+
+def _ensure_process():
+    """
+        A forked worker starts with a copy of its parent's stages and log file, so the first time it records anything it starts over with its own.
+    """
+    global _process_id, _file
+    if _process_id != os.getpid():
+        _stages.clear()
+        _stack.clear()
+        profiling.reset()
+        _process_id = os.getpid()
+        if _process_id == _owner:
+            _file = open(_path, "a", buffering=1)
+        else:
+            _file = open(f"{_path}.{_process_id}", "a", buffering=1)
+            util.Finalize(None, _flush_worker, exitpriority=10)
+    return
+
+def _flush_worker():
+    event("worker_totals", stages=report())
+    _file.close()
+    if _profile != None:
+        profiling.dump(_profile)
+    return
+
+def event(name, **fields):
+    if not _enabled:
+        return
+    _ensure_process()
+    _file.write(json.dumps({"time":time.time(), "process":os.getpid(), "event":name, **fields}, default=str)+"\n")
+    return
+
+def message(text, **fields):
+    if not _quiet:
+        print(text)
+    if _enabled:
+        event("message", text=text, stage=current_stage(), **fields)
+    return
+
+def current_stage():
+    if _task_stage != None:
+        return _task_stage
+    return _stack[-1] if _stack else None
+
+def _totals(stage_name):
+    _ensure_process()
+    if stage_name not in _stages:
+        _stages[stage_name] = {"wall_time":0.0, "cpu_time":0.0, "calls":0, "counters":collections.Counter()}
+    return _stages[stage_name]
+
+def count(name, amount=1):
+    if _enabled:
+        _totals(current_stage())["counters"][name] += amount
+    return
+
+class stage:
+    """
+        with instrument.stage("poset", host=graph_name): ... times the block, and whatever is counted inside it (by the workers too) goes to that stage.
+    """
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self._started = None
+
+    def __enter__(self):
+        if _enabled:
+            _ensure_process()
+            _stack.append(self.name)
+            self._started = (time.perf_counter(), time.process_time())
+            event("stage_start", stage=self.name, **self.fields)
+            if _profile != None:
+                profiling.start(self.name)
+        return self
+
+    def __exit__(self, *exception):
+        if self._started != None and _enabled:
+            if _profile != None:
+                profiling.stop()
+            wall_time = time.perf_counter()-self._started[0]
+            cpu_time = time.process_time()-self._started[1]
+            if _stack and _stack[-1] == self.name:
+                _stack.pop()
+            totals = _totals(self.name)
+            totals["wall_time"] += wall_time
+            totals["cpu_time"] += cpu_time
+            totals["calls"] += 1
+            event("stage_end", stage=self.name, wall_time=wall_time, cpu_time=cpu_time, error=None if exception[0] == None else repr(exception[1]), **self.fields)
+        return False
+
+def _run_task(function, stage_name, task):
+    global _task_stage
+    _ensure_process()
+    _task_stage = stage_name
+    cpu_time = time.process_time()
+    if _profile != None:
+        profiling.start(stage_name)
+    try:
+        return function(task)
+    finally:
+        if _profile != None:
+            profiling.stop()
+        counters = _totals(stage_name)["counters"]
+        counters["tasks"] += 1
+        counters["worker_cpu_time"] += time.process_time()-cpu_time
+        _task_stage = None
+
+def task(function):
+    """
+        The function a WorkerPool hands to its workers: function itself when this is off, otherwise function tagged with the current stage.
+    """
+    if not _enabled:
+        return function
+    return functools.partial(_run_task, function, current_stage())
+
+def progress(items, total=None, name=None, interval=5.0):
+    """
+        Yields items unchanged. When this is on, every interval seconds (and at the end) it logs and prints how many are done, how many a second and how long is left.
+    """
+    if not _enabled:
+        return items
+    if total == None and hasattr(items, "__len__"):
+        total = len(items)
+    return _progress(items, total, current_stage() if name == None else name, interval)
+
+def _progress(items, total, name, interval):
+    started = time.perf_counter()
+    last_report = started
+    done = 0
+    for item in items:
+        yield item
+        done += 1
+        now = time.perf_counter()
+        if now-last_report >= interval or done == total:
+            rate = done/(now-started) if now > started else None
+            left = (total-done)/rate if rate and total != None else None
+            event("progress", stage=name, done=done, total=total, rate=rate, seconds_left=left)
+            if not _quiet:
+                print(f"{name}: {done}{'' if total == None else f'/{total}'} done" + ("" if rate == None else f", {rate:.1f}/s") + ("" if left == None else f", {left:.0f}s left"))
+            last_report = now
+
+def collect():
+    """
+        Moves the events of finished workers into the parent's log and adds their counters to its stages. Only the parent does anything here.
+    """
+    if not _enabled or os.getpid() != _owner:
+        return
+    _ensure_process()
+    directory = os.path.dirname(_path) or "."
+    prefix = f"{os.path.basename(_path)}."
+    for file_name in sorted(os.listdir(directory)):
+        if not (file_name.startswith(prefix) and file_name[len(prefix):].isdigit()):
+            continue
+        worker_path = os.path.join(directory, file_name)
+        with open(worker_path) as worker_file:
+            for line in worker_file:
+                record = json.loads(line)
+                if record["event"] == "worker_totals":
+                    for stage_name,worker_totals in record["stages"].items():
+                        _totals(None if stage_name == "null" else stage_name)["counters"].update(worker_totals["counters"])
+                _file.write(line)
+        os.remove(worker_path)
+    return
+
+def report():
+    """
+        {stage: {"wall_time", "cpu_time", "calls", "counters"}}, for this process (and its workers, once collect has run). Work done outside any stage is under None.
+    """
+    return {stage_name:{**totals, "counters":dict(totals["counters"])} for stage_name,totals in _stages.items()}
+
+def totals():
+    """
+        Every counter, summed over the stages.
+    """
+    counters = collections.Counter()
+    for stage_totals in _stages.values():
+        counters.update(stage_totals["counters"])
+    return counters
+
+def summary():
+    lines = []
+    for stage_name,totals in report().items():
+        counters = ", ".join(f"{name} {amount:.2f}" if type(amount) == float else f"{name} {amount}" for name,amount in sorted(totals["counters"].items()))
+        lines.append(f"{stage_name}: {totals['wall_time']:.2f}s wall, {totals['cpu_time']:.2f}s CPU" + (f", {counters}" if counters else ""))
+    return "\n".join(lines)
+
+if os.environ.get("DOWN_ARROW_EVENTS") and multiprocessing.parent_process() == None:
+    enable(os.environ["DOWN_ARROW_EVENTS"], profile=os.environ.get("DOWN_ARROW_PROFILE"))
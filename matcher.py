@@ -0,0 +1,173 @@
+"""
+    Subgraph monomorphisms for small graphs, with the adjacency of each graph as one int bitmask per vertex (like canonical.py), in place of networkx's VF2.
+    The pattern's vertices are matched in a fixed order (most constrained first, each one next to the ones before it where it can be), and the candidates for a vertex are one AND of bitmasks:
+    the target vertices of high enough degree, minus the ones already used, inside the neighbourhood of the image of every earlier neighbour.
+    Isolated pattern vertices are left out of the search, since they can go to any unused target vertex, so only the number of vertices is checked for them.
+    Graphs can be networkx graphs, graph6 bytes or adjacency rows, and Pattern / Target compile one once for when it is tested many times (see the batch functions at the bottom).
+    test_matcher.py checks it against networkx on random pairs of graphs.
+"""
+import networkx as nx
+from canonical import _adjacency_rows
+import codec
+
+def _vertices_and_rows(graph):
+    if isinstance(graph, (bytes, bytearray, memoryview)):
+        rows = codec.decode_rows(graph)
+        return list(range(len(rows))), rows
+    if isinstance(graph, (list, tuple)):
+        return list(range(len(graph))), list(graph)
+    return _adjacency_rows(graph)
+
+class Pattern:
+    """
+        order is the matching order (positions into rows), and back[k] is the bitmask of the earlier positions that order[k] is adjacent to.
+        first is a list of (non-isolated) positions to put at the front of the order, for searches that fix where they go (see is_monomorphic).
+    """
+    __slots__ = ("vertices", "rows", "number_of_vertices", "number_of_edges", "order", "degrees", "back")
+
+    def __init__(self, graph, first=()):
+        self.vertices, self.rows = _vertices_and_rows(graph)
+        self.number_of_vertices = len(self.rows)
+        self.number_of_edges = sum(row.bit_count() for row in self.rows)//2
+        self.order = list(first)
+        unplaced = {vertex for vertex,row in enumerate(self.rows) if row and vertex not in first}
+        placed = sum(1 << vertex for vertex in first)
+        while unplaced:
+            vertex = max(unplaced, key=lambda vertex:((self.rows[vertex] & placed).bit_count(), self.rows[vertex].bit_count(), -vertex))
+            self.order.append(vertex)
+            unplaced.remove(vertex)
+            placed |= 1 << vertex
+        position = {vertex:index for index,vertex in enumerate(self.order)}
+        self.degrees = [self.rows[vertex].bit_count() for vertex in self.order]
+        self.back = []
+        for index,vertex in enumerate(self.order):
+            back = 0
+            for earlier in self.order[:index]:
+                if (self.rows[vertex] >> earlier) & 1:
+                    back |= 1 << position[earlier]
+            self.back.append(back)
+
+class Target:
+    """
+        at_least[d] is the bitmask of the vertices of degree at least d.
+    """
+    __slots__ = ("vertices", "rows", "number_of_vertices", "number_of_edges", "at_least", "degrees")
+
+    def __init__(self, graph):
+        self.vertices, self.rows = _vertices_and_rows(graph)
+        self.number_of_vertices = len(self.rows)
+        self.number_of_edges = sum(row.bit_count() for row in self.rows)//2
+        self.degrees = sorted((row.bit_count() for row in self.rows), reverse=True)
+        maximum_degree = self.degrees[0] if self.degrees else 0
+        self.at_least = [0]*(maximum_degree+2)
+        for vertex,row in enumerate(self.rows):
+            for degree in range(row.bit_count()+1):
+                self.at_least[degree] |= 1 << vertex
+
+def _pattern(graph):
+    return graph if isinstance(graph, Pattern) else Pattern(graph)
+
+def _target(graph):
+    return graph if isinstance(graph, Target) else Target(graph)
+
+def _fits(pattern, target):
+    if pattern.number_of_vertices > target.number_of_vertices or pattern.number_of_edges > target.number_of_edges:
+        return False
+    pattern_degrees = sorted(pattern.degrees, reverse=True)
+    return all(pattern_degree <= target_degree for pattern_degree,target_degree in zip(pattern_degrees, target.degrees))
+
+def _search(pattern, target, fixed=()):
+    """
+        Yields the image of pattern.order[k] for every k, one list per monomorphism, on the same list object (copy it to keep it).
+        fixed[k] (a target position) is the only image allowed for pattern.order[k], for the first len(fixed) of them.
+    """
+    if not _fits(pattern, target):
+        return
+    depth = len(pattern.order)
+    if depth == 0:
+        yield []
+        return
+    at_least = target.at_least
+    rows = target.rows
+    degrees = pattern.degrees
+    back = pattern.back
+    images = [0]*depth
+    candidates = [0]*depth
+    candidates[0] = at_least[degrees[0]]
+    if fixed:
+        candidates[0] &= 1 << fixed[0]
+    used = 0
+    level = 0
+    while level >= 0:
+        if level < depth and candidates[level]:
+            lowest_bit = candidates[level] & -candidates[level]
+            candidates[level] ^= lowest_bit
+            images[level] = lowest_bit.bit_length()-1
+            if level+1 == depth:
+                yield images
+                continue
+            used |= lowest_bit
+            level += 1
+            if degrees[level] >= len(at_least):
+                candidates[level] = 0
+                continue
+            allowed = at_least[degrees[level]] & ~used
+            if level < len(fixed):
+                allowed &= 1 << fixed[level]
+            earlier = back[level]
+            while earlier and allowed:
+                earlier_bit = earlier & -earlier
+                allowed &= rows[images[earlier_bit.bit_length()-1]]
+                earlier ^= earlier_bit
+            candidates[level] = allowed
+        else:
+            level -= 1
+            if level >= 0:
+                used &= ~(1 << images[level])
+    return
+
+def is_monomorphic(target, pattern, fixed=()):
+    """
+        Same argument order as GraphMatcher(target, pattern).subgraph_is_monomorphic().
+        fixed pins the first vertices of the pattern's order (see Pattern's first) to those target positions, so for example Pattern(G, (a, b)) with fixed=(u, v) asks for a copy of G in which the edge ab lands on uv.
+    """
+    for images in _search(_pattern(pattern), _target(target), fixed):
+        return True
+    return False
+
+def monomorphisms(target, pattern):
+    """
+        Every monomorphism as a dict from target vertex to pattern vertex, like GraphMatcher(target, pattern).subgraph_monomorphisms_iter() (so also in the vertex labels of the graphs).
+        The isolated vertices of the pattern are sent to the lowest unused target vertices, so there is one dict per way of placing the rest.
+    """
+    pattern = _pattern(pattern)
+    target = _target(target)
+    isolated = [vertex for vertex,row in enumerate(pattern.rows) if not row]
+    for images in _search(pattern, target):
+        mapping = {target.vertices[image]:pattern.vertices[vertex] for vertex,image in zip(pattern.order, images)}
+        free = [target_vertex for target_vertex in target.vertices if target_vertex not in mapping]
+        for target_vertex,vertex in zip(free, isolated):
+            mapping[target_vertex] = pattern.vertices[vertex]
+        yield mapping
+
+def monomorphism(target, pattern):
+    """
+        Some monomorphism (see monomorphisms), or None.
+    """
+    for mapping in monomorphisms(target, pattern):
+        return mapping
+    return None
+
+def pattern_in_targets(pattern, targets):
+    """
+        One pattern against many targets, with the pattern compiled once: [is_monomorphic(target, pattern) for target in targets].
+    """
+    pattern = _pattern(pattern)
+    return [is_monomorphic(target, pattern) for target in targets]
+
+def patterns_in_target(patterns, target):
+    """
+        Many patterns against one target, with the target compiled once: [is_monomorphic(target, pattern) for pattern in patterns].
+    """
+    target = _target(target)
+    return [is_monomorphic(target, pattern) for pattern in patterns]
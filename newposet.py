@@ -1,32 +1,35 @@
 import networkx as nx
-import itertools as it
 import matplotlib.pyplot as plt
 
 import os
-import math
 # import pickle
-import tempfile
-import multiprocessing
+import numpy as np
+from orderly import distinct_edge_induced_subgraphs, subgraph_store
+from hasse import make_down_sets, members
+from prefilter import MonomorphismFilter
+from canonical import CanonicalIndex
+from complements import complement_map
+from bitmatrix import DownSetMatrix, intersect_rows, stacked_blocks, row_members, row_size, bits_to_words, number_of_words
+from workerpool import WorkerPool
+from graphcache import GraphCache
+import instrument
+import codec
+from anytime import Anytime
 
-def _edge_induced_subgraph_generator(Graph):
-    for subset_size in range(Graph.number_of_edges()+1):
-        # print("Using", subset_size, "edges")
-        for subset in it.combinations(Graph.edges(),subset_size):
-            edge_subgraph = Graph.edge_subgraph(subset)
-            yield edge_subgraph
+# The filter of monomorphism tests, with the cache of answers shared with every other host (see graphcache.py) when _add_edges_to_poset is given one (see _use_cache)
+_shared_filter = None
+# The decoded node graphs, filled in once per process (by _init_worker in the pool's workers)
+_node_graphs = dict()
+
+def _padded(Edge_induced_subgraph, Graph):
+    subgraph = nx.convert_node_labels_to_integers(Edge_induced_subgraph)
+    while subgraph.number_of_nodes() < Graph.number_of_nodes():
+        subgraph.add_node(max(subgraph.nodes(), default=0)+1)
+    return subgraph
 
 def _distinct_subgraph_generator_list(Graph):
-    distinct_edge_induced_subgraphs = list()
-    for edge_induced_subgraph in _edge_induced_subgraph_generator(Graph):
-        for distinct_edge_induced_subgraph in distinct_edge_induced_subgraphs:
-            if nx.is_isomorphic(edge_induced_subgraph,distinct_edge_induced_subgraph):
-                break
-        else:
-            distinct_edge_induced_subgraphs.append(edge_induced_subgraph)
-            subgraph = edge_induced_subgraph.copy()
-            while subgraph.number_of_nodes() < Graph.number_of_nodes():
-                subgraph.add_node(max(subgraph.nodes(), default=0)+1)
-            yield subgraph
+    for edge_induced_subgraph in distinct_edge_induced_subgraphs(Graph):
+        yield _padded(edge_induced_subgraph, Graph)
 
 # def _read_graph6(Path):
 #     for graph in nx.read_graph6(Path):
@@ -48,6 +51,23 @@ def _distinct_subgraph_generator_list(Graph):
 #                 tmp.write(nx.to_graph6_bytes(edge_induced_subgraph, header=False))
 #                 yield edge_induced_subgraph
                 
+def _monomorphism_filter():
+    global _shared_filter
+    if _shared_filter == None:
+        _shared_filter = MonomorphismFilter()
+    return _shared_filter
+
+def _use_cache(Cache_path):
+#     A fresh filter, checking the cache at Cache_path before the matcher, or nothing but the invariants when it is None
+    global _shared_filter
+    _shared_filter = MonomorphismFilter(None if Cache_path == None else GraphCache(Cache_path))
+    return _shared_filter
+
+def _commit_cache():
+    if _monomorphism_filter().cache != None:
+        _monomorphism_filter().cache.commit()
+    return
+
 def needs_edge(Poset_graph, Edge):
     source_node, target_node = Edge
     if (source_node, target_node) in Poset_graph.edges():
@@ -57,95 +77,207 @@ def needs_edge(Poset_graph, Edge):
     else:
         source_graph = nx.from_graph6_bytes(Poset_graph.nodes[source_node]["graph6_bytes"])
         target_graph = nx.from_graph6_bytes(Poset_graph.nodes[target_node]["graph6_bytes"])
-        if nx.algorithms.isomorphism.GraphMatcher(target_graph, source_graph).subgraph_is_monomorphic():
+        if _monomorphism_filter().is_monomorphic(target_graph, source_graph, target_node, source_node):
             return True, (source_node, target_node)
-        elif nx.algorithms.isomorphism.GraphMatcher(source_graph, target_graph).subgraph_is_monomorphic():
+        elif _monomorphism_filter().is_monomorphic(source_graph, target_graph, source_node, target_node):
             return True, (target_node, source_node)
         else:
             return False, (None, None)
 
+def _may_be_related(Poset_graph, Source_node, Target_node):
+#     The invariant filter is run here in the parent as well, so that pairs that cannot be related are never shipped to the pool (and so that its counters are the parent's)
+    source_graph = _node_graph(Poset_graph, Source_node)
+    target_graph = _node_graph(Poset_graph, Target_node)
+    return _monomorphism_filter().may_embed(target_graph, source_graph, Target_node, Source_node) or _monomorphism_filter().may_embed(source_graph, target_graph, Source_node, Target_node)
+
+def _node_graph(Poset_graph, Node):
+    if Node not in _node_graphs:
+        _node_graphs[Node] = nx.from_graph6_bytes(Poset_graph.nodes[Node]["graph6_bytes"])
+    return _node_graphs[Node]
+
+def _init_worker(Nodes, Cache_path=None):
+#     Nodes maps each node to its graph6 bytes, so the poset is sent to each worker once and decoded once
+    _node_graphs.clear()
+    _use_cache(Cache_path)
+    for node,graph6_bytes in Nodes.items():
+        _node_graphs[node] = nx.from_graph6_bytes(graph6_bytes)
+    return
+
+def _related_pairs(Pairs):
+#     Pairs is a batch of node IDs, and the edges that the poset needs between them come back
+    edges = []
+    for source_node,target_node in Pairs:
+        source_graph = _node_graphs[source_node]
+        target_graph = _node_graphs[target_node]
+        if _monomorphism_filter().is_monomorphic(target_graph, source_graph, target_node, source_node):
+            edges.append((source_node, target_node))
+        elif _monomorphism_filter().is_monomorphic(source_graph, target_graph, source_node, target_node):
+            edges.append((target_node, source_node))
+    _commit_cache()
+    return edges
+
 def _seed_poset(Host_graph):
-    print("Determining the unique subgraphs")
+    instrument.message("Determining the unique subgraphs")
     poset_graph = nx.DiGraph()
     [poset_graph.add_node(poset_graph.number_of_nodes(), graph6_bytes = nx.to_graph6_bytes(graph, header=False).strip()) for graph in _distinct_subgraph_generator_list(Host_graph)]
     return poset_graph
 
-def _add_edges_to_poset(Poset_graph):
-    print("Determining the poset structure")
-    with multiprocessing.Pool() as pool:
-        for x in range(1,math.ceil(Poset_graph.number_of_nodes()/2),1):
+def _add_edges_to_poset(Poset_graph, Num_workers=None, Batch_size=256, Cache_path=None):
+#     Pass x checks the pairs of nodes x apart, and a pair that the transitive closure of the earlier passes already relates is never sent out
+#     Cache_path is the cache of monomorphism answers (see graphcache.py) that the parent and the workers check, and None leaves it out
+    instrument.message("Determining the poset structure")
+    _node_graphs.clear()
+    _use_cache(Cache_path)
+    nodes = {node:Poset_graph.nodes[node]["graph6_bytes"] for node in Poset_graph.nodes()}
+    with instrument.stage("poset"), WorkerPool(Num_workers, Batch_size, _init_worker, (nodes, Cache_path)) as pool:
+        for x in instrument.progress(range(1,Poset_graph.number_of_nodes()//2+1,1)):
             seed_graph = nx.circulant_graph(Poset_graph.number_of_nodes(), (x,))
-            arguments = zip(it.repeat(Poset_graph), seed_graph.edges())
-            for truth_value, edge in pool.starmap(needs_edge, arguments):
-                if truth_value:
-                    Poset_graph.add_edge(*edge)
-            print(f"pass {x}", Poset_graph, nx.transitive_closure(Poset_graph))
+            pairs = [edge for edge in seed_graph.edges() if not Poset_graph.has_edge(*edge) and not Poset_graph.has_edge(*reversed(edge)) and _may_be_related(Poset_graph, *edge)]
+            for edges in pool.imap(_related_pairs, pool.chunks(pairs)):
+                Poset_graph.add_edges_from(edges)
             Poset_graph = nx.transitive_closure(Poset_graph)
+            instrument.message(f"pass {x} {Poset_graph} ({len(pairs)} pairs checked, {_monomorphism_filter().summary()})", pass_number=x, pairs=len(pairs), edges=Poset_graph.number_of_edges())
+    _commit_cache()
     return Poset_graph
 
 def make_poset(Host_graph):
-    empty_poset = _seed_poset(Host_graph)
-    poset = _add_edges_to_poset(empty_poset)
-    return poset
+#     The nodes are the class IDs of the subgraph store, and the cover relations come from deleting one edge at a time (see hasse.py), so the poset is just the transitive closure of that
+    with instrument.stage("subgraphs"):
+        instrument.message("Determining the unique subgraphs")
+        store = subgraph_store(Host_graph)
+        poset_graph = nx.DiGraph()
+        [poset_graph.add_node(record.class_id, graph6_bytes = nx.to_graph6_bytes(_padded(store.graph(record.class_id), Host_graph), header=False).strip()) for record in store]
+    with instrument.stage("poset"):
+        for red_node,blue_nodes in enumerate(complement_map(store)):
+            poset_graph.nodes[red_node]["complement_nodes"] = blue_nodes
+        instrument.message("Determining the poset structure")
+        for target_node,down_set in enumerate(make_down_sets(store)):
+            poset_graph.add_edges_from((source_node, target_node) for source_node in members(down_set) if source_node != target_node)
+    return poset_graph
+
+def _node_index(Poset_graph):
+#     Built once per poset and kept in the graph attributes, so every lookup after the first is a single canonical form
+    if "node_index" not in Poset_graph.graph:
+        index = CanonicalIndex()
+        nodes = []
+        for node in Poset_graph.nodes():
+            class_id, is_new = index.add_rows(codec.decode_rows(Poset_graph.nodes[node]["graph6_bytes"]))
+            if is_new:
+                nodes.append(node)
+        Poset_graph.graph["node_index"] = (index, nodes)
+    return Poset_graph.graph["node_index"]
 
 def isomorphic_node(Poset_graph, Target_graph):
-    for node in Poset_graph.nodes():
-        if nx.is_isomorphic(Target_graph, nx.from_graph6_bytes(Poset_graph.nodes[node]["graph6_bytes"])):
-            return node
+    index, nodes = _node_index(Poset_graph)
+    class_id = index.lookup(Target_graph)
+    if class_id != None:
+        return nodes[class_id]
 
 
-def complement_node(Poset_graph, Source_node):
+def complement_nodes(Poset_graph, Source_node):
+#     Every blue node that a red Source_node can leave behind in the host (see complements.py), which make_poset works out for each node
+#     A poset without them (from _add_edges_to_poset) is of a complete host, where the complement of the padded graph is the only one
+    if "complement_nodes" in Poset_graph.nodes[Source_node]:
+        return Poset_graph.nodes[Source_node]["complement_nodes"]
     source_graph = nx.from_graph6_bytes(Poset_graph.nodes[Source_node]["graph6_bytes"])
-    target_graph = nx.complement(source_graph)
-    target_node = isomorphic_node(Poset_graph, target_graph)
-    return target_node
+    target_node = isomorphic_node(Poset_graph, nx.complement(source_graph))
+    if target_node == None:
+        return []
+    return [target_node]
+
+def _down_set_bits(Poset_graph, Position, Node):
+#     The node itself is in its down-set, but the poset has no loops, so it is not one of its predecessors
+    return (1 << Position[Node]) | sum(1 << Position[source_node] for source_node in Poset_graph.predecessors(Node))
 
 def make_colorings(Poset_graph):
-    print("Determining the structure of all colorings")
-    colorings = dict()
-    duplicate_colorings = set()
+    with instrument.stage("colorings"):
+        return _make_colorings(Poset_graph)
 
-    for red_node in Poset_graph.nodes():
-        if red_node in duplicate_colorings:
-            continue
-        else:
-            blue_node = complement_node(Poset_graph, red_node)
-            colorings[len(colorings)] = {"red_node":red_node, "blue_node":blue_node, "coloring_nodes":set(node for node in Poset_graph.nodes() if (node, red_node) in Poset_graph.edges() or (node, blue_node) in Poset_graph.edges())}
-            duplicate_colorings.add(blue_node)
+def _make_colorings(Poset_graph):
+    instrument.message("Determining the structure of all colorings")
+    colorings = dict()
+#     Row i of the matrix is the i-th node of the poset and its predecessors (its down-set), so the nodes under red or blue, red and blue included, are one OR (see bitmatrix.py)
+    nodes = list(Poset_graph.nodes())
+    position = {node:node_position for node_position,node in enumerate(nodes)}
+    poset_matrix = DownSetMatrix.from_down_sets([_down_set_bits(Poset_graph, position, node) for node in nodes])
 
+#     One coloring per (red, blue) pair, and swapping the colors gives the same one, so a pair is only taken with red first in the node order
+    for red_node in nodes:
+        for blue_node in complement_nodes(Poset_graph, red_node):
+            if position[red_node] > position[blue_node]:
+                continue
+            coloring_row = poset_matrix.union(position[red_node], position[blue_node])
+            colorings[len(colorings)] = {"red_node":red_node, "blue_node":blue_node, "coloring_row":coloring_row, "coloring_nodes":set(nodes[node_position] for node_position in row_members(coloring_row))}
+    instrument.count("colorings", len(colorings))
     return colorings
 
-def make_down_arrow_set(Colorings):
-    print("Determining the down-arrow Ramsey set")
-    down_arrow_set_nodes = set(Colorings)
-    for coloring_id in Colorings:
-        down_arrow_set_nodes.intersection_update(Colorings[coloring_id]["coloring_nodes"])
-    return down_arrow_set_nodes
+def floor_row(Poset_graph):
+#     Some colour gets half of the edges at a vertex of largest degree, so the star with that many edges is under every coloring (see complements.monochromatic_star)
+#     Returns the row (over the positions of Poset_graph.nodes(), like the coloring rows) of that star and the nodes below it
+    nodes = list(Poset_graph.nodes())
+    host_graph = max((nx.from_graph6_bytes(Poset_graph.nodes[node]["graph6_bytes"]) for node in nodes), key=lambda graph:graph.number_of_edges())
+    largest_degree = max((degree for node,degree in host_graph.degree()), default=0)
+    star_node = isomorphic_node(Poset_graph, _padded(nx.star_graph((largest_degree+1)//2), host_graph))
+    if star_node == None:
+        return None
+    position = {node:node_position for node_position,node in enumerate(nodes)}
+    return bits_to_words(_down_set_bits(Poset_graph, position, star_node), number_of_words(len(nodes)))
 
-if __name__ == "__main__":
-    k = 5
-
-# Make the poset, sometimes because the subgraphs exist already
-    host_graph = nx.complete_graph(k)
-    file_name = f"graph{k}.g6"
-    if os.path.exists(file_name):
-        empty_poset = nx.DiGraph()
-        [empty_poset.add_node(empty_poset.number_of_nodes(), graph6_bytes = nx.to_graph6_bytes(graph, header=False).strip()) for graph in nx.read_graph6(file_name)]
-        poset_graph = _add_edges_to_poset(empty_poset)
+def make_down_arrow_set(Colorings, Nodes=None, Floor_row=None, Budget=None):
+    with instrument.stage("intersection"):
+        return _make_down_arrow_set(Colorings, Nodes, Floor_row, Budget)
+
+def _make_down_arrow_set(Colorings, Nodes=None, Floor_row=None, Budget=None):
+#     Nodes is the poset's node list that the coloring rows are over, by default the nodes are their own positions (true of every poset this file makes)
+#     The smallest colorings go first, and once the intersection is down to Floor_row (see floor_row) or empty the rest are skipped
+#     Budget is a dict of anytime.Anytime's time_budget, coloring_budget, checkpoint_seconds and publish, and with it this stops when the budget runs out and returns an upper bound of the down-arrow Ramsey set (a superset of it) instead
+    instrument.message("Determining the down-arrow Ramsey set")
+    if len(Colorings) == 0:
+        return set()
+    coloring_rows = sorted((Colorings[coloring_id]["coloring_row"] for coloring_id in Colorings), key=row_size)
+    if Budget == None:
+        down_arrow_set_row = intersect_rows(stacked_blocks(coloring_rows), 64*len(coloring_rows[0]), Floor_row)
     else:
-        poset_graph = make_poset(host_graph)
+        anytime = Anytime(64*len(coloring_rows[0]), len(coloring_rows), Floor_row, **Budget)
+        for block in stacked_blocks(coloring_rows, 256):
+            if anytime.add(np.bitwise_and.reduce(block, axis=0), len(block)):
+                break
+        down_arrow_set_row = anytime.row
+        if not anytime.exact:
+            state = anytime.checkpoint()
+            instrument.message(f"Out of budget with {state['remaining colorings']} colorings left, so this is an upper bound of the down-arrow Ramsey set")
+    if Nodes == None:
+        return set(row_members(down_arrow_set_row))
+    return set(Nodes[node_position] for node_position in row_members(down_arrow_set_row))
+
+if __name__ == "__main__":
+# The hosts are names or patterns like sweep.py takes them (python newposet.py "K_3..6"), K_5 by default
+    import sys
+    from sweep import host_graphs
+    for host_name,host_graph in host_graphs(sys.argv[1:] or ["K_5"]):
+        k = host_graph.number_of_nodes()
+
+# Make the poset, sometimes because the subgraphs exist already (graph{k}.g6 has the subgraphs of K_k)
+        file_name = f"graph{k}.g6"
+        if os.path.exists(file_name) and host_graph.number_of_edges() == k*(k-1)//2:
+            empty_poset = nx.DiGraph()
+            [empty_poset.add_node(empty_poset.number_of_nodes(), graph6_bytes = nx.to_graph6_bytes(graph, header=False).strip()) for graph in nx.read_graph6(file_name)]
+            poset_graph = _add_edges_to_poset(empty_poset)
+        else:
+            poset_graph = make_poset(host_graph)
 
 # Make the colorings based off of the poset
-    colorings = make_colorings(poset_graph)
+        colorings = make_colorings(poset_graph)
 
 # Determine the down-arrow Ramsey set
-    down_arrow_set_nodes = make_down_arrow_set(colorings)
+        down_arrow_set_nodes = make_down_arrow_set(colorings, Floor_row=floor_row(poset_graph))
 
 # Make the ideals of the down-arrow Ramsey set
-    down_arrow_set_poset = nx.induced_subgraph(poset_graph, down_arrow_set_nodes)
-    down_arrow_set_poset_ideals_nodes = set(node for node in down_arrow_set_poset.nodes() if down_arrow_set_poset.out_degree(node)==0)
+        down_arrow_set_poset = nx.induced_subgraph(poset_graph, down_arrow_set_nodes)
+        down_arrow_set_poset_ideals_nodes = set(node for node in down_arrow_set_poset.nodes() if down_arrow_set_poset.out_degree(node)==0)
+        instrument.message(f"The ideals of the down-arrow Ramsey set of {host_name} are {[poset_graph.nodes[node]['graph6_bytes'].decode() for node in down_arrow_set_poset_ideals_nodes]}", host=host_name)
 
 # Draw each of the ideals of the down-arrow Ramsey set
-    for node in down_arrow_set_poset_ideals_nodes:
-        nx.draw_circular(nx.from_graph6_bytes(poset_graph.nodes[node]["graph6_bytes"]), with_labels=True, node_color="lightgrey", edge_color="lightgrey")
-        plt.show()
+        for node in down_arrow_set_poset_ideals_nodes:
+            nx.draw_circular(nx.from_graph6_bytes(poset_graph.nodes[node]["graph6_bytes"]), with_labels=True, node_color="lightgrey", edge_color="lightgrey")
+            plt.show()
@@ -0,0 +1,142 @@
+import os
+from canonical import CanonicalIndex, canonical_labeling, rows_canonical_form
+from bitmask import HostEdges, SubgraphStore
+import instrument
+import codec
+
+def is_complete(host_edges):
+    number_of_vertices = len(host_edges.vertices)
+    return len(host_edges) == number_of_vertices*(number_of_vertices-1)//2
+
+def _coloured_layers(mask, host_edges, host_is_complete):
+    """
+        The edge subset is one colour and the rest of the host is the other, so the canonical form of this pair is an orbit key under the automorphisms of the host.
+        Every permutation is an automorphism of a complete host, so there the second colour carries no information and is left out.
+    """
+    if host_is_complete:
+        return [host_edges.vertex_rows(mask)]
+    return [host_edges.vertex_rows(mask), host_edges.vertex_rows(host_edges.complement(mask))]
+
+def _extension_edges(mask, host_edges, automorphisms):
+    parent = dict()
+    for edge_index in range(len(host_edges)):
+        if not (mask >> edge_index) & 1:
+            parent[edge_index] = edge_index
+    def find(edge_index):
+        while parent[edge_index] != edge_index:
+            parent[edge_index] = parent[parent[edge_index]]
+            edge_index = parent[edge_index]
+        return edge_index
+    vertices = host_edges.vertices
+    position = host_edges.position
+    for automorphism in automorphisms:
+        for edge_index in parent:
+            source, target = host_edges.edges[edge_index]
+            image = host_edges.edge_index[(vertices[automorphism[position[source]]], vertices[automorphism[position[target]]])]
+            root_1 = find(edge_index)
+            root_2 = find(image)
+            if root_1 != root_2:
+                parent[root_1] = root_2
+    return [edge_index for edge_index in parent if find(edge_index) == edge_index]
+
+def _children(host_edges, host_is_complete, parents):
+    """
+        The children of a run of (mask, automorphisms) parents, keyed by certificate, keeping the first parent's child for each certificate.
+    """
+    children = dict()
+    for mask,automorphisms in parents:
+        extension_edges = _extension_edges(mask, host_edges, automorphisms)
+        instrument.count("candidates", len(extension_edges))
+        for edge_index in extension_edges:
+            child_mask = mask | (1 << edge_index)
+            child_automorphisms = []
+            certificate, order = canonical_labeling(_coloured_layers(child_mask, host_edges, host_is_complete), automorphisms=child_automorphisms)
+            if certificate not in children:
+                children[certificate] = (child_mask, child_automorphisms)
+    return children
+
+def _children_task(arguments):
+    return _children(*arguments)
+
+def _class_forms_task(arguments):
+    host_edges, masks = arguments
+    return [rows_canonical_form(host_edges.rows(mask)) for mask in masks]
+
+def _chunks(items, pool):
+    """
+        Contiguous runs of items, a few per pool process so that a slow run does not hold up the whole layer.
+    """
+    return pool.chunks(items, max(1, -(-len(items)//(4*pool.num_workers))))
+
+def edge_subset_orbits(host_edges, pool=None):
+    """
+        Yields, layer by layer, one edge bitmask for each orbit of k-edge subsets of the host under its automorphism group.
+        Layer k+1 is built by adding one host edge to each orbit of layer k. Edges that the stabilizer of the parent subset maps onto each other give the same child, so only one edge per stabilizer orbit is tried, and children are deduplicated by their canonical form.
+        Every (k+1)-subset is some k-subset plus an edge, so nothing is missed, and the work grows with the number of orbits instead of the number of subsets.
+        With a workerpool.WorkerPool, each layer's parents are split into contiguous runs that the pool extends, and the runs are merged back in order, so every child is labelled once, by one process, and the layers come out the same as without a pool.
+    """
+    host_is_complete = is_complete(host_edges)
+    automorphisms = []
+    canonical_labeling(_coloured_layers(0, host_edges, host_is_complete), automorphisms=automorphisms)
+    layer = [(0, automorphisms)]
+    while layer:
+        yield [mask for mask,automorphisms in layer]
+        if pool == None:
+            next_layer = _children(host_edges, host_is_complete, layer)
+        else:
+            next_layer = dict()
+            for children in pool.imap(_children_task, [(host_edges, host_is_complete, parents) for parents in _chunks(layer, pool)]):
+                for certificate,child in children.items():
+                    if certificate not in next_layer:
+                        next_layer[certificate] = child
+        layer = list(next_layer.values())
+
+def _distinct_classes(host_edges, masks, pool):
+    """
+        The masks whose subgraphs are not isomorphic to an earlier mask's. With a pool, the canonical forms of the layer are worked out in parallel and only compared here.
+    """
+    class_forms = set()
+    distinct_masks = []
+    for chunk,forms in zip(_chunks(masks, pool), pool.imap(_class_forms_task, [(host_edges, chunk) for chunk in _chunks(masks, pool)])):
+        for mask,form in zip(chunk, forms):
+            if form not in class_forms:
+                class_forms.add(form)
+                distinct_masks.append(mask)
+    return distinct_masks
+
+def layered_class_masks(host_edges, directory=None, pool=None):
+    """
+        Yields a list of masks, one per isomorphism class of edge-induced subgraphs with k edges, for k = 0, 1, ..., in order.
+        If directory is given, each layer is also written to "{directory}/{k} edges.g6" as soon as it is finished.
+    """
+    host_is_complete = is_complete(host_edges)
+    index = CanonicalIndex()
+    for number_of_edges,masks in enumerate(edge_subset_orbits(host_edges, pool)):
+        if host_is_complete:
+            layer = masks
+        elif pool != None:
+            layer = _distinct_classes(host_edges, masks, pool)
+        else:
+            layer = [mask for mask in masks if index.add_rows(host_edges.rows(mask), mask)[1]]
+        instrument.count("classes", len(layer))
+        instrument.event("layer", edges=number_of_edges, orbits=len(masks), classes=len(layer))
+        if directory != None:
+            codec.write_lines(os.path.join(directory, f"{number_of_edges} edges.g6"), (codec.encode_rows(host_edges.rows(mask)) for mask in layer))
+        yield layer
+
+def subgraph_store(host, directory=None, pool=None):
+    store = SubgraphStore(HostEdges(host))
+    for layer in layered_class_masks(store.host_edges, directory, pool):
+        for mask in layer:
+            store.add(mask)
+    return store
+
+def layered_subgraph_classes(host, directory=None, pool=None):
+    host_edges = HostEdges(host)
+    for layer in layered_class_masks(host_edges, directory, pool):
+        yield [host_edges.graph(mask) for mask in layer]
+
+def distinct_edge_induced_subgraphs(host, directory=None, pool=None):
+    for layer in layered_subgraph_classes(host, directory, pool):
+        for subgraph in layer:
+            yield subgraph
@@ -0,0 +1,140 @@
+"""
+    A packed store is two files: "{path}.records", where the records are appended back to back, and "{path}.index", which holds an (offset, length) pair of native uint64s per record.
+    Records are keyed by their position (for the subgraphs and the poset, that is the class ID), and reading memory-maps both files, so a record is a zero-copy memoryview slice instead of a file open.
+    Writers go to "*.tmp" files that are only renamed into place when the writer is closed, so if the index exists the store is complete.
+"""
+import array
+import heapq
+import mmap
+import os
+import instrument
+
+def exists(path):
+    return os.path.exists(f"{path}.index")
+
+def _map(file_name):
+    with open(file_name, "rb") as input_file:
+        if os.fstat(input_file.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+class PackedStore:
+    def __init__(self, path):
+        self.path = path
+        self._records_map = _map(f"{path}.records")
+        self._index_map = _map(f"{path}.index")
+        self._records = memoryview(self._records_map) if self._records_map != None else memoryview(b"")
+        self._index_bytes = memoryview(self._index_map) if self._index_map != None else memoryview(array.array("Q"))
+        self._index = self._index_bytes.cast("B").cast("Q")
+
+    def __len__(self):
+        return len(self._index)//2
+
+    def __getitem__(self, record_id):
+        offset = self.offset(record_id)
+        return self._records[offset:offset+self._index[2*record_id+1]]
+
+    def offset(self, record_id):
+        """
+            Where the record starts in the records file.
+        """
+        if record_id < 0 or record_id >= len(self):
+            raise IndexError(f"{self.path} has no record {record_id}")
+        return self._index[2*record_id]
+
+    def __iter__(self):
+        for record_id in range(len(self)):
+            yield self[record_id]
+
+    def lines(self, record_id):
+        """
+            The graph6 lines (newline included) of a record that holds some, which is every record in this repo's stores.
+        """
+        return bytes(self[record_id]).splitlines(keepends=True)
+
+    def close(self):
+        """
+            The maps have to be released before the files can be replaced or removed (Windows will not let go of them otherwise).
+            A record slice that is still referenced somewhere keeps its map open until it is garbage collected, so copy records with bytes() if they need to outlive the store.
+        """
+        self._index.release()
+        self._index_bytes.release()
+        self._records.release()
+        for file_map in (self._records_map, self._index_map):
+            if file_map != None:
+                try:
+                    file_map.close()
+                except BufferError:
+                    pass
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+        return False
+
+class PackedStoreWriter:
+    def __init__(self, path):
+        self.path = path
+        self._records_file = open(f"{path}.records.tmp", "wb")
+        self._index = array.array("Q")
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._index)//2
+
+    def append(self, data):
+        self._records_file.write(data)
+        self._index.append(self._offset)
+        self._index.append(len(data))
+        self._offset += len(data)
+        return len(self)-1
+
+    def close(self):
+        self._records_file.close()
+        instrument.count("bytes_written", self._offset+self._index.itemsize*len(self._index))
+        with open(f"{self.path}.index.tmp", "wb") as index_file:
+            self._index.tofile(index_file)
+        os.replace(f"{self.path}.records.tmp", f"{self.path}.records")
+        os.replace(f"{self.path}.index.tmp", f"{self.path}.index")
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+        return False
+
+def remove(path):
+    for suffix in (".records", ".index"):
+        if os.path.exists(f"{path}{suffix}"):
+            os.remove(f"{path}{suffix}")
+    return
+
+def merge(part_paths, path, interleave=False, key=None):
+    """
+        Copies the records of the part stores into one store at path and removes the parts.
+        With interleave=True the records are taken round robin (record 0 of every part, then record 1, ...), which undoes the job_number % num_workers split of _allocate_work.
+        With a key, every part has to be sorted by it already, and the merged store comes out sorted by it too.
+    """
+    parts = [PackedStore(part_path) for part_path in part_paths if exists(part_path)]
+    with PackedStoreWriter(path) as writer:
+        if key != None:
+            for record in heapq.merge(*parts, key=key):
+                writer.append(record)
+        elif interleave:
+            for record_id in range(max((len(part) for part in parts), default=0)):
+                for part in parts:
+                    if record_id < len(part):
+                        writer.append(part[record_id])
+        else:
+            for part in parts:
+                for record in part:
+                    writer.append(record)
+    for part in parts:
+        part.close()
+        remove(part.path)
+    return
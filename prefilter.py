@@ -0,0 +1,121 @@
+"""
+    Cheap necessary conditions for "pattern is a subgraph of target", checked before handing a pair to the matcher (matcher.py).
+    A monomorphism is injective on vertices and edges and sends each connected piece of the pattern into one connected piece of the target, so none of the numbers below can go up from pattern to target.
+"""
+import networkx as nx
+import graphcache
+import instrument
+import matcher
+
+class Invariants:
+    __slots__ = ("number_of_edges", "number_of_vertices", "degrees", "triangles", "component_sizes")
+
+    def __init__(self, graph):
+        degrees = sorted((degree for node,degree in graph.degree() if degree > 0), reverse=True)
+        non_isolated = graph.subgraph(node for node,degree in graph.degree() if degree > 0)
+        self.number_of_edges = graph.number_of_edges()
+        self.number_of_vertices = len(degrees)
+        self.degrees = tuple(degrees)
+        self.triangles = sum(nx.triangles(non_isolated).values())//3
+        self.component_sizes = tuple(sorted(((len(component), non_isolated.subgraph(component).number_of_edges()) for component in nx.connected_components(non_isolated)), reverse=True))
+
+def may_embed(pattern, target):
+    """
+        pattern and target are Invariants. False means pattern certainly does not embed in target, True means the matcher has to decide.
+    """
+    if pattern.number_of_edges > target.number_of_edges:
+        return False
+    if pattern.number_of_vertices > target.number_of_vertices:
+        return False
+    for pattern_degree,target_degree in zip(pattern.degrees, target.degrees):
+        if pattern_degree > target_degree:
+            return False
+    if pattern.triangles > target.triangles:
+        return False
+    for vertices,edges in pattern.component_sizes:
+        if not any(target_vertices >= vertices and target_edges >= edges for target_vertices,target_edges in target.component_sizes):
+            return False
+    return True
+
+class MonomorphismFilter:
+    """
+        Keeps the Invariants (and the compiled matcher.Pattern / matcher.Target) of every graph it has seen under the key it was given, when there is one, and counts how many tests it answered without the matcher.
+        With a graphcache.GraphCache, pairs that get past the invariants are looked up there before the matcher runs, and the matcher's answers are added to it.
+        Counters are per process.
+    """
+    def __init__(self, cache=None):
+        self._invariants = dict()
+        self._forms = dict()
+        self._patterns = dict()
+        self._targets = dict()
+        self.cache = cache
+        self.tested = 0
+        self.rejected = 0
+        self.cached = 0
+
+    def invariants(self, graph, key=None):
+        if key == None:
+            return Invariants(graph)
+        if key not in self._invariants:
+            self._invariants[key] = Invariants(graph)
+        return self._invariants[key]
+
+    def form(self, graph, key=None):
+        if key == None:
+            return graphcache.form(graph)
+        if key not in self._forms:
+            self._forms[key] = graphcache.form(graph)
+        return self._forms[key]
+
+    def _compiled(self, compiled, kind, graph, key):
+        if key == None:
+            return kind(graph)
+        if key not in compiled:
+            compiled[key] = kind(graph)
+        return compiled[key]
+
+    def _match(self, target, pattern, target_key, pattern_key):
+        instrument.count("matcher_calls")
+        return matcher.is_monomorphic(self._compiled(self._targets, matcher.Target, target, target_key), self._compiled(self._patterns, matcher.Pattern, pattern, pattern_key))
+
+    def may_embed(self, target, pattern, target_key=None, pattern_key=None):
+        self.tested += 1
+        instrument.count("monomorphism_tests")
+        if may_embed(self.invariants(pattern, pattern_key), self.invariants(target, target_key)):
+            return True
+        self.rejected += 1
+        instrument.count("invariant_rejections")
+        return False
+
+    def is_monomorphic(self, target, pattern, target_key=None, pattern_key=None):
+        """
+            Same argument order as GraphMatcher(target, pattern).subgraph_is_monomorphic().
+        """
+        if not self.may_embed(target, pattern, target_key, pattern_key):
+            return False
+        if self.cache == None:
+            return self._match(target, pattern, target_key, pattern_key)
+        if pattern.number_of_nodes() > target.number_of_nodes():
+            self.cached += 1
+            return False
+        pattern_form = self.form(pattern, pattern_key)
+        target_form = self.form(target, target_key)
+        answer = self.cache.embeds(pattern_form, target_form)
+        if answer != None:
+            self.cached += 1
+            return answer
+        answer = self._match(target, pattern, target_key, pattern_key)
+        self.cache.record_embeds(pattern_form, target_form, answer)
+        return answer
+
+    @property
+    def matcher_calls(self):
+        return self.tested-self.rejected-self.cached
+
+    def counters(self):
+        return {"tested":self.tested, "rejected":self.rejected, "cached":self.cached, "matcher_calls":self.matcher_calls}
+
+    def summary(self):
+        if self.cache == None:
+            return f"the invariant filter answered {self.rejected} of {self.tested} monomorphism tests without the matcher"
+        return f"the invariant filter answered {self.rejected} and the cache {self.cached} of {self.tested} monomorphism tests without the matcher"
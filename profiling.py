@@ -0,0 +1,116 @@
+"""
+    cProfile for each stage in each process, for instrument.py's profile mode (instrument.enable(..., profile="Profiles")), and the merged reports.
+    Each process writes "{directory}/{stage}.{pid}.prof", and merge() adds those up into "{stage}.prof" and a "{stage}.txt" report per stage, which starts with how the time splits between the CATEGORIES below.
+    The split is by self time, so a set operation written as an operator (a & b) is not a call of its own and counts towards the function it is in.
+
+        python profiling.py Profiles        merges the profiles in Profiles again and prints the splits
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+
+CATEGORIES = [
+    ("monomorphisms", lambda file_name, function_name: file_name.endswith("matcher.py") or ("isomorphism" in file_name and "vf2" in file_name)),
+    ("graph6", lambda file_name, function_name: "graph6" in file_name),
+    ("canonical forms", lambda file_name, function_name: file_name.endswith("canonical.py")),
+    ("sqlite", lambda file_name, function_name: "sqlite3" in function_name),
+    ("filesystem", lambda file_name, function_name: any(name in function_name for name in ("io.open", "_io.", "posix.", "mmap", "fromfile", "tofile", "numpy.save", "numpy.load"))),
+    ("set operations", lambda file_name, function_name: "'set' objects" in function_name or "'frozenset' objects" in function_name),
+    ("numpy", lambda file_name, function_name: "numpy" in file_name or "numpy" in function_name),
+    ("networkx", lambda file_name, function_name: "networkx" in file_name),
+    ("waiting on workers", lambda file_name, function_name: "_thread.lock" in function_name or "multiprocessing" in file_name),
+    ("drawing", lambda file_name, function_name: "matplotlib" in file_name or "matplotlib" in function_name or "PIL" in file_name or "Imaging" in function_name),
+    ("imports", lambda file_name, function_name: "importlib" in file_name or "_imp." in function_name or "marshal" in function_name),
+]
+
+_profiles = dict()
+_active = []
+
+def _file_stage(stage_name):
+    return "unstaged" if stage_name == None else str(stage_name).replace(os.sep, "_")
+
+def start(stage_name):
+    """
+        Only one profiler can run at a time, so the one for the stage around this one is paused until stop().
+    """
+    if _active:
+        _active[-1].disable()
+    if stage_name not in _profiles:
+        _profiles[stage_name] = cProfile.Profile()
+    _active.append(_profiles[stage_name])
+    _active[-1].enable()
+    return
+
+def stop():
+    if _active:
+        _active.pop().disable()
+    if _active:
+        _active[-1].enable()
+    return
+
+def reset():
+    """
+        A forked worker starts with its parent's profilers (possibly running), which have to go before it profiles anything of its own.
+    """
+    for profile in _active:
+        profile.disable()
+    _active.clear()
+    _profiles.clear()
+    return
+
+def dump(directory):
+    while _active:
+        stop()
+    os.makedirs(directory, exist_ok=True)
+    for stage_name,profile in _profiles.items():
+        profile.create_stats()
+        if profile.stats:
+            profile.dump_stats(os.path.join(directory, f"{_file_stage(stage_name)}.{os.getpid()}.prof"))
+    _profiles.clear()
+    return
+
+def categories(stats):
+    """
+        Seconds of self time per category of a pstats.Stats, with whatever matches none of them under "other".
+    """
+    split = {name:0.0 for name,matches in CATEGORIES}
+    split["other"] = 0.0
+    for (file_name, line_number, function_name),(primitive_calls, calls, self_time, cumulative_time, callers) in stats.stats.items():
+        file_name = file_name.replace("\\", "/")
+        for name,matches in CATEGORIES:
+            if matches(file_name, function_name):
+                split[name] += self_time
+                break
+        else:
+            split["other"] += self_time
+    return split
+
+def merge(directory, top=30):
+    """
+        Returns {stage: categories(...)} and writes the merged profile and report of every stage.
+    """
+    parts = dict()
+    for file_name in sorted(os.listdir(directory)):
+        stage_name, *process_id = file_name[:-len(".prof")].rsplit(".", 1)
+        if file_name.endswith(".prof") and process_id and process_id[0].isdigit():
+            parts.setdefault(stage_name, []).append(os.path.join(directory, file_name))
+    splits = dict()
+    for stage_name,paths in parts.items():
+        stats = pstats.Stats(*paths, stream=io.StringIO())
+        stats.dump_stats(os.path.join(directory, f"{stage_name}.prof"))
+        splits[stage_name] = categories(stats)
+        total = sum(splits[stage_name].values()) or 1.0
+        stats.stream = io.StringIO()
+        stats.sort_stats("tottime").print_stats(top)
+        with open(os.path.join(directory, f"{stage_name}.txt"), "w") as output_file:
+            output_file.write(f"{stage_name}: {len(paths)} processes, {total:.2f}s profiled\n")
+            for name,seconds in sorted(splits[stage_name].items(), key=lambda item:-item[1]):
+                output_file.write(f"    {name:<16}{seconds:9.3f}s {100*seconds/total:5.1f}%\n")
+            output_file.write(stats.stream.getvalue())
+    return splits
+
+if __name__ == "__main__":
+    for stage_name,split in merge(sys.argv[1] if len(sys.argv) > 1 else "Profiles").items():
+        print(stage_name + ": " + ", ".join(f"{name} {seconds:.2f}s" for name,seconds in split.items() if seconds > 0))
@@ -0,0 +1,133 @@
+"""
+    Is G in the down-arrow Ramsey set of H, without making the whole set?
+    G is in it exactly when every red/blue coloring of the edges of H has G in the red edges or in the blue edges, so G is out as soon as there is one coloring (a witness) with G in neither.
+    find_witness() looks for one edge by edge. A color that would now hold a copy of G through the edge just colored is never tried, so only colorings with neither color holding G are ever built, and the first one found is returned.
+    A copy through the new edge is found by pinning an edge of G onto it (see matcher.is_monomorphic), which is much less work than looking for G in the whole color class.
+    Like the sets this repo makes, G is taken without its isolated vertices.
+
+        python cli.py query K_6 K_3 "C_4" Bw
+"""
+import time
+import networkx as nx
+import DownArrowRamseySetGenerator as generator
+import graphcache
+import instrument
+import matcher
+from canonical import _adjacency_rows
+
+class _Search:
+    def __init__(self, host_rows, pattern_rows, deadline):
+        self.deadline = deadline
+        self.number_of_vertices = len(host_rows)
+        self.edges = sorted(((source, target) for target,row in enumerate(host_rows) for source in range(target) if (row >> source) & 1), key=lambda edge:(edge[1], edge[0]))
+        self.rooted = [matcher.Pattern(pattern_rows, (source, target)) for target,row in enumerate(pattern_rows) for source in range(target) if (row >> source) & 1]
+        self.colors = [[0]*self.number_of_vertices, [0]*self.number_of_vertices]
+        self.sizes = [0, 0]
+        self.assignment = []
+
+    def _has_copy_through(self, rows, source, target):
+        compiled = matcher.Target(rows)
+        return any(matcher.is_monomorphic(compiled, pattern, (source, target)) or matcher.is_monomorphic(compiled, pattern, (target, source)) for pattern in self.rooted)
+
+    def _try(self, color, source, target):
+        rows = self.colors[color]
+        rows[source] |= 1 << target
+        rows[target] |= 1 << source
+        if not self._has_copy_through(rows, source, target):
+            self.sizes[color] += 1
+            self.assignment.append(color)
+            if self.run(len(self.assignment)):
+                return True
+            self.assignment.pop()
+            self.sizes[color] -= 1
+        rows[source] &= ~(1 << target)
+        rows[target] &= ~(1 << source)
+        return False
+
+    def run(self, position=0):
+        """
+            True once every edge is colored. The first edge is always red (swapping the colors of a witness gives another one), and after that the color with fewer edges goes first, since a witness has to keep both colors clear of G.
+        """
+        if position == len(self.edges):
+            return True
+        instrument.count("query_nodes")
+        if self.deadline != None and time.perf_counter() > self.deadline:
+            raise TimeoutError("the search ran out of time")
+        source, target = self.edges[position]
+        colors = [0] if position == 0 else sorted((0, 1), key=lambda color:self.sizes[color])
+        return any(self._try(color, source, target) for color in colors)
+
+def find_witness(host, graph, time_limit=None):
+    """
+        (red edges, blue edges) of a coloring of host with graph in neither color, or None when there is none, i.e. graph is in the down-arrow Ramsey set of host.
+        Raises TimeoutError if time_limit seconds go by first.
+    """
+    host_vertices, host_rows = _adjacency_rows(host)
+    pattern_rows = _adjacency_rows(nx.Graph(list(graph.edges())))[1]
+    if not pattern_rows:
+        return None
+    if not matcher.is_monomorphic(host_rows, pattern_rows):
+        return [(host_vertices[source], host_vertices[target]) for target,row in enumerate(host_rows) for source in range(target) if (row >> source) & 1], []
+    search = _Search(host_rows, pattern_rows, None if time_limit == None else time.perf_counter()+time_limit)
+    if not search.run():
+        return None
+    witness = ([], [])
+    for (source, target),color in zip(search.edges, search.assignment):
+        witness[color].append((host_vertices[source], host_vertices[target]))
+    return witness
+
+def is_member(host, graph, time_limit=None):
+    return find_witness(host, graph, time_limit) == None
+
+def saved_members(host_name):
+    """
+        The canonical forms (see graphcache.form) of the down-arrow Ramsey set of host_name if it has been made already, otherwise None.
+    """
+    path = f"Graphs/{host_name}/{host_name} down-arrow ramsey set.g6"
+    try:
+        with open(path, "rb") as input_file:
+            return set(graphcache.form(nx.from_graph6_bytes(line.strip())) for line in input_file if line.strip())
+    except FileNotFoundError:
+        return None
+
+def _graph_from_text(text):
+    """
+        A graph given by name (anything _get_graph_from_name knows, like "C_4") or as a graph6 string.
+    """
+    try:
+        graph = generator._get_graph_from_name(text)
+    except ValueError:
+        graph = None
+    if graph == None:
+        graph = nx.from_graph6_bytes(text.encode())
+    return graph
+
+def query(host_name, graphs, time_limit=None, use_saved=True):
+    """
+        One answer per graph (a name, graph6 string or networkx graph): a dict with "member" (True, False, or None if it timed out), "witness" ((red edges, blue edges) when it is not a member and the search found it), "source" ("saved" when it was looked up in the down-arrow Ramsey set on disk, "search" otherwise) and "seconds".
+        With use_saved, a down-arrow Ramsey set that is already on disk answers without a search.
+    """
+    host = generator._get_graph_from_name(host_name)
+    if host == None:
+        raise ValueError(f"{host_name} is not a host this repo knows")
+    members = saved_members(host_name) if use_saved else None
+    answers = []
+    for graph in graphs:
+        started = time.perf_counter()
+        name = graph if isinstance(graph, str) else nx.to_graph6_bytes(graph, header=False).strip().decode()
+        if isinstance(graph, str):
+            graph = _graph_from_text(graph)
+        answer = {"graph":name, "member":None, "witness":None, "source":"search"}
+        if members != None:
+            answer["member"] = graphcache.form(graph) in members
+            answer["source"] = "saved"
+        else:
+            try:
+                answer["witness"] = find_witness(host, graph, time_limit)
+                answer["member"] = answer["witness"] == None
+            except TimeoutError:
+                pass
+        answer["seconds"] = round(time.perf_counter()-started, 6)
+        instrument.event("query", host=host_name, **answer)
+        answers.append(answer)
+    return answers
@@ -0,0 +1,352 @@
+"""
+    Running the coloring stages of one host as N shards, on as many machines as share the Graphs directory (a network drive, say), with a merge at the end.
+    Shard i of N is every red class ID that is i mod N (the old job_number % num_workers split), so each shard gets a fair share of both the small and the large classes.
+    A shard writes its output under "Graphs/{host}/Shards" and then a manifest naming it, and merge() only goes by the manifests, so a half written shard is never merged.
+    Under the queue, a shard's manifest is its done record (see LeaseQueue.finish), which is written in one step with the shard finishing, so there is no window where a shard is done but has no manifest.
+
+        "colorings"     each shard is a file of its colorings, smallest first, and the merge is Red-Blue Colorings.npy
+        "stream"        each shard is one row, the intersection of its colorings, and the merge ANDs them into the down-arrow Ramsey set (see _stream_colorings)
+
+    run_node() is what each machine runs: it takes work from a LeaseQueue in "Graphs/{host}/Queue" until there is none left, so nodes can come and go.
+    The subgraphs, poset and complement map are made once, by whichever node gets to them first, since every down-set needs the whole Hasse diagram. The others wait for them.
+
+        python cli.py shard K_7 --shards 16                   on every machine (or several times on one, to try it out)
+        python cli.py shard K_7 --shards 16 --shard 3         just shard 3 of 16 and its manifest, without the queue
+        python cli.py shard K_7 --shards 16 --merge           the merge, once every manifest is there
+"""
+import json
+import os
+import socket
+import threading
+import time
+import numpy as np
+import DownArrowRamseySetGenerator as generator
+import instrument
+import packedstore
+from packedstore import PackedStore, PackedStoreWriter
+from bitmatrix import full_row, block_rows, is_fixed, sized_colorings, save_colorings, load_colorings, merge_colorings
+from workerpool import WorkerPool
+
+STAGES = ["colorings", "stream"]
+
+def default_node():
+    return f"{socket.gethostname()}.{os.getpid()}"
+
+def _write_json(path, data):
+    with open(f"{path}.tmp", "w") as output_file:
+        json.dump(data, output_file)
+    os.replace(f"{path}.tmp", path)
+    return
+
+def _read_json(path):
+    with open(path) as input_file:
+        return json.load(input_file)
+
+class LeaseQueue:
+    """
+        A work queue that is nothing but a directory, so any number of processes on any number of machines can share it.
+        A task is claimed by creating "leases/{task}" with O_EXCL, which only one process can do, and the lease is kept alive by renew() touching it.
+        A lease that has not been touched for lease_seconds belongs to a node that is dead or stuck, and the next claim() takes the task over (see _take_over, which only one node can win too).
+        finish() records the task's result in "done/{task}.json". If a straggler finishes a task that was taken over, the first finish() wins and the other gets False, so it can throw its output away.
+        The lease times are file times, so the machines' clocks have to roughly agree (well within lease_seconds).
+    """
+    def __init__(self, directory, lease_seconds=300):
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        for folder in ("tasks", "leases", "done"):
+            os.makedirs(os.path.join(directory, folder), exist_ok=True)
+
+    def _path(self, folder, task):
+        return os.path.join(self.directory, folder, task)
+
+    def put(self, tasks):
+        """
+            Adds the tasks (names that are safe as file names) that are not in the queue yet.
+        """
+        for task in tasks:
+            if not os.path.exists(self._path("tasks", task)):
+                open(self._path("tasks", task), "a").close()
+        return
+
+    def tasks(self):
+        return sorted(os.listdir(os.path.join(self.directory, "tasks")))
+
+    def is_done(self, task):
+        return os.path.exists(self._path("done", f"{task}.json"))
+
+    def result(self, task):
+        return _read_json(self._path("done", f"{task}.json"))
+
+    def pending(self):
+        return [task for task in self.tasks() if not self.is_done(task)]
+
+    def _take(self, task, node):
+        try:
+            file_descriptor = os.open(self._path("leases", task), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(file_descriptor, "w") as lease_file:
+            lease_file.write(node)
+        return True
+
+    def _take_over(self, task, node):
+        """
+            Replaces a stale lease on task with one of node's. Every node that saw the same stale lease tries to create a marker named after its file time with O_EXCL, and only the one that does goes on.
+            The new lease is renamed over the old one in one step, so there is never a moment without a lease for a third node to take, and once it is in the lease is fresh, so no node that looks later sees it as stale.
+        """
+        try:
+            lease_time = os.stat(self._path("leases", task)).st_mtime_ns
+        except FileNotFoundError:
+            return self._take(task, node)
+        if time.time_ns()-lease_time <= self.lease_seconds*10**9:
+            return False
+        try:
+            os.close(os.open(self._path("leases", f"{task}.takeover.{lease_time}"), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        with open(self._path("leases", f"{task}.{node}.tmp"), "w") as lease_file:
+            lease_file.write(node)
+        os.replace(self._path("leases", f"{task}.{node}.tmp"), self._path("leases", task))
+        instrument.event("lease", task=task, node=node, taken_over=True)
+        return True
+
+    def claim(self, node, tasks=None):
+        """
+            The first task (of tasks, or of the whole queue) that is not done and that this node could lease, or None.
+        """
+        for task in self.tasks() if tasks == None else tasks:
+            if self.is_done(task):
+                continue
+            if self._take(task, node) or self._take_over(task, node):
+                return task
+        return None
+
+    def renew(self, task):
+        try:
+            os.utime(self._path("leases", task))
+        except FileNotFoundError:
+            pass
+        return
+
+    def finish(self, task, result):
+        """
+            True if this is the first finish of task.
+        """
+        path = self._path("done", f"{task}.json")
+        temporary_path = f"{path}.{os.getpid()}.{socket.gethostname()}.tmp"
+        with open(temporary_path, "w") as output_file:
+            json.dump(result, output_file)
+        try:
+            os.link(temporary_path, path)
+            first = True
+        except FileExistsError:
+            first = False
+        os.remove(temporary_path)
+        for lease in [task]+[name for name in os.listdir(os.path.join(self.directory, "leases")) if name.startswith(f"{task}.takeover.")]:
+            try:
+                os.remove(self._path("leases", lease))
+            except FileNotFoundError:
+                pass
+        return first
+
+    def holding(self, task):
+        """
+            A context manager that renews the lease on task every third of lease_seconds from a background thread, for as long as the work on it takes.
+        """
+        return _Heartbeat(self, task)
+
+    def wait(self, task, node, poll_seconds=1.0):
+        """
+            Blocks until task is done, and takes it over (returning True) if its node dies first.
+        """
+        while not self.is_done(task):
+            if self.claim(node, [task]) != None:
+                return True
+            time.sleep(poll_seconds)
+        return False
+
+class _Heartbeat:
+    def __init__(self, queue, task):
+        self.queue = queue
+        self.task = task
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.queue.lease_seconds/3):
+            self.queue.renew(self.task)
+        return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exception):
+        self._stopped.set()
+        self._thread.join()
+        return False
+
+def _shard_directory(graph_name):
+    return f"Graphs/{graph_name}/Shards"
+
+def _queue_directory(graph_name):
+    return f"Graphs/{graph_name}/Queue"
+
+def _shard_task(stage, shard, number_of_shards):
+    return f"{stage}.{shard}.of.{number_of_shards}"
+
+def _manifest_path(graph_name, stage, shard, number_of_shards):
+    return os.path.join(_shard_directory(graph_name), f"{_shard_task(stage, shard, number_of_shards)}.json")
+
+def _manifest(graph_name, stage, shard, number_of_shards):
+    """
+        The manifest of a shard from write_manifest, or else from its done record in the queue (run_node), or None if it has neither.
+    """
+    for path in (_manifest_path(graph_name, stage, shard, number_of_shards), os.path.join(_queue_directory(graph_name), "done", f"{_shard_task(stage, shard, number_of_shards)}.json")):
+        if os.path.exists(path):
+            return _read_json(path)
+    return None
+
+def shard_class_ids(number_of_classes, shard, number_of_shards):
+    return range(shard, number_of_classes, number_of_shards)
+
+def _colorings_task(arguments):
+    """
+        The colorings of a run of red class IDs (each one once), smallest first, written to a part of their own.
+    """
+    graph_name, path, red_class_ids = arguments
+    complements = generator._context(graph_name, "complements")
+    pairs = [(red_class_id, blue_class_id) for red_class_id in red_class_ids for blue_class_id in complements[red_class_id] if red_class_id <= blue_class_id]
+    instrument.count("colorings", len(pairs))
+    save_colorings(path, sized_colorings(generator._context(graph_name, "poset"), pairs))
+    return path
+
+def _run_colorings(graph_name, red_class_ids, path, pool):
+    chunks = pool.chunks(red_class_ids)
+    part_paths = []
+    for part_path in pool.stream(_colorings_task, ((graph_name, f"{path}.{job_id}.npy", chunk) for job_id,chunk in enumerate(chunks))):
+        part_paths.append(part_path)
+    merge_colorings(part_paths, path)
+    return
+
+def _run_stream(graph_name, red_class_ids, path, pool):
+    number_of_classes = len(generator._context(graph_name, "complements"))
+    floor = generator._context(graph_name, "floor")
+    running_intersection = full_row(number_of_classes).copy()
+    for row in pool.stream(generator._stream_colorings_task, ((graph_name, chunk, block_rows(pool.memory_budget, number_of_classes)) for chunk in pool.chunks(red_class_ids))):
+        running_intersection &= np.frombuffer(row, dtype="<u8")
+        if is_fixed(running_intersection, floor):
+            break
+    with PackedStoreWriter(path) as output_store:
+        output_store.append(running_intersection.tobytes())
+    return
+
+def prepare(graph_name, pool=None, cache_path=None):
+    """
+        The subgraphs, poset and complement map that every shard reads.
+    """
+    generator._make_graph_directory(graph_name)
+    if not generator._stage_done(graph_name, "Subgraphs"):
+        generator._make_edge_induced_subgraphs(graph_name, pool)
+    if not generator._stage_done(graph_name, "Poset"):
+        generator._make_poset(graph_name, pool=pool, cache=None if cache_path == None else generator.GraphCache(cache_path))
+    generator._make_complements(graph_name)
+    return
+
+def run_shard(graph_name, stage, shard, number_of_shards, pool=None, node=None):
+    """
+        Runs shard (counting from 0) of number_of_shards of stage and writes its output and manifest, which is also returned.
+        prepare() has to have been run already. The output is named after the node, so two nodes that run the same shard (a straggler and the node that took it over) do not write over each other.
+    """
+    if stage not in STAGES:
+        raise ValueError(f"{stage} is not a stage that can be sharded ({', '.join(STAGES)})")
+    if node == None:
+        node = default_node()
+    os.makedirs(_shard_directory(graph_name), exist_ok=True)
+    red_class_ids = shard_class_ids(len(generator._context(graph_name, "complements")), shard, number_of_shards)
+    path = os.path.join(_shard_directory(graph_name), f"{stage}.{shard}.of.{number_of_shards}.{node}"+(".npy" if stage == "colorings" else ""))
+    started = time.perf_counter()
+    with instrument.stage(f"{stage} shard", host=graph_name, shard=shard, shards=number_of_shards):
+        run = _run_colorings if stage == "colorings" else _run_stream
+        generator._in_pool(lambda graph_name, pool:run(graph_name, red_class_ids, path, pool), graph_name, pool)
+    manifest = {"host":graph_name, "stage":stage, "shard":shard, "shards":number_of_shards, "node":node, "path":path, "records":_records(path), "red classes":len(red_class_ids), "seconds":round(time.perf_counter()-started, 3)}
+    return manifest
+
+def _records(path):
+    if path.endswith(".npy"):
+        return len(load_colorings(path))
+    with PackedStore(path) as output_store:
+        return len(output_store)
+
+def _remove_output(path):
+    if path.endswith(".npy"):
+        if os.path.exists(path):
+            os.remove(path)
+    else:
+        packedstore.remove(path)
+    return
+
+def write_manifest(manifest):
+    _write_json(_manifest_path(manifest["host"], manifest["stage"], manifest["shard"], manifest["shards"]), manifest)
+    return
+
+def merge(graph_name, stage, number_of_shards):
+    """
+        Combines the shards named by the manifests into the stage's final output (and removes their outputs), and raises ValueError if any shard has no manifest yet.
+        Whatever a node that died was writing is left in the Shards directory.
+    """
+    manifests = []
+    for shard in range(number_of_shards):
+        manifest = _manifest(graph_name, stage, shard, number_of_shards)
+        if manifest == None:
+            raise ValueError(f"Shard {shard} of {number_of_shards} of the {stage} of {graph_name} is not finished")
+        manifests.append(manifest)
+    with instrument.stage(f"{stage} merge", host=graph_name, shards=number_of_shards):
+        if stage == "colorings":
+            merge_colorings([manifest["path"] for manifest in manifests], generator._colorings_path(graph_name))
+        else:
+            running_intersection = full_row(len(generator._context(graph_name, "complements"))).copy()
+            for manifest in manifests:
+                with PackedStore(manifest["path"]) as output_store:
+                    running_intersection &= np.frombuffer(output_store[0], dtype="<u8")
+            generator._write_down_arrow_ramsey_set(graph_name, running_intersection)
+            for manifest in manifests:
+                _remove_output(manifest["path"])
+    return manifests
+
+def run_node(graph_name, stage="stream", number_of_shards=16, node=None, lease_seconds=300, num_workers=None, chunksize=64, memory_budget=2**26, cache_path=None, poll_seconds=1.0):
+    """
+        Works on the host's queue until the stage is merged: prepares the host if no node has, runs shards until there are none left to claim, waits for the ones other nodes hold (taking over any whose node has died), and merges them if no node has.
+        Every node of a run has to be given the same stage and number_of_shards. Returns the manifests of the shards this node finished first.
+    """
+    if node == None:
+        node = default_node()
+    generator._make_graph_directory(graph_name)
+    queue = LeaseQueue(_queue_directory(graph_name), lease_seconds)
+    shard_tasks = [_shard_task(stage, shard, number_of_shards) for shard in range(number_of_shards)]
+    merge_task = f"{stage}.merge.of.{number_of_shards}"
+    queue.put(["prepare"]+shard_tasks+[merge_task])
+    finished = []
+    with WorkerPool(num_workers, chunksize, generator._init_worker, (graph_name,), memory_budget) as pool:
+        if queue.claim(node, ["prepare"]) != None or queue.wait("prepare", node, poll_seconds):
+            with queue.holding("prepare"):
+                prepare(graph_name, pool, cache_path)
+            queue.finish("prepare", {"node":node})
+        while True:
+            task = queue.claim(node, shard_tasks)
+            if task == None:
+                if all(queue.is_done(task) for task in shard_tasks):
+                    break
+                time.sleep(poll_seconds)
+                continue
+            with queue.holding(task):
+                manifest = run_shard(graph_name, stage, shard_tasks.index(task), number_of_shards, pool, node)
+            if queue.finish(task, manifest):
+                finished.append(manifest)
+            else:
+                _remove_output(manifest["path"])
+        if queue.claim(node, [merge_task]) != None or queue.wait(merge_task, node, poll_seconds):
+            with queue.holding(merge_task):
+                merge(graph_name, stage, number_of_shards)
+            queue.finish(merge_task, {"node":node})
+    return finished
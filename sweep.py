@@ -0,0 +1,126 @@
+"""
+    Down-arrow Ramsey sets for many hosts in one run, smallest host first, over one worker pool and one cache of classes and monomorphism answers (see graphcache.py).
+    Hosts whose ideals are on disk already are skipped, and the run ends with a summary table of every host, which is also written to summary_path as CSV.
+    A host pattern is a host name in which any number can be a range a..b: "C_4..12" is C_4 through C_12, and "K_1..8,1..8" is every K_m,n with m and n from 1 to 8 (isomorphic hosts, like K_2,3 and K_3,2, are only run once).
+    max_vertices cuts the patterns down, so ["K_1..8,1..8"] with max_vertices=9 is every K_m,n with m+n <= 9.
+
+        python cli.py sweep "C_4..12" "K_1..8,1..8" --max-vertices 9
+"""
+import csv
+import itertools as it
+import os
+import re
+import time
+import DownArrowRamseySetGenerator as generator
+import graphcache
+import instrument
+import packedstore
+from packedstore import PackedStore
+from workerpool import WorkerPool
+
+SUMMARY_PATH = os.path.join("Graphs", "Summary.csv")
+COLUMNS = ["host", "vertices", "edges", "classes", "down-arrow set", "ideals", "seconds", "status", "ideal graphs"]
+
+_RANGE = re.compile(r"(\d+)\.\.(\d+)")
+
+def expand(pattern):
+    """
+        Every host name that pattern stands for, in order.
+    """
+    pieces = _RANGE.split(pattern)
+    literals = pieces[0::3]
+    ranges = [range(int(start), int(stop)+1) for start,stop in zip(pieces[1::3], pieces[2::3])]
+    return ["".join(literal+number for literal,number in it.zip_longest(literals, map(str, numbers), fillvalue="")) for numbers in it.product(*ranges)]
+
+def host_graphs(patterns, max_vertices=None):
+    """
+        (host name, host graph) for every host of the patterns, one per isomorphism class, fewest edges (then vertices) first.
+        Names that _get_graph_from_name does not know come out with None for a graph, at the end.
+    """
+    hosts = []
+    unknown = []
+    forms = set()
+    for pattern in patterns:
+        for host_name in expand(pattern):
+            try:
+                host = generator._get_graph_from_name(host_name)
+            except ValueError:
+                host = None
+            if host == None:
+                unknown.append((host_name, None))
+                continue
+            if max_vertices != None and host.number_of_nodes() > max_vertices:
+                continue
+            form = (host.number_of_nodes(), graphcache.form(host))
+            if form not in forms:
+                forms.add(form)
+                hosts.append((host_name, host))
+    hosts.sort(key=lambda item:(item[1].number_of_edges(), item[1].number_of_nodes()))
+    return hosts+unknown
+
+def _graph_path(host_name, suffix):
+    return os.path.join("Graphs", host_name, f"{host_name} {suffix}")
+
+def is_done(host_name):
+    return os.path.exists(_graph_path(host_name, "down-arrow ramsey set ideals.g6"))
+
+def _lines(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as input_file:
+        return [line.strip().decode() for line in input_file if line.strip()]
+
+def summary_row(host_name, host=None, status="", seconds=None):
+    """
+        What is on disk for one host, as a row of COLUMNS.
+    """
+    classes = None
+    store_path = os.path.join("Graphs", host_name, "Subgraphs")
+    if packedstore.exists(store_path):
+        with PackedStore(store_path) as subgraphs:
+            classes = len(subgraphs)
+    down_arrow_set = _lines(_graph_path(host_name, "down-arrow ramsey set.g6"))
+    ideals = _lines(_graph_path(host_name, "down-arrow ramsey set ideals.g6"))
+    return {"host":host_name, "vertices":None if host == None else host.number_of_nodes(), "edges":None if host == None else host.number_of_edges(), "classes":classes, "down-arrow set":None if down_arrow_set == None else len(down_arrow_set), "ideals":None if ideals == None else len(ideals), "seconds":None if seconds == None else round(seconds, 3), "status":status, "ideal graphs":"" if ideals == None else " ".join(ideals)}
+
+def format_table(rows, columns=COLUMNS[:-1]):
+    cells = [[column for column in columns]]+[["" if row[column] == None else str(row[column]) for column in columns] for row in rows]
+    widths = [max(len(line[position]) for line in cells) for position in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(width) for cell,width in zip(line, widths)).rstrip() for line in cells)
+
+def write_summary(rows, path=SUMMARY_PATH):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", newline="") as output_file:
+        writer = csv.DictWriter(output_file, COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return
+
+def sweep(patterns, num_workers=None, chunksize=64, memory_budget=2**26, cache_path=graphcache.DEFAULT_PATH, max_vertices=None, draw=False, summary_path=SUMMARY_PATH, stream=True, budget=None):
+    """
+        Runs make_down_arrow_ramsey_set_ideals for every host of the patterns and returns the summary rows. A host that fails is marked "failed: ..." in the table and the sweep goes on.
+        With a budget (see make_down_arrow_ramsey_set_ideals), a host that runs out of it is marked "upper bound: n graphs", and the next sweep picks it up from its checkpoint.
+    """
+    rows = []
+    hosts = host_graphs(patterns, max_vertices)
+    with WorkerPool(num_workers, chunksize, memory_budget=memory_budget) as pool:
+        for host_name,host in instrument.progress(hosts, len(hosts), "sweep", interval=0):
+            started = time.perf_counter()
+            if host == None:
+                status = "failed: unknown host"
+            elif is_done(host_name):
+                status = "skipped"
+            else:
+                try:
+                    generator.make_down_arrow_ramsey_set_ideals(host_name, cache_path=cache_path, pool=pool, draw=draw, stream=stream, budget=budget)
+                    upper_bound = _lines(_graph_path(host_name, "down-arrow ramsey set upper bound.g6"))
+                    status = "made" if upper_bound == None else f"upper bound: {len(upper_bound)} graphs"
+                except Exception as error:
+                    status = f"failed: {error!r}"
+            rows.append(summary_row(host_name, host, status, time.perf_counter()-started))
+            instrument.event("host", **rows[-1])
+    if summary_path != None:
+        write_summary(rows, summary_path)
+    return rows
@@ -0,0 +1,72 @@
+"""
+    codec.py's graph6 encodings against networkx's, and its file names and line files against themselves.
+
+        python -m pytest -q test_codec.py
+"""
+import random
+import networkx as nx
+import numpy as np
+import pytest
+import codec
+
+SEED = 0
+SIZES = [0, 1, 2, 3, 5, 6, 7, 12, 62, 63, 70]
+
+def _random_graph(generator, number_of_vertices):
+    return nx.gnp_random_graph(number_of_vertices, generator.random(), seed=generator.randint(0, 2**31))
+
+def _graph6(graph):
+    return nx.to_graph6_bytes(graph, header=False).strip()
+
+def _rows(graph):
+    return [sum(1 << neighbour for neighbour in graph[vertex]) for vertex in range(graph.number_of_nodes())]
+
+@pytest.mark.parametrize("number_of_vertices", SIZES)
+def test_rows_and_masks_round_trip(number_of_vertices):
+    generator = random.Random(SEED)
+    for graph in range(5):
+        graph = _random_graph(generator, number_of_vertices)
+        graph6 = _graph6(graph)
+        assert codec.encode_rows(_rows(graph)) == graph6
+        assert codec.decode_rows(graph6) == _rows(graph)
+        assert codec.encode_mask(*reversed(codec.decode_mask(graph6))) == graph6
+        assert sorted(codec.edges(graph6)) == sorted(tuple(sorted(edge)) for edge in graph.edges())
+
+@pytest.mark.parametrize("number_of_vertices", SIZES)
+def test_matrices_round_trip(number_of_vertices):
+    generator = random.Random(SEED)
+    graphs = [_random_graph(generator, number_of_vertices) for graph in range(5)]
+    lines = [_graph6(graph) for graph in graphs]
+    matrices = codec.decode_matrices(lines)
+    assert matrices.shape == (5, number_of_vertices, number_of_vertices)
+    for matrix,graph in zip(matrices, graphs):
+        assert np.array_equal(matrix, nx.to_numpy_array(graph, nodelist=range(number_of_vertices), dtype=np.uint8))
+    assert codec.encode_matrices(matrices) == lines
+    assert codec.encode_matrix(codec.decode_matrix(lines[0])) == lines[0]
+
+def test_decode_matrices_needs_one_size():
+    with pytest.raises(ValueError):
+        codec.decode_matrices([_graph6(nx.complete_graph(3)), _graph6(nx.complete_graph(4))])
+
+def test_file_names_round_trip():
+    """
+        Every graph6 character, with "?", "\\", "|" and the upper case letters that file systems mangle among them.
+    """
+    generator = random.Random(SEED)
+    lines = [_graph6(_random_graph(generator, number_of_vertices)) for number_of_vertices in SIZES for graph in range(5)]
+    lines.append(bytes(range(63, 127)))
+    for graph6 in lines:
+        file_name = codec.to_file_name(graph6)
+        assert not set(file_name) & set("?\\|") and file_name == file_name.lower()
+        assert codec.from_file_name(file_name) == graph6
+
+def test_unescape_name():
+    for graph6 in [b"Bw", b"D\\w", bytes(range(63, 127))]:
+        assert codec.unescape_name(f"{graph6}") == graph6
+
+def test_lines_round_trip(tmp_path):
+    generator = random.Random(SEED)
+    lines = [_graph6(_random_graph(generator, number_of_vertices)) for number_of_vertices in SIZES]
+    codec.write_lines(tmp_path/"graphs.g6", lines)
+    assert codec.read_lines(tmp_path/"graphs.g6") == lines
+    assert [_graph6(graph) for graph in nx.read_graph6(tmp_path/"graphs.g6")] == lines
@@ -0,0 +1,71 @@
+"""
+    The bitset matcher against networkx's VF2 on random pairs of graphs (including empty graphs, isolated vertices and non-integer labels).
+
+        python -m pytest -q test_matcher.py
+"""
+import random
+import networkx as nx
+import matcher
+import codec
+from canonical import _adjacency_rows
+
+SEED = 0
+NUMBER_OF_PAIRS = 300
+
+def _random_graph(generator, max_vertices):
+    number_of_vertices = generator.randint(0, max_vertices)
+    graph = nx.gnp_random_graph(number_of_vertices, generator.random(), seed=generator.randint(0, 2**31))
+    return nx.relabel_nodes(graph, {vertex:f"v{vertex}" for vertex in graph.nodes()})
+
+def _random_pairs(number_of_pairs=NUMBER_OF_PAIRS, max_vertices=8, seed=SEED):
+    """
+        Half of the patterns are taken out of their target, so about half of the pairs embed.
+    """
+    generator = random.Random(seed)
+    for pair in range(number_of_pairs):
+        target = _random_graph(generator, max_vertices)
+        pattern = _random_graph(generator, max_vertices)
+        if generator.random() < 0.5 and target.number_of_edges():
+            pattern = nx.Graph(target.edge_subgraph(generator.sample(list(target.edges()), generator.randint(1, target.number_of_edges()))))
+        yield target, pattern
+
+def _vf2(target, pattern):
+    return nx.algorithms.isomorphism.GraphMatcher(target, pattern).subgraph_is_monomorphic()
+
+def test_is_monomorphic_matches_vf2():
+    for target,pattern in _random_pairs():
+        assert matcher.is_monomorphic(target, pattern) == _vf2(target, pattern), (nx.to_graph6_bytes(target), nx.to_graph6_bytes(pattern))
+
+def test_monomorphism_is_a_monomorphism():
+    for target,pattern in _random_pairs():
+        mapping = matcher.monomorphism(target, pattern)
+        assert (mapping != None) == _vf2(target, pattern)
+        if mapping != None:
+            assert len(set(mapping.values())) == pattern.number_of_nodes() == len(mapping)
+            inverse = {value:key for key,value in mapping.items()}
+            assert all(target.has_edge(inverse[source], inverse[target_vertex]) for source,target_vertex in pattern.edges())
+
+def test_monomorphisms_count_matches_vf2():
+    """
+        monomorphisms() leaves the isolated pattern vertices out, so each of its mappings stands for every way of placing them on the unused target vertices.
+    """
+    for target,pattern in _random_pairs(max_vertices=6):
+        if pattern.number_of_nodes() > 5:
+            continue
+        expected_count = sum(1 for mapping in nx.algorithms.isomorphism.GraphMatcher(target, pattern).subgraph_monomorphisms_iter())
+        isolated = sum(1 for vertex in pattern.nodes() if pattern.degree(vertex) == 0)
+        found = set(tuple(sorted((key,value) for key,value in mapping.items() if pattern.degree(value))) for mapping in matcher.monomorphisms(target, pattern))
+        placed = target.number_of_nodes()-(pattern.number_of_nodes()-isolated)
+        ways = 1
+        for position in range(isolated):
+            ways *= placed-position
+        assert len(found)*ways == expected_count
+
+def test_batch_functions_match_vf2():
+    generator = random.Random(SEED)
+    targets = [_random_graph(generator, 8) for target in range(30)]
+    patterns = [_random_graph(generator, 5) for pattern in range(30)]
+    for pattern in patterns[:5]:
+        assert matcher.pattern_in_targets(pattern, targets) == [_vf2(target, pattern) for target in targets]
+    for target in targets[:5]:
+        assert matcher.patterns_in_target([codec.encode_rows(_adjacency_rows(pattern)[1]) for pattern in patterns], target) == [_vf2(target, pattern) for pattern in patterns]
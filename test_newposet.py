@@ -0,0 +1,27 @@
+"""
+    newposet's down-arrow Ramsey sets against DownArrowRamseySetGenerator's.
+
+        python -m pytest -q test_newposet.py
+"""
+import networkx as nx
+import pytest
+import matplotlib
+matplotlib.use("Agg")
+import DownArrowRamseySetGenerator as generator
+import newposet
+from graphcache import form
+
+def _generator_set(host_name):
+    generator.make_down_arrow_ramsey_set_ideals(host_name, num_workers=1, cache_path=None, draw=False)
+    with open(f"Graphs/{host_name}/{host_name} down-arrow ramsey set.g6", "rb") as input_file:
+        return sorted(form(nx.from_graph6_bytes(line.strip())) for line in input_file if line.strip())
+
+def _newposet_set(host_name):
+    poset_graph = newposet.make_poset(generator._get_graph_from_name(host_name))
+    down_arrow_set_nodes = newposet.make_down_arrow_set(newposet.make_colorings(poset_graph), None, newposet.floor_row(poset_graph))
+    return sorted(form(nx.from_graph6_bytes(poset_graph.nodes[node]["graph6_bytes"])) for node in down_arrow_set_nodes)
+
+@pytest.mark.parametrize("host_name", ["K_3", "K_4", "C_5", "P_5", "K_2,3"])
+def test_newposet_matches_generator(host_name, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert _newposet_set(host_name) == _generator_set(host_name)
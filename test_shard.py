@@ -0,0 +1,56 @@
+"""
+    shard.LeaseQueue with several nodes claiming the same tasks at once.
+
+        python -m pytest -q test_shard.py
+"""
+import os
+import threading
+import time
+from shard import LeaseQueue
+
+def _stale_queue(directory, task="task"):
+    queue = LeaseQueue(str(directory), lease_seconds=60)
+    queue.put([task])
+    assert queue.claim("dead") == task
+    os.utime(queue._path("leases", task), (time.time()-120, time.time()-120))
+    return queue
+
+def test_one_node_takes_over_a_stale_lease(tmp_path):
+    for trial in range(50):
+        queue = _stale_queue(tmp_path/str(trial))
+        barrier = threading.Barrier(8)
+        claimed = []
+        def claimer(node):
+            barrier.wait()
+            claimed.append(queue.claim(node))
+        threads = [threading.Thread(target=claimer, args=(f"node{node}",)) for node in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert claimed.count("task") == 1
+
+def test_a_node_that_saw_the_stale_lease_late_loses(tmp_path, monkeypatch):
+    """
+        Both nodes see the lease stale before either takes it over, and the second only gets on with it once the first has its new lease.
+    """
+    queue = _stale_queue(tmp_path)
+    stale = os.stat(queue._path("leases", "task"))
+    assert queue.claim("first") == "task"
+    stat = os.stat
+    monkeypatch.setattr(os, "stat", lambda path, *arguments, **keywords:stale if path == queue._path("leases", "task") else stat(path, *arguments, **keywords))
+    assert queue.claim("second") == None
+    monkeypatch.undo()
+    with open(queue._path("leases", "task")) as lease_file:
+        assert lease_file.read() == "first"
+
+def test_fresh_lease_is_kept_and_first_finish_wins(tmp_path):
+    queue = LeaseQueue(str(tmp_path), lease_seconds=60)
+    queue.put(["task"])
+    assert queue.claim("first") == "task"
+    assert queue.claim("second") == None
+    assert queue.finish("task", {"node":"first"})
+    assert not queue.finish("task", {"node":"second"})
+    assert queue.result("task") == {"node":"first"}
+    assert queue.claim("second") == None
+    assert os.listdir(tmp_path/"leases") == []
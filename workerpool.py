@@ -0,0 +1,78 @@
+"""
+    One process pool for a whole run, instead of a fresh set of processes per stage.
+    The initializer runs once in each worker, so whatever it loads (the host graph, and anything cached after it) is there for every task that worker gets.
+    Work is handed out as contiguous chunks of job IDs, chunksize jobs at a time.
+    stream() is imap with a bounded number of tasks in flight, for stages that consume results as they come and may stop early.
+    memory_budget is how many bytes of working data each task may hold at once (None for no limit); the stages size their blocks from it.
+    When instrument.py is on, each task is counted against the stage that sent it, and closing the pool collects what the workers recorded.
+"""
+import collections
+import multiprocessing
+import instrument
+
+def default_workers():
+    return max(1, multiprocessing.cpu_count()-1)
+
+def _init_worker(settings, initializer, initargs):
+    instrument.configure(settings)
+    if initializer != None:
+        initializer(*initargs)
+    return
+
+class WorkerPool:
+    def __init__(self, num_workers=None, chunksize=64, initializer=None, initargs=(), memory_budget=None):
+        self.num_workers = default_workers() if num_workers == None else max(1, num_workers)
+        self.chunksize = max(1, chunksize)
+        self.memory_budget = memory_budget
+        self._pool = multiprocessing.Pool(self.num_workers, _init_worker, (instrument.settings(), initializer, initargs))
+
+    def chunks(self, jobs, chunksize=None):
+        """
+            jobs (a list or a range) as contiguous slices of chunksize jobs.
+        """
+        if chunksize == None:
+            chunksize = self.chunksize
+        return [jobs[start:start+chunksize] for start in range(0, len(jobs), chunksize)]
+
+    def imap(self, function, tasks):
+        """
+            Results come back in the order of tasks.
+        """
+        return self._pool.imap(instrument.task(function), tasks)
+
+    def stream(self, function, tasks, window=None):
+        """
+            Results in the order of tasks, like imap, but tasks (any iterable) are only taken and sent out while fewer than window of them (two per worker by default) are waiting to be read.
+            So a slow consumer holds back the producer instead of the results piling up, and a consumer that stops early leaves the rest of tasks unsent (what is in flight still runs, and is dropped).
+        """
+        if window == None:
+            window = 2*self.num_workers
+        function = instrument.task(function)
+        in_flight = collections.deque()
+        for task in tasks:
+            in_flight.append(self._pool.apply_async(function, (task,)))
+            if len(in_flight) >= window:
+                yield in_flight.popleft().get()
+        while in_flight:
+            yield in_flight.popleft().get()
+
+    def map(self, function, tasks):
+        return self._pool.map(instrument.task(function), tasks)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        instrument.collect()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        if exception[0] == None:
+            self.close()
+        else:
+            self._pool.terminate()
+            self._pool.join()
+            instrument.collect()
+        return False